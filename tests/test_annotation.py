@@ -0,0 +1,169 @@
+import unittest
+import tempfile
+import shutil
+import os
+import io
+import gzip
+import struct
+from yaps2.annotation import merge_annotations, merge_info, merge_meta, attach_genotypes, split_sites, chunk_bounds
+from yaps2.utils import tabix_record_count
+
+HEADER = [
+    '##fileformat=VCFv4.2',
+    '##INFO=<ID=AB,Number=1,Type=Float,Description="allele balance">',
+]
+SITES = [
+    ('1', '100', '.', 'A', 'G'),
+    ('1', '200', '.', 'C', 'T'),
+]
+
+LATER_SITES = [
+    ('1', '300', '.', 'G', 'A'),
+    ('1', '400', '.', 'T', 'C'),
+]
+
+def write_vcf(path, meta, infos, samples=None, sites=SITES):
+    columns = ['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO']
+    if samples:
+        columns += ['FORMAT'] + samples
+    with open(path, 'w') as f:
+        for line in meta:
+            f.write(line + '\n')
+        f.write('\t'.join(columns) + '\n')
+        for (site, info) in zip(sites, infos):
+            fields = list(site) + ['50', 'PASS', info]
+            if samples:
+                fields += ['GT'] + ['0/1'] * len(samples)
+            f.write('\t'.join(fields) + '\n')
+
+class TestAnnotation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.base = os.path.join(self.tmpdir, 'base.vcf')
+        write_vcf(self.base, HEADER, ['AB=0.5', 'AB=0.4'], samples=['s1', 's2'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def annotated(self, name, info_id, infos, sites=SITES):
+        path = os.path.join(self.tmpdir, name)
+        meta = HEADER + ['##INFO=<ID={},Number=1,Type=Float,Description="x">'.format(info_id)]
+        write_vcf(path, meta, infos, sites=sites)
+        return path
+
+    def test_merge_info(self):
+        self.assertEqual(merge_info('AB=0.5', ['AB=0.5;CADD=3', 'GNOMAD_AF=0.1']), 'AB=0.5;CADD=3;GNOMAD_AF=0.1')
+        self.assertEqual(merge_info('.', ['.']), '.')
+
+    def test_merge_meta(self):
+        merged = merge_meta(HEADER, [HEADER + ['##INFO=<ID=CADD,Number=1>']])
+        self.assertEqual(merged, HEADER + ['##INFO=<ID=CADD,Number=1>'])
+
+    def test_merge(self):
+        cadd = self.annotated('cadd.vcf', 'CADD', ['AB=0.5;CADD=3', 'AB=0.4;CADD=20'])
+        gnomad = self.annotated('gnomad.vcf', 'GNOMAD_AF', ['AB=0.5;GNOMAD_AF=0.1', 'AB=0.4'])
+        out = io.StringIO()
+        self.assertEqual(merge_annotations(self.base, [cadd, gnomad], out), 2)
+        lines = out.getvalue().splitlines()
+        self.assertIn('##INFO=<ID=CADD,Number=1,Type=Float,Description="x">', lines)
+        self.assertIn('##INFO=<ID=GNOMAD_AF,Number=1,Type=Float,Description="x">', lines)
+        records = [ l.split('\t') for l in lines if not l.startswith('#') ]
+        self.assertEqual(records[0][7], 'AB=0.5;CADD=3;GNOMAD_AF=0.1')
+        self.assertEqual(records[1][7], 'AB=0.4;CADD=20')
+        # the samples of the base are kept
+        self.assertEqual(records[0][8:], ['GT', '0/1', '0/1'])
+
+    def test_merge_filtered(self):
+        base = os.path.join(self.tmpdir, 'filtered.vcf')
+        with open(self.base) as f:
+            lines = f.readlines()
+        with open(base, 'w') as f:
+            f.writelines(lines[:-2] + [lines[-2].replace('PASS', 'MISSING'), lines[-1]])
+        # only the PASS record was annotated
+        path = os.path.join(self.tmpdir, 'pass.vcf')
+        with open(path, 'w') as f:
+            f.writelines(lines[:-2] + [lines[-1].replace('AB=0.4', 'AB=0.4;CADD=20')])
+        out = io.StringIO()
+        self.assertEqual(merge_annotations(base, [path], out, filters=set(['PASS'])), 2)
+        records = [ l.split('\t') for l in out.getvalue().splitlines() if not l.startswith('#') ]
+        self.assertEqual([ r[6:8] for r in records ], [['MISSING', 'AB=0.5'], ['PASS', 'AB=0.4;CADD=20']])
+        with self.assertRaises(ValueError):
+            merge_annotations(base, [path], io.StringIO())
+
+    def test_out_of_order(self):
+        path = os.path.join(self.tmpdir, 'reordered.vcf')
+        with open(self.base) as f:
+            lines = f.readlines()
+        with open(path, 'w') as f:
+            f.writelines(lines[:-2] + [lines[-1], lines[-2]])
+        with self.assertRaises(ValueError):
+            merge_annotations(self.base, [path], io.StringIO())
+
+    def sidecar(self, name, sites):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write('#CHROM\tPOS\tREF\tALT\tFORMAT\ts1\ts2\n')
+            for (chrom, pos, _, ref, alt) in sites:
+                f.write('\t'.join([chrom, pos, ref, alt, 'GT', '0/1', '1/1']) + '\n')
+        return path
+
+    def test_attach(self):
+        sites = self.annotated('sites.vcf', 'CADD', ['AB=0.5;CADD=3', 'AB=0.4;CADD=20'])
+        later = self.annotated('later.vcf', 'CADD', ['AB=0.5;CADD=1', 'AB=0.4;CADD=2'], sites=LATER_SITES)
+        out = io.StringIO()
+        pairs = [(sites, self.sidecar('gt1.tsv', SITES)), (later, self.sidecar('gt2.tsv', LATER_SITES))]
+        self.assertEqual(attach_genotypes(pairs, out), 4)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len([ l for l in lines if l.startswith('#CHROM') ]), 1)
+        self.assertTrue(lines[len(HEADER) + 1].endswith('\tFORMAT\ts1\ts2'))
+        records = [ l.split('\t') for l in lines if not l.startswith('#') ]
+        self.assertEqual(records[0][7:], ['AB=0.5;CADD=3', 'GT', '0/1', '1/1'])
+        self.assertEqual(len(records), 4)
+
+    def test_attach_mismatch(self):
+        sites = self.annotated('sites.vcf', 'CADD', ['AB=0.5', 'AB=0.4'])
+        with self.assertRaises(ValueError):
+            attach_genotypes([(sites, self.sidecar('gt.tsv', SITES[:1]))], io.StringIO())
+        with self.assertRaises(ValueError):
+            attach_genotypes([(sites, self.sidecar('gt.tsv', SITES[::-1]))], io.StringIO())
+
+    def test_attach_out_of_order(self):
+        sites = self.annotated('sites.vcf', 'CADD', ['AB=0.5', 'AB=0.4'])
+        later = self.annotated('later.vcf', 'CADD', ['AB=0.5', 'AB=0.4'], sites=LATER_SITES)
+        pairs = [(later, self.sidecar('gt2.tsv', LATER_SITES)), (sites, self.sidecar('gt1.tsv', SITES))]
+        with self.assertRaises(ValueError) as raised:
+            attach_genotypes(pairs, io.StringIO())
+        self.assertIn('in order', str(raised.exception))
+
+    def test_chunk_bounds(self):
+        self.assertEqual(chunk_bounds(10, 3), [(0, 3), (3, 6), (6, 10)])
+        self.assertEqual(chunk_bounds(1, 2), [(0, 0), (0, 1)])
+
+    def test_split_and_gather(self):
+        prefix = os.path.join(self.tmpdir, 'chunk')
+        chunks = split_sites(self.base, 2, prefix)
+        self.assertEqual(chunks, [prefix + '.1.vcf', prefix + '.2.vcf'])
+        with open(chunks[1]) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[-1].split('\t'), list(SITES[1]) + ['50', 'PASS', 'AB=0.4'])
+        # the annotated chunks are read in order as a single VCF
+        out = io.StringIO()
+        self.assertEqual(merge_annotations(self.base, [chunks], out), 2)
+        with self.assertRaises(ValueError):
+            merge_annotations(self.base, [chunks[::-1]], io.StringIO())
+
+    def test_tabix_record_count(self):
+        vcf = os.path.join(self.tmpdir, 'in.vcf.gz')
+        self.assertIsNone(tabix_record_count(vcf))
+        index = struct.pack('<4siiiiiiii', b'TBI\x01', 1, 2, 1, 2, 0, ord('#'), 0, 2) + b'1\x00'
+        index += struct.pack('<i', 2)
+        index += struct.pack('<Ii', 4681, 1) + struct.pack('<QQ', 0, 100)
+        index += struct.pack('<Ii', 37450, 2) + struct.pack('<QQQQ', 0, 100, 42, 0)
+        index += struct.pack('<i', 1) + struct.pack('<Q', 0)
+        with gzip.open(vcf + '.tbi', 'wb') as f:
+            f.write(index)
+        self.assertEqual(tabix_record_count(vcf), 42)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import tempfile
+import shutil
+import os
+import json
+from yaps2.bundle import Bundler, BundledTask, read_manifest, pending_members, run_members
+from yaps2.lsf import index_spec
+from yaps2 import telemetry
+
+class FakeWorkflow(object):
+    def __init__(self):
+        self.tasks = []
+
+    def add_task(self, **task):
+        self.tasks.append(task)
+        return task
+
+def echo(in_value, out_file):
+    return 'echo {} > {}'.format(in_value, out_file)
+
+class TestBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.workflow = FakeWorkflow()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def task_dicts(self, n, group='a'):
+        return [
+            {
+                'func' : echo,
+                'params' : {
+                    'in_value' : i,
+                    'out_file' : os.path.join(self.tmpdir, 'out', str(i), 'value.txt'),
+                },
+                'stage_name' : '1-echo',
+                'uid' : '{}:{}'.format(group, i),
+                'drm_params' : '{}',
+            }
+            for i in range(n)
+        ]
+
+    def test_unbundled(self):
+        bundler = Bundler(self.workflow, self.tmpdir, 'test')
+        tasks = bundler.add_tasks('1-echo', self.task_dicts(3), {'M' : 1000})
+        self.assertEqual(len(self.workflow.tasks), 3)
+        self.assertEqual([ t['uid'] for t in tasks ], ['a:0', 'a:1', 'a:2'])
+
+    def test_bundled(self):
+        bundler = Bundler(self.workflow, self.tmpdir, 'test', size=2, parallel=2)
+        tasks = self.task_dicts(3) + self.task_dicts(1, group='b')
+        members = bundler.add_tasks('1-echo', tasks, {'M' : 1000000}, key=lambda t: t['uid'][0])
+        self.assertEqual([ t['uid'] for t in self.workflow.tasks ], ['a:0001', 'a:0002', 'b:0001'])
+        self.assertTrue(all(isinstance(m, BundledTask) for m in members))
+        self.assertIs(members[1].task, members[0].task)
+        self.assertEqual(
+            json.loads(self.workflow.tasks[0]['drm_params']),
+            {'M' : 2000000, 'R' : 'rusage[mem=2000] span[hosts=1]', 'n' : 2}
+        )
+
+        manifest = read_manifest(self.workflow.tasks[0]['params']['in_manifest'])
+        self.assertEqual(len(pending_members(manifest)), 2)
+        self.assertTrue(run_members([ m for i, m in pending_members(manifest) ], parallel=2))
+        self.assertEqual(pending_members(manifest), [])
+        with open(os.path.join(self.tmpdir, 'out', '1', 'value.txt')) as f:
+            self.assertEqual(f.read(), '1\n')
+
+        # a member whose command changed has to run again
+        manifest['members'][0]['cmd'] = 'false'
+        self.assertEqual([ i for i, m in pending_members(manifest) ], [1])
+        self.assertFalse(run_members([manifest['members'][0]]))
+
+    def test_member_telemetry(self):
+        db = os.path.join(self.tmpdir, 'jobs.db')
+        bundler = Bundler(self.workflow, self.tmpdir, 'test', size=0, telemetry_db=db)
+        bundler.add_tasks('1-echo', self.task_dicts(2), {'M' : 1000000})
+        manifest = read_manifest(self.workflow.tasks[0]['params']['in_manifest'])
+        self.assertTrue(run_members(manifest['members'], telemetry=manifest['telemetry']))
+        with open(os.path.join(self.tmpdir, 'out', '1', 'value.txt')) as f:
+            self.assertEqual(f.read(), '1\n')
+        # a row per member, as for standalone tasks
+        rows = telemetry.fetch(db)
+        self.assertEqual(sorted((r['workflow'], r['stage'], r['uid'], r['attempt']) for r in rows), [
+            ('test', '1-echo', 'a:0', 1),
+            ('test', '1-echo', 'a:1', 1),
+        ])
+
+        # a rerun is the next attempt
+        manifest['members'][0]['cmd'] = 'true'
+        self.assertTrue(run_members(manifest['members'][:1], telemetry=manifest['telemetry']))
+        self.assertEqual(sorted(r['attempt'] for r in telemetry.fetch(db) if r['uid'] == 'a:0'), [1, 2])
+
+    def test_index_spec(self):
+        self.assertEqual(index_spec([7, 1, 2, 3, 9, 10]), '1-3,7,9-10')
+        self.assertEqual(index_spec([4]), '4')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import tempfile
+import shutil
+import random
+import os
+
+try:
+    from cosmos.api import TaskStatus
+    from yaps2.drm_lsf import BatchedJobManager
+    from yaps2.pipelines.b38 import submit_priority, lsf_user_priority, exec_speedseq_lsf_params
+except ImportError:
+    TaskStatus = None
+
+class FakeStage(object):
+    def __init__(self, name):
+        self.name = name
+
+class FakeLog(object):
+    def info(self, msg):
+        pass
+
+    def error(self, msg):
+        pass
+
+class FakeTask(object):
+    def __init__(self, tmpdir, uid, input_bytes):
+        self.stage = FakeStage('speedseq-realign')
+        self.uid = uid
+        self.drm = 'lsf'
+        self.params = {'sample_id' : uid, 'input_bytes' : input_bytes}
+        self.log = FakeLog()
+        self.output_command_script_path = os.path.join(tmpdir, '{}.sh'.format(uid))
+        self.output_stdout_path = os.path.join(tmpdir, '{}.out'.format(uid))
+        self.output_stderr_path = os.path.join(tmpdir, '{}.err'.format(uid))
+
+    def cmd_fxn(self, sample_id, input_bytes):
+        return 'speedseq realign {}'.format(sample_id)
+
+class RecordingDRM(object):
+    def __init__(self):
+        self.submitted = []
+
+    def submit_jobs(self, tasks):
+        self.submitted.extend(t.uid for t in tasks)
+        return [ str(i) for i in range(len(tasks)) ]
+
+@unittest.skipIf(TaskStatus is None, 'cosmos is not installed')
+class TestBatchedJobManager(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_largest_first(self):
+        sizes = {'NA12878' : 120e9, 'NA12891' : 30e9, 'NA12892' : 75e9, 'HG00096' : 5e9}
+        tasks = [ FakeTask(self.tmpdir, uid, size) for (uid, size) in sizes.items() ]
+        random.Random(42).shuffle(tasks)
+
+        manager = BatchedJobManager(
+            get_submit_args=lambda task: '',
+            log_out_dir_func=lambda task: self.tmpdir,
+            priority=submit_priority,
+        )
+        drm = RecordingDRM()
+        manager.drms['lsf'] = drm
+        manager.run_tasks(tasks)
+
+        self.assertEqual(drm.submitted, ['NA12878', 'NA12892', 'NA12891', 'HG00096'])
+        self.assertEqual(set(t.status for t in tasks), set([TaskStatus.submitted]))
+
+@unittest.skipIf(TaskStatus is None, 'cosmos is not installed')
+class TestUserPriority(unittest.TestCase):
+
+    def test_lsf_user_priority(self):
+        self.assertEqual(lsf_user_priority(0), 1)
+        self.assertEqual(lsf_user_priority(30e9), 15)
+        self.assertEqual(lsf_user_priority(120e9), 60)
+        self.assertEqual(lsf_user_priority(1e12), 100)
+
+    def test_exec_speedseq_lsf_params(self):
+        small = exec_speedseq_lsf_params('user@genome.wustl.edu', '/ccdg/realign', 30e9)
+        large = exec_speedseq_lsf_params('user@genome.wustl.edu', '/ccdg/realign', 120e9)
+        self.assertLess(small['sp'], large['sp'])
+        self.assertNotIn('sp', exec_speedseq_lsf_params('user@genome.wustl.edu', '/ccdg/realign'))
@@ -0,0 +1,60 @@
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+from yaps2.genotypes import BedWriter
+from yaps2.eigenstrat import write_eigenstrat, geno_lines, ind_label
+
+class TestEigenstrat(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        fam = [
+            ['S1', 'S1', '0', '0', '1', '-9'],
+            ['S2', 'S2', '0', '0', '2', '2'],
+            ['S3', 'S3', '0', '0', '0', '-9'],
+        ]
+        self.prefixes = []
+        for (chrom, gts) in (('1', [[0, 1, 2], [-1, 2, 0]]), ('2', [[1, 1, -1]])):
+            prefix = os.path.join(self.tmpdir, 'c{}'.format(chrom))
+            bim = [ [chrom, '{}-{}'.format(chrom, i), '0', str(100 * (i + 1)), 'A', 'G']
+                    for i in range(len(gts)) ]
+            writer = BedWriter(prefix, fam)
+            writer.write(np.array(gts, dtype=np.int8), bim)
+            writer.close()
+            self.prefixes.append(prefix)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read().splitlines()
+
+    def test_geno_lines(self):
+        gts = np.array([[0, 1, 2, -1]], dtype=np.int8)
+        self.assertEqual(geno_lines(gts), b'0129\n')
+
+    def test_ind_label(self):
+        self.assertEqual(ind_label('-9'), 'Control')
+        self.assertEqual(ind_label('1'), 'Control')
+        self.assertEqual(ind_label('2'), 'Case')
+
+    def test_write(self):
+        out = os.path.join(self.tmpdir, 'merged', 'merged.eigenstrat')
+        write_eigenstrat(self.prefixes, out)
+        self.assertEqual(self.read(out + '.geno'), ['012', '920', '119'])
+        self.assertEqual(self.read(out + '.snp'), [
+            '1-0\t1\t0.0\t100\tG\tA',
+            '1-1\t1\t0.0\t200\tG\tA',
+            '2-0\t2\t0.0\t100\tG\tA',
+        ])
+        self.assertEqual(self.read(out + '.indiv'), [
+            'S1\tM\tControl',
+            'S2\tF\tCase',
+            'S3\tU\tControl',
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
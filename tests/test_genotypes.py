@@ -0,0 +1,56 @@
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+from yaps2.genotypes import BedFile, BedWriter, encode, decode
+
+class TestGenotypes(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.tmpdir, 'test')
+        self.genotypes = np.array([
+            [0, 1, 2, -1, 0],
+            [2, 2, 1, 0, -1],
+            [-1, 0, 0, 1, 2],
+        ], dtype=np.int8)
+        self.fam = [ ['F{}'.format(i), 'S{}'.format(i), '0', '0', '0', '-9'] for i in range(5) ]
+        self.bim = [ ['1', 'v{}'.format(i), '0', str(i + 1), 'A', 'C'] for i in range(3) ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_encoding(self):
+        packed = encode(self.genotypes)
+        self.assertEqual(packed.shape, (3, 2))
+        # samples 1-4 of variant 1: 00, 10, 11, 01 from the low bits up
+        self.assertEqual(packed[0, 0], 0b01111000)
+        self.assertEqual(decode(packed, 5).tolist(), self.genotypes.tolist())
+
+    def test_bed_files(self):
+        writer = BedWriter(self.prefix, self.fam)
+        writer.write(self.genotypes[:2], self.bim[:2])
+        writer.write(self.genotypes[2:], self.bim[2:])
+        writer.close()
+
+        bed = BedFile(self.prefix)
+        self.assertEqual(bed.n_samples, 5)
+        self.assertEqual(bed.n_variants, 3)
+        self.assertEqual(bed.samples, ['S0', 'S1', 'S2', 'S3', 'S4'])
+        self.assertEqual(bed.variant_ids, ['v0', 'v1', 'v2'])
+        self.assertEqual(bed.genotypes(slice(0, 3)).tolist(), self.genotypes.tolist())
+        self.assertEqual(bed.genotypes(np.array([2, 0])).tolist(),
+                         self.genotypes[[2, 0]].tolist())
+
+    def test_truncated_bed(self):
+        writer = BedWriter(self.prefix, self.fam)
+        writer.write(self.genotypes, self.bim)
+        writer.close()
+        with open('.'.join([self.prefix, 'bim']), 'a') as f:
+            f.write("1\tv3\t0\t4\tA\tC\n")
+        with self.assertRaises(ValueError):
+            BedFile(self.prefix)
+
+if __name__ == '__main__':
+    unittest.main()
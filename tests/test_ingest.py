@@ -0,0 +1,61 @@
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+from yaps2.ingest import ingest_vcf, GenotypeStore
+
+VCF = """##fileformat=VCFv4.1
+##contig=<ID=2,length=1000>
+##FILTER=<ID=LowQual,Description="Low quality">
+##INFO=<ID=AC,Number=A,Type=Integer,Description="Allele count">
+##INFO=<ID=VQSLOD,Number=1,Type=Float,Description="VQSLOD">
+##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">
+#CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO	FORMAT	S1	S2	S3
+2	10	.	A	C	50	PASS	AC=3;VQSLOD=4.5	GT	0/1	1/1	0/0
+2	20	rs1	G	T,C	50	LowQual	AC=1,1	GT	./.	0/1	0/2
+2	30	.	T	TA	50	.	VQSLOD=-1.25	GT	0/0	0/0	1/1
+2	40	.	C	G	50	LowQual	AC=1	GT	./.	0/1	0/0
+"""
+
+class TestIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.vcf = os.path.join(self.tmpdir, 'c2.vcf')
+        with open(self.vcf, 'w') as f:
+            f.write(VCF)
+        self.store_dir = os.path.join(self.tmpdir, 'store')
+        ingest_vcf(self.vcf, '2', self.store_dir, block_size=2)
+        self.store = GenotypeStore(self.store_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_genotypes(self):
+        self.assertEqual(self.store.chroms, ['2'])
+        bed = self.store.genotypes('2')
+        self.assertEqual(bed.samples, ['S1', 'S2', 'S3'])
+        # the multi-allelic rs1 is skipped
+        self.assertEqual(bed.variant_ids, ['2-10-A-C', '2-30-T-TA', '2-40-C-G'])
+        self.assertEqual(bed.genotypes(slice(None)).tolist(), [
+            [1, 2, 0],
+            [0, 0, 2],
+            [-1, 1, 0],
+        ])
+
+    def test_sites(self):
+        sites = self.store.sites('2')
+        self.assertEqual(sites['pos'].tolist(), [10, 30, 40])
+        self.assertEqual(sites['ac'].tolist(), [3, 2, 1])
+        self.assertEqual([ sites['filters'][c] for c in sites['filter'] ], ['PASS', 'PASS', 'LowQual'])
+        self.assertEqual(sites['vqslod'][[0, 1]].tolist(), [4.5, -1.25])
+        self.assertTrue(np.isnan(sites['vqslod'][2]))
+
+    def test_sample_indices(self):
+        self.assertEqual(self.store.sample_indices('2', ['S3', 'S1']).tolist(), [2, 0])
+        with self.assertRaises(ValueError):
+            self.store.sample_indices('2', ['S4'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+from yaps2.genotypes import BedFile, BedWriter
+from yaps2.ldprune import r2_band, prune, ld_prune, SMALL_EPSILON
+
+def reference_prune(genotypes, maf, window, step, threshold):
+    # a direct transcription of plink's --indep-pairwise on the full r^2 matrix
+    r2 = np.corrcoef(genotypes.astype(np.float64)) ** 2
+    n = len(genotypes)
+    pruned = [False] * n
+    start = 0
+    while True:
+        end = min(start + window, n)
+        for i in range(start, end):
+            for j in range(i + 1, end):
+                if pruned[i]:
+                    break
+                if pruned[j] or not r2[i, j] > threshold:
+                    continue
+                if maf[i] < (1 - SMALL_EPSILON) * maf[j]:
+                    pruned[i] = True
+                else:
+                    pruned[j] = True
+        if end == n:
+            return pruned
+        start += step
+
+class TestLDPrune(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.tmpdir, 'cohort')
+        rng = np.random.RandomState(7)
+        n_samples, n_variants = 120, 300
+        genotypes = []
+        for start in range(0, n_variants, 20):
+            founder = rng.randint(0, 2, size=2 * n_samples)
+            for i in range(20):
+                flip = rng.random_sample(2 * n_samples) < rng.uniform(0, 0.4)
+                haplotypes = np.where(flip, 1 - founder, founder)
+                genotypes.append(haplotypes[:n_samples] + haplotypes[n_samples:])
+        self.genotypes = np.array(genotypes, dtype=np.int8)
+        # a variant that fails --geno 0, and a monomorphic one that fails --maf
+        self.genotypes[10, 0] = -1
+        self.genotypes[11] = 0
+
+        fam = [ ['S{}'.format(i), 'S{}'.format(i), '0', '0', '0', '-9'] for i in range(n_samples) ]
+        self.bim = [ ['1', 'v{}'.format(i), '0', str(i + 1), 'A', 'C'] for i in range(n_variants) ]
+        writer = BedWriter(self.prefix, fam)
+        writer.write(self.genotypes, self.bim)
+        writer.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_band(self):
+        bed = BedFile(self.prefix)
+        variants = np.array([ i for i in range(bed.n_variants) if i not in (10, 11) ])
+        band = r2_band(bed, variants, 50, threads=2)
+        r2 = np.corrcoef(self.genotypes[variants].astype(np.float64)) ** 2
+        for i in (0, 63, 120, len(variants) - 2):
+            for d in range(1, 50):
+                if i + d < len(variants):
+                    self.assertAlmostEqual(band[i, d - 1], r2[i, i + d], places=4)
+
+    def test_matches_reference(self):
+        out = os.path.join(self.tmpdir, 'pruned')
+        kept = ld_prune(self.prefix, out)
+
+        passing = np.array([ i for i in range(len(self.genotypes)) if i not in (10, 11) ])
+        genotypes = self.genotypes[passing]
+        freq = genotypes.mean(axis=1) / 2
+        maf = np.minimum(freq, 1 - freq)
+        pruned = reference_prune(genotypes, maf, 50, 5, 0.3)
+        expected = [ i for (i, p) in zip(passing, pruned) if not p ]
+        self.assertEqual(list(kept), expected)
+        self.assertTrue(0 < len(kept) < len(passing))
+
+        with open('.'.join([out, 'prune.in'])) as f:
+            self.assertEqual(f.read().split(), [ 'v{}'.format(i) for i in expected ])
+        with open('.'.join([out, 'prune.out'])) as f:
+            pruned_ids = f.read().split()
+        self.assertEqual(len(pruned_ids) + len(expected), len(passing))
+        self.assertNotIn('v10', pruned_ids)
+
+        extracted = BedFile(out)
+        self.assertEqual(extracted.variant_ids, [ 'v{}'.format(i) for i in expected ])
+        self.assertEqual(extracted.genotypes(slice(0, None)).tolist(),
+                         self.genotypes[expected].tolist())
+
+    def test_lower_maf_pruned(self):
+        band = np.array([[0.9], [0.0]], dtype=np.float32)
+        self.assertEqual(prune(band, np.array([0.2, 0.3]), 2, 1, 0.3).tolist(), [True, False])
+        self.assertEqual(prune(band, np.array([0.3, 0.3]), 2, 1, 0.3).tolist(), [False, True])
+
+if __name__ == '__main__':
+    unittest.main()
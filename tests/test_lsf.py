@@ -0,0 +1,123 @@
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+from yaps2.lsf import set_memory, set_tmp, set_cores, prefer_hosts, autosize, parse_bjobs_json, bsub_many, BjobsPoller
+
+class TestLSFParams(unittest.TestCase):
+
+    def setUp(self):
+        self.params = {
+            'u' : 'user@genome.wustl.edu',
+            'N' : None,
+            'q' : 'ccdg',
+            'M' : 16000000,
+            'R' : 'select[mem>16000 && ncpus>8] rusage[mem=16000]',
+        }
+
+    def test_set_memory(self):
+        params = set_memory(self.params, 2500)
+        self.assertEqual(params['M'], 2500000)
+        self.assertEqual(params['R'], 'select[mem>2500 && ncpus>8] rusage[mem=2500]')
+        self.assertEqual(self.params['M'], 16000000)
+
+    def test_set_memory_without_rusage(self):
+        params = set_memory({'M' : 1000}, 2000)
+        self.assertEqual(params['R'], 'rusage[mem=2000]')
+
+    def test_set_tmp(self):
+        params = set_tmp(self.params, 90000)
+        self.assertEqual(params['R'], 'select[mem>16000 && ncpus>8 && tmp>90000] rusage[mem=16000,tmp=90000]')
+        params = set_tmp(set_memory(params, 2500), 100)
+        self.assertEqual(params['R'], 'select[mem>2500 && ncpus>8 && tmp>100] rusage[mem=2500,tmp=100]')
+        self.assertEqual(set_tmp({}, 100)['R'], 'select[tmp>100] rusage[tmp=100]')
+
+    def test_prefer_hosts(self):
+        params = prefer_hosts(self.params, ['blade1', 'blade2'])
+        self.assertEqual(params['m'], "'blade1+1 blade2+1 others'")
+        self.assertNotIn('m', prefer_hosts(self.params, []))
+
+    def test_set_cores(self):
+        params = set_cores(self.params, 4)
+        self.assertEqual(params['n'], 4)
+        self.assertTrue(params['R'].endswith('span[hosts=1]'))
+
+    def test_autosize_without_history(self):
+        self.assertEqual(autosize(self.params, []), self.params)
+
+    def test_autosize(self):
+        history = [
+            {'max_rss_kb' : 2048000, 'cpu_time' : 90, 'wall_time' : 100, 'input_bytes' : 1000},
+            {'max_rss_kb' : 1024000, 'cpu_time' : 50, 'wall_time' : 100, 'input_bytes' : 100},
+        ]
+        params = autosize(self.params, history, margin=1.25)
+        self.assertEqual(params['M'], 2600000)
+        self.assertNotIn('n', params)
+
+        # a larger input scales the estimate up, never down
+        params = autosize(self.params, history, input_bytes=2000, margin=1.25)
+        self.assertEqual(params['M'], 25600000)
+        params = autosize(self.params, history, input_bytes=10, margin=1.25)
+        self.assertEqual(params['M'], 2600000)
+
+    def test_autosize_cores(self):
+        history = [ {'max_rss_kb' : 1024000, 'cpu_time' : 390, 'wall_time' : 100} ]
+        params = autosize(self.params, history)
+        self.assertEqual(params['n'], 4)
+
+class TestBatchedLSF(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.environ = dict(os.environ)
+        fake = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', 'yaps2', 'resources', 'lsf', 'fake-lsf.py')
+        for name in ('bsub', 'bjobs', 'bkill'):
+            os.environ['YAPS2_{}'.format(name.upper())] = ' '.join([sys.executable, fake, name])
+        os.environ['FAKE_LSF_DIR'] = self.tmpdir
+        os.environ['FAKE_LSF_RUN_TIME'] = '0'
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse_bjobs_json(self):
+        text = ('{"COMMAND":"bjobs","JOBS":3,"RECORDS":['
+                '{"JOBID":"1","STAT":"DONE","EXIT_CODE":""},'
+                '{"JOBID":"2","STAT":"EXIT","EXIT_CODE":"130"},'
+                '{"ERROR":"Job <3> is not found"}]}')
+        jobs = parse_bjobs_json(text)
+        self.assertEqual(jobs['1'], {'stat' : 'DONE', 'exit_code' : None})
+        self.assertEqual(jobs['2'], {'stat' : 'EXIT', 'exit_code' : 130})
+        self.assertEqual(len(jobs), 2)
+
+    def test_submit_and_poll(self):
+        os.environ['FAKE_LSF_FAIL_RATE'] = '1'
+        job_ids = bsub_many([ ['-q', 'test', 'true'] for i in range(4) ], workers=2)
+        self.assertEqual(sorted(job_ids), [1, 2, 3, 4])
+
+        now = [0]
+        poller = BjobsPoller(min_interval=5, max_interval=20, backoff=2, clock=lambda: now[0])
+        for jobid in job_ids:
+            poller.watch(jobid)
+        self.assertTrue(poller.poll())
+        self.assertEqual(poller.calls, 1)
+        self.assertTrue(all(poller.is_finished(j) for j in job_ids))
+        self.assertEqual(poller.status(1), {'stat' : 'EXIT', 'exit_code' : 1})
+
+        # nothing is due until the interval passes, then it backs off
+        self.assertFalse(poller.poll())
+        self.assertEqual(poller.calls, 1)
+        now[0] = 5
+        self.assertFalse(poller.poll())
+        self.assertEqual(poller.interval, 10)
+
+    def test_failed_submission(self):
+        os.environ['FAKE_LSF_ERROR_RATE'] = '1'
+        job_ids = bsub_many([ ['true'] ], retries=2, delay=0)
+        self.assertTrue(isinstance(job_ids[0], Exception))
+
+if __name__ == '__main__':
+    unittest.main()
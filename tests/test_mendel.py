@@ -0,0 +1,245 @@
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+from yaps2.mendel import (read_trios, trio_samples, trio_indices, informative_mask,
+                          mendel_error_mask, is_autosome, write_mie_table,
+                          allele_type, bin_selection, VqslodHistogram,
+                          read_tranche_bins, query_histograms,
+                          family_rows, store_counts, aggregate_counts,
+                          HOM_REF, HET, UNKNOWN, HOM_ALT)
+
+class TestTrios(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fam = os.path.join(self.tmpdir, 'trios.fam')
+        with open(self.fam, 'w') as f:
+            f.write("F1 K1 D1 M1 1 -9\n")
+            f.write("F1 D1 0 0 1 -9\n")
+            f.write("F2 K2 D2 0 2 -9\n")
+            f.write("F3 K3 D1 M3 2 -9\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_trios(self):
+        self.assertEqual(read_trios(self.fam), [
+            ('F1', 'K1', 'D1', 'M1'),
+            ('F3', 'K3', 'D1', 'M3'),
+        ])
+
+    def test_trio_indices(self):
+        trios = read_trios(self.fam)
+        samples = trio_samples(trios)
+        self.assertEqual(samples, ['K1', 'D1', 'M1', 'K3', 'M3'])
+        (child, dad, mom) = trio_indices(trios, samples)
+        self.assertEqual(list(child), [0, 3])
+        self.assertEqual(list(dad), [1, 1])
+        self.assertEqual(list(mom), [2, 4])
+
+    def test_missing_sample(self):
+        trios = read_trios(self.fam)
+        with self.assertRaises(ValueError):
+            trio_indices(trios, ['K1', 'D1', 'M1'])
+
+class TestInformative(unittest.TestCase):
+
+    def mask(self, kid, dad, mom):
+        gts = np.array([[kid, dad, mom]], dtype=np.int8)
+        child, father, mother = np.array([0]), np.array([1]), np.array([2])
+        return bool(informative_mask(gts, child, father, mother)[0, 0])
+
+    def test_rules(self):
+        # a de novo candidate against hom-ref parents
+        self.assertTrue(self.mask(HET, HOM_REF, HOM_REF))
+        # no alternate allele in the trio
+        self.assertFalse(self.mask(HOM_REF, HOM_REF, HOM_REF))
+        # two heterozygous parents can't be inconsistent with the child
+        self.assertFalse(self.mask(HOM_ALT, HET, HET))
+        self.assertTrue(self.mask(HET, HOM_ALT, HET))
+        self.assertTrue(self.mask(UNKNOWN, HOM_REF, HOM_ALT))
+        self.assertFalse(self.mask(HET, UNKNOWN, UNKNOWN))
+
+    def test_many_trios(self):
+        gts = np.array([
+            [HET, HOM_REF, HOM_REF, HOM_ALT],
+            [HOM_REF, HET, HET, HOM_ALT],
+        ], dtype=np.int8)
+        child, dad, mom = np.array([0, 3]), np.array([1, 1]), np.array([2, 2])
+        mask = informative_mask(gts, child, dad, mom)
+        self.assertEqual(mask.tolist(), [[True, True], [False, False]])
+
+class TestMendelErrors(unittest.TestCase):
+
+    def error(self, kid, dad, mom):
+        gts = np.array([[kid, dad, mom]], dtype=np.int8)
+        child, father, mother = np.array([0]), np.array([1]), np.array([2])
+        return bool(mendel_error_mask(gts, child, father, mother)[0, 0])
+
+    def test_errors(self):
+        self.assertTrue(self.error(HET, HOM_REF, HOM_REF))
+        self.assertTrue(self.error(HET, HOM_ALT, HOM_ALT))
+        self.assertTrue(self.error(HOM_REF, HOM_ALT, UNKNOWN))
+        self.assertTrue(self.error(HOM_REF, HET, HOM_ALT))
+        self.assertTrue(self.error(HOM_ALT, HOM_REF, HOM_REF))
+        self.assertTrue(self.error(HOM_ALT, UNKNOWN, HOM_REF))
+
+    def test_consistent(self):
+        self.assertFalse(self.error(HET, HOM_REF, HOM_ALT))
+        self.assertFalse(self.error(HET, HOM_REF, UNKNOWN))
+        self.assertFalse(self.error(HOM_ALT, HET, HET))
+        self.assertFalse(self.error(HOM_REF, HET, UNKNOWN))
+        self.assertFalse(self.error(UNKNOWN, HOM_REF, HOM_ALT))
+
+    def test_autosomes(self):
+        self.assertTrue(is_autosome('1'))
+        self.assertTrue(is_autosome('chr22'))
+        self.assertFalse(is_autosome('X'))
+        self.assertFalse(is_autosome('23'))
+        self.assertFalse(is_autosome('GL000192.1'))
+
+    def test_table(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            out = os.path.join(tmpdir, 'unfiltered.mie.var.txt')
+            trios = [('F2', 'K2', 'D2', 'M2'), ('F1', 'K1', 'D1', 'M1')]
+            write_mie_table(out, trios, {'variants' : [10, 20], 'mie' : [1, 2]})
+            with open(out) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines, ['Family\tVariants\tMIE', 'F1 20 2', 'F2 10 1'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+class FakeBlock(object):
+    def __init__(self, vqslod, snps, passed):
+        self.vqslod = np.array(vqslod, dtype=np.float64)
+        self.snps = np.array(snps, dtype=bool)
+        self.indels = ~self.snps
+        self.passed = np.array(passed, dtype=bool)
+        self.size = len(vqslod)
+
+class TestBins(unittest.TestCase):
+
+    def test_allele_type(self):
+        self.assertEqual(allele_type('A', 'C'), 'snps')
+        self.assertEqual(allele_type('AT', 'GT'), 'snps')
+        self.assertEqual(allele_type('AT', 'GC'), 'mnps')
+        self.assertEqual(allele_type('A', 'AT'), 'indels')
+        self.assertEqual(allele_type('A', '<DEL>'), 'other')
+
+    def test_intervals(self):
+        block = FakeBlock(
+            vqslod=[1.0, 2.0, 3.0, float('nan'), 2.0, 2.5],
+            snps=[True, True, True, True, False, True],
+            passed=[True, True, True, True, True, False],
+        )
+        bins = [
+            {'category' : 'snps', 'method' : 'tranche', 'label' : '1', 'min' : 1.0, 'max' : 2.0},
+            {'category' : 'snps', 'method' : 'percentile', 'label' : '10', 'min' : 1.0, 'max' : 2.0},
+            {'category' : 'indels', 'method' : 'tranche', 'label' : '1', 'min' : 1.0, 'max' : 3.0},
+        ]
+        selection = bin_selection(block, bins)
+        self.assertEqual(selection.tolist(), [
+            [True, False, False, False, False, False],
+            [False, True, False, False, False, False],
+            [False, False, False, False, True, False],
+        ])
+
+class TestHistogram(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def histogram(self):
+        block = FakeBlock(
+            vqslod=[1.0, 2.0, 3.0, float('nan'), 2.0, 99.0],
+            snps=[True, True, True, True, False, True],
+            passed=[True, True, True, True, True, True],
+        )
+        informative = np.ones((block.size, 2), dtype=bool)
+        errors = np.zeros((block.size, 2), dtype=bool)
+        errors[1, 0] = True
+        histogram = VqslodHistogram(['F1', 'F2'], start=-5, stop=5, step=0.01)
+        histogram.add(block, informative, errors)
+        return histogram
+
+    def test_intervals(self):
+        histogram = self.histogram()
+        variants = histogram.interval_counts('snps', 'variants', 1.0, 2.0, 'tranche')
+        self.assertEqual(variants.tolist(), [1, 1])
+        mie = histogram.interval_counts('snps', 'mie', 1.0, 2.0, 'percentile')
+        self.assertEqual(mie.tolist(), [1, 0])
+        # VQSLODs beyond the grid are counted at its end
+        variants = histogram.interval_counts('snps', 'variants', 2.5, 100000, 'tranche')
+        self.assertEqual(variants.tolist(), [2, 2])
+        indels = histogram.interval_counts('indels', 'variants', -10, 10, 'tranche')
+        self.assertEqual(indels.tolist(), [1, 1])
+
+    def test_save_and_merge(self):
+        path = os.path.join(self.tmpdir, 'histograms', '1.npz')
+        self.histogram().save(path)
+        histogram = VqslodHistogram.load(path)
+        histogram.merge(self.histogram())
+        self.assertEqual(histogram.families, ['F1', 'F2'])
+        mie = histogram.interval_counts('snps', 'mie', 1.0, 2.0, 'percentile')
+        self.assertEqual(mie.tolist(), [2, 0])
+
+    def test_query(self):
+        tranches = os.path.join(self.tmpdir, 'tranches.tsv')
+        with open(tranches, 'w') as f:
+            f.write("snps\t1\t2.0\nsnps\t2\t1.0\n")
+        bins = read_tranche_bins(tranches)
+        self.assertEqual([ (b['label'], b['min'], b['max']) for b in bins ],
+                         [('1', 2.0, 100000.0), ('2', 1.0, 2.0)])
+        rows = [ (b['label'], family, variants, mie)
+                 for (b, family, variants, mie) in query_histograms(self.histogram(), bins) ]
+        self.assertEqual(rows, [
+            ('1', 'F1', 3, 1), ('1', 'F2', 3, 0),
+            ('2', 'F1', 1, 0), ('2', 'F2', 1, 0),
+        ])
+
+class TestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmpdir, 'mie.db')
+        self.trios = [('F1', 'K1', 'D1', 'M1'), ('F2', 'K2', 'D2', 'M2')]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def rows(self, label, chrom, variants, mie):
+        b = {'category' : 'snps', 'method' : 'percentile', 'label' : label}
+        return family_rows(self.trios, b, chrom, {'variants' : variants, 'mie' : mie})
+
+    def test_aggregate(self):
+        self.assertTrue(store_counts(self.db, '1', self.rows('10', '1', [5, 6], [1, 0]) + self.rows('100', '1', [1, 1], [0, 0])))
+        self.assertTrue(store_counts(self.db, 'X', self.rows('10', 'X', [2, 2], [0, 1])))
+        # chromosomes 1-22 by default
+        self.assertEqual(aggregate_counts(self.db, 'snps', 'percentile'), [
+            ('10', 'F1', 5, 1), ('10', 'F2', 6, 0),
+            ('100', 'F1', 1, 0), ('100', 'F2', 1, 0),
+        ])
+        self.assertEqual(aggregate_counts(self.db, 'snps', 'percentile', ['1', 'X']), [
+            ('10', 'F1', 7, 1), ('10', 'F2', 8, 1),
+            ('100', 'F1', 1, 0), ('100', 'F2', 1, 0),
+        ])
+        self.assertEqual(aggregate_counts(self.db, 'snps', 'percentile', ['X']), [
+            ('10', 'F1', 2, 0), ('10', 'F2', 2, 1),
+        ])
+        self.assertEqual(aggregate_counts(self.db, 'indels', 'percentile'), [])
+
+    def test_rerun_replaces(self):
+        store_counts(self.db, '1', self.rows('10', '1', [5, 6], [1, 0]))
+        store_counts(self.db, '1', self.rows('10', '1', [3, 3], [0, 0]))
+        self.assertEqual(aggregate_counts(self.db, 'snps', 'percentile'), [
+            ('10', 'F1', 3, 0), ('10', 'F2', 3, 0),
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
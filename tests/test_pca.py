@@ -0,0 +1,171 @@
+import unittest
+import tempfile
+import shutil
+import os
+import struct
+import zlib
+import numpy as np
+from yaps2.genotypes import BedWriter
+from yaps2.mendel import HOM_REF, HET, UNKNOWN, HOM_ALT
+from yaps2.pca import (smartpca_normalize, GenotypeMatrix, randomized_pca, run_pca,
+                       PcaModel, site_regions, a2_dosage, project_samples)
+
+def write_bfile(prefix, genotypes, chrom):
+    (n_variants, n_samples) = genotypes.shape
+    fam = [ ['S{}'.format(i), 'S{}'.format(i), '0', '0', '0', '-9'] for i in range(n_samples) ]
+    bim = [ [chrom, '{}:{}'.format(chrom, i), '0', str(i + 1), 'A', 'C'] for i in range(n_variants) ]
+    writer = BedWriter(prefix, fam)
+    writer.write(genotypes, bim)
+    writer.close()
+
+BGZF_EOF = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+def bgzf(data):
+    # a single BGZF block (data must be under 64KB compressed), then the EOF block
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    header = struct.pack('<4BI2BH2BHH', 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord('B'), ord('C'), 2, len(deflated) + 25)
+    return header + deflated + struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data)) + BGZF_EOF
+
+def write_indexed_vcf(path, chrom, samples, positions, genotypes):
+    """A bgzipped VCF of A/C records on one chromosome (positions under
+    16384) and its .tbi; all in one block, so the virtual offsets are the
+    byte offsets of the text."""
+    calls = {0 : '0/0', 1 : '0/1', 2 : '1/1', -1 : './.'}
+    header = '##fileformat=VCFv4.2\n##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+    header += '##contig=<ID={}>\n'.format(chrom)
+    header += '\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT'] + samples) + '\n'
+    records = ''.join(
+        '\t'.join([chrom, str(pos), '.', 'A', 'C', '50', 'PASS', '.', 'GT'] + [ calls[g] for g in row ]) + '\n'
+        for (pos, row) in zip(positions, genotypes.tolist())
+    )
+    text = (header + records).encode('ascii')
+    with open(path, 'wb') as f:
+        f.write(bgzf(text))
+
+    (begin, end) = (len(header), len(text))
+    name = chrom.encode('ascii') + b'\x00'
+    index = b'TBI\x01' + struct.pack('<8i', 1, 2, 1, 2, 0, ord('#'), 0, len(name)) + name
+    # one bin (4681, the first 16kb) with one chunk, and the linear index
+    index += struct.pack('<iIiQQ', 1, 4681, 1, begin, end)
+    index += struct.pack('<iQ', 1, begin)
+    with open(path + '.tbi', 'wb') as f:
+        f.write(bgzf(index))
+
+def simulate(n_samples, n_variants, seed):
+    # two populations with diverged allele frequencies
+    rng = np.random.RandomState(seed)
+    base = rng.uniform(0.1, 0.9, size=n_variants)
+    freqs = np.clip(np.array([base, base + rng.normal(0, 0.15, size=n_variants)]), 0.01, 0.99)
+    population = np.arange(n_samples) % 2
+    p = freqs[population].T
+    genotypes = rng.binomial(2, p).astype(np.int8)
+    genotypes[rng.random_sample(genotypes.shape) < 0.01] = -1
+    return genotypes
+
+class TestNormalize(unittest.TestCase):
+
+    def test_smartpca_scaling(self):
+        gts = np.array([[0, 1, 2, -1]], dtype=np.int8)
+        x = smartpca_normalize(gts)
+        p = (1 + 3.0) / (2 + 6.0)
+        scale = np.sqrt(p * (1 - p))
+        np.testing.assert_allclose(x, [[-1 / scale, 0, 1 / scale, 0]])
+
+class TestRandomizedPca(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        genotypes = simulate(60, 900, seed=3)
+        self.prefixes = []
+        for (i, rows) in enumerate((slice(0, 500), slice(500, 900))):
+            prefix = os.path.join(self.tmpdir, 'c{}'.format(i + 1))
+            write_bfile(prefix, genotypes[rows], str(i + 1))
+            self.prefixes.append(prefix)
+        x = smartpca_normalize(genotypes)
+        xtx = x.T.dot(x)
+        # smartpca's scale: the eigenvalues of all 60 samples sum to 59
+        (values, vectors) = np.linalg.eigh(xtx * 59 / np.trace(xtx))
+        self.genotypes = genotypes
+        self.values = values[::-1]
+        self.vectors = vectors[:, ::-1]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_matches_exact(self):
+        matrix = GenotypeMatrix(self.prefixes, block_size=128)
+        self.assertEqual(matrix.n_variants, 900)
+        self.assertEqual(len(matrix.blocks), 8)
+        (values, vectors) = randomized_pca(matrix, k=3, threads=2)
+        np.testing.assert_allclose(values[0], self.values[0], rtol=1e-3)
+        np.testing.assert_allclose(np.abs(vectors[:, 0]), np.abs(self.vectors[:, 0]), atol=1e-2)
+        self.assertTrue(np.all(values[1:] <= values[0]))
+
+    def test_outputs(self):
+        out = os.path.join(self.tmpdir, 'pca', 'merged.eigenstrat')
+        run_pca(self.prefixes, out, k=2)
+        with open(out + '.pca.evec') as f:
+            lines = [ line.split() for line in f ]
+        self.assertEqual(lines[0][0], '#eigvals:')
+        self.assertEqual(len(lines[0]), 3)
+        self.assertEqual(len(lines), 61)
+        self.assertEqual(lines[1][0], 'S0')
+        self.assertEqual(lines[1][-1], 'Control')
+        with open(out + '.eval') as f:
+            self.assertEqual(len(f.read().split()), 2)
+
+    def test_project_cohort(self):
+        # projecting the PCA's own samples gives back their eigenvectors
+        out = os.path.join(self.tmpdir, 'merged.eigenstrat')
+        (values, vectors) = run_pca(self.prefixes, out, k=2)
+        model = PcaModel(out + '.pca.model.npz')
+        self.assertEqual(model.ids[500], '2:0')
+        rows = np.arange(900)
+        coordinates = model.project(rows, self.genotypes)
+        np.testing.assert_allclose(coordinates[:, 0], vectors[:, 0], atol=1e-2)
+        # the chromosomes add up
+        by_chrom = sum(model.project(model.rows(c), self.genotypes[model.rows(c)]) for c in ('1', '2'))
+        np.testing.assert_allclose(by_chrom, coordinates)
+
+    def test_project_chr_prefixed_vcf(self):
+        # the model has plink's '1', the (b38) VCF 'chr1'
+        out = os.path.join(self.tmpdir, 'merged.eigenstrat')
+        run_pca(self.prefixes, out, k=2)
+        vcf = os.path.join(self.tmpdir, 'new.chr1.vcf.gz')
+        samples = [ 'N{}'.format(i) for i in range(60) ]
+        # the first 100 variants of chromosome 1 (a single BGZF block), the others are missing
+        write_indexed_vcf(vcf, 'chr1', samples, range(1, 101), self.genotypes[:100])
+
+        (projected, coordinates) = project_samples(out + '.pca.model.npz', {'chr1' : vcf}, os.path.join(self.tmpdir, 'new'))
+        self.assertEqual(projected, samples)
+        model = PcaModel(out + '.pca.model.npz')
+        gts = np.full((500, 60), -1, dtype=np.int8)
+        gts[:100] = self.genotypes[:100]
+        np.testing.assert_allclose(coordinates, model.project(model.rows('1'), gts))
+
+    def test_different_samples(self):
+        write_bfile(os.path.join(self.tmpdir, 'other'), np.zeros((2, 3), dtype=np.int8), '3')
+        with self.assertRaises(ValueError):
+            GenotypeMatrix(self.prefixes + [os.path.join(self.tmpdir, 'other')])
+
+class FakeVariant(object):
+    def __init__(self, ref, alt, gt_types):
+        self.REF = ref
+        self.ALT = [alt]
+        self.gt_types = np.array(gt_types)
+
+class TestProjection(unittest.TestCase):
+
+    def test_site_regions(self):
+        self.assertEqual(site_regions([100, 5000, 20000, 20001], gap=10000),
+                         [[100, 5000], [20000, 20001]])
+
+    def test_a2_dosage(self):
+        variant = FakeVariant('A', 'C', [HOM_REF, HET, UNKNOWN, HOM_ALT])
+        self.assertEqual(a2_dosage(variant, 'A', 'C').tolist(), [0, 1, -1, 2])
+        self.assertEqual(a2_dosage(variant, 'C', 'A').tolist(), [2, 1, -1, 0])
+        self.assertIsNone(a2_dosage(variant, 'A', 'G'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from yaps2.pools import parse_pools, ResourcePools
+
+class FakeStage(object):
+    def __init__(self, name):
+        self.name = name
+
+class FakeTask(object):
+    def __init__(self, stage, uid):
+        self.stage = FakeStage(stage)
+        self.uid = uid
+
+STAGE_POOLS = {
+    'vep' : ['vep-cache-io', 'bigmem'],
+    'cadd' : ['bigmem'],
+}
+
+class TestPools(unittest.TestCase):
+
+    def setUp(self):
+        self.pools = ResourcePools({'vep-cache-io' : 2, 'bigmem' : 3}, lambda s: STAGE_POOLS.get(s, []))
+
+    def test_parse_pools(self):
+        self.assertEqual(parse_pools(['vep-cache-io:6', 'bigmem:10']), {'vep-cache-io' : 6, 'bigmem' : 10})
+        for spec in ('bigmem', 'bigmem:0', ':3', 'bigmem:x'):
+            with self.assertRaises(ValueError):
+                parse_pools([spec])
+
+    def test_admit(self):
+        vep = [ FakeTask('vep', str(i)) for i in range(3) ]
+        other = FakeTask('concat', '1')
+        (admitted, held) = self.pools.admit(vep + [other], [])
+        self.assertEqual([ t.uid for t in admitted if t.stage.name == 'vep' ], ['0', '1'])
+        self.assertIn(other, admitted)
+        self.assertEqual(held, [vep[2]])
+
+    def test_shared_pool(self):
+        running = [ FakeTask('vep', '0'), FakeTask('cadd', '0') ]
+        cadd = [ FakeTask('cadd', str(i)) for i in range(1, 3) ]
+        (admitted, held) = self.pools.admit(cadd, running)
+        self.assertEqual(admitted, cadd[:1])
+        self.assertEqual(self.pools.usage(running + admitted), {'vep-cache-io' : 1, 'bigmem' : 3})
+        # a slot frees when a task finishes
+        (admitted, held) = self.pools.admit(held, running[1:] + admitted)
+        self.assertEqual(admitted, cadd[1:])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import tempfile
+import shutil
+import os
+import fcntl
+from yaps2 import refcache
+from yaps2.refcache import Bundle, RefCache, bundle_hosts
+
+def write(path, data):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(data)
+
+class TestRefCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.registry = os.path.join(self.tmpdir, 'registry')
+        self.bundles = []
+        for name in ('a', 'b', 'c'):
+            source = os.path.join(self.tmpdir, 'nfs', name)
+            write(os.path.join(source, 'x', 'data.txt'), name * 100)
+            self.bundles.append(Bundle(name, source, '1'))
+        self.cache = RefCache(os.path.join(self.tmpdir, 'cache'), limit_bytes=250,
+                              registry=self.registry, host='blade1')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_checkout(self):
+        checkout = self.cache.checkout(self.bundles[0])
+        self.assertEqual(checkout.path, os.path.join(self.tmpdir, 'cache', 'a', '1'))
+        with open(os.path.join(checkout.path, 'x', 'data.txt')) as f:
+            self.assertEqual(f.read(), 'a' * 100)
+        self.assertEqual(bundle_hosts(self.registry, self.bundles[0]), ['blade1'])
+        checkout.release()
+        # the second checkout uses the copy
+        os.unlink(os.path.join(self.bundles[0].source, 'x', 'data.txt'))
+        self.assertIsNotNone(self.cache.checkout(self.bundles[0]))
+
+    def test_damaged_copy(self):
+        checkout = self.cache.checkout(self.bundles[0])
+        checkout.release()
+        write(os.path.join(checkout.path, 'x', 'data.txt'), 'truncated')
+        checkout = self.cache.checkout(self.bundles[0])
+        with open(os.path.join(checkout.path, 'x', 'data.txt')) as f:
+            self.assertEqual(f.read(), 'a' * 100)
+
+    def test_lru_eviction(self):
+        self.cache.checkout(self.bundles[0]).release()
+        in_use = self.cache.checkout(self.bundles[1])
+        # 'a' is evicted to make room, 'b' is in use
+        self.cache.checkout(self.bundles[2]).release()
+        names = [ m['name'] for (t, e, m) in self.cache.entries() ]
+        self.assertEqual(sorted(names), ['b', 'c'])
+        self.assertEqual(bundle_hosts(self.registry, self.bundles[0]), [])
+        # nothing can be evicted while 'b' and 'c' are in use
+        held = self.cache.checkout(self.bundles[2])
+        self.assertIsNone(self.cache.checkout(self.bundles[0]))
+        held.release()
+        in_use.release()
+
+    def test_replaced_while_locking(self):
+        bundle = self.bundles[0]
+        self.cache.checkout(bundle).release()
+        cache = self.cache
+
+        class ReplacingFcntl(object):
+            # the entry is evicted and copied again right before the lock is taken
+            LOCK_SH = fcntl.LOCK_SH
+            LOCK_EX = fcntl.LOCK_EX
+            LOCK_NB = fcntl.LOCK_NB
+            replaced = False
+
+            def flock(self, f, op):
+                if op == fcntl.LOCK_SH and not self.replaced:
+                    self.replaced = True
+                    cache._remove(cache.entry(bundle))
+                    cache._copy(bundle)
+                fcntl.flock(f, op)
+
+        refcache.fcntl = ReplacingFcntl()
+        try:
+            checkout = self.cache.checkout(bundle)
+        finally:
+            refcache.fcntl = fcntl
+        in_use = os.path.join(checkout.path, refcache.IN_USE)
+        self.assertEqual(os.fstat(checkout.lock_file.fileno()).st_ino, os.stat(in_use).st_ino)
+        checkout.release()
+
+    def test_missing_source(self):
+        self.assertIsNone(self.cache.checkout(Bundle('d', os.path.join(self.tmpdir, 'nope'), '1')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import tempfile
+import shutil
+import os
+import json
+import logging
+from yaps2.retry import is_memory_failure, clean_partial_outputs, OOMRetryPolicy, ChunkRetryPolicy
+
+try:
+    from cosmos.api import TaskStatus
+except ImportError:
+    TaskStatus = None
+
+class FakeStage(object):
+    def __init__(self, name):
+        self.name = name
+
+class FakeTask(object):
+    # the attributes of a cosmos Task the retry policies use
+    def __init__(self, stage_name, uid, stdout, memory_kb):
+        self.stage = FakeStage(stage_name)
+        self.uid = uid
+        self.status = TaskStatus.failed
+        self.must_succeed = True
+        self.attempt = 1
+        self.output_stdout_path = stdout
+        self.output_stderr_path = stdout + '.err'
+        self.output_map = {}
+        self.drm_params = json.dumps({ 'M' : memory_kb, 'R' : 'rusage[mem={}]'.format(memory_kb // 1000) })
+        self.log = logging.getLogger('test_retry')
+
+class TestOOMRetry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def touch(self, *names):
+        path = os.path.join(self.tmpdir, *names)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write('data\n')
+        return path
+
+    def test_is_memory_failure(self):
+        stdout = self.touch('stdout_attempt1.txt')
+        self.assertFalse(is_memory_failure([stdout, os.path.join(self.tmpdir, 'missing')]))
+        with open(stdout, 'a') as f:
+            f.write('TERM_MEMLIMIT: job killed after reaching LSF memory usage limit.\n')
+        self.assertTrue(is_memory_failure([stdout]))
+
+    def test_clean_partial_outputs(self):
+        out_vcf = self.touch('1', 'out.vcf.gz')
+        keep = self.touch('1', 'scratch', 'lifted.vcf.gz')
+        partial = [ self.touch('1', 'out.vcf.gz.tmp'), self.touch('1', 'scratch', 'sites.vcf.temp') ]
+        removed = clean_partial_outputs({'out_vcf' : out_vcf, 'out_log' : [self.touch('1', 'out.log')]})
+        self.assertEqual(sorted(removed), sorted(partial))
+        self.assertTrue(os.path.exists(keep))
+        self.assertTrue(os.path.exists(out_vcf))
+
+    def test_memory_escalation(self):
+        policy = OOMRetryPolicy(escalation=(1.5, 2.0), max_memory_mb=30000)
+        key = ('8-vep-annotation', '1')
+        self.assertEqual(policy.next_memory_mb(key, 10000, 10000), 15000)
+        policy.retries[key] = 1
+        self.assertEqual(policy.next_memory_mb(key, 10000, 15000), 20000)
+        policy.retries[key] = 2
+        self.assertIsNone(policy.next_memory_mb(key, 10000, 20000))
+
+        capped = ('9-cadd-annotation', '1')
+        self.assertEqual(policy.next_memory_mb(capped, 25000, 25000), 30000)
+        policy.retries[capped] = 1
+        self.assertIsNone(policy.next_memory_mb(capped, 25000, 30000))
+
+    def test_chunk_retries(self):
+        policy = ChunkRetryPolicy(set(['8.1-vep-annotation']), max_retries=2)
+        key = ('8.1-vep-annotation', '1.chunk3')
+        self.assertTrue(policy.should_retry(key))
+        policy.retries[key] = 2
+        self.assertFalse(policy.should_retry(key))
+        self.assertTrue(policy.should_retry(('8.1-vep-annotation', '1.chunk4')))
+        self.assertFalse(policy.should_retry(('9-cadd-annotation', '1')))
+
+    @unittest.skipIf(TaskStatus is None, 'cosmos is not installed')
+    def test_both_policies(self):
+        stage = '8.1-vep-chunk-annotation'
+        for reverse in (False, True):
+            oom = OOMRetryPolicy(escalation=(1.5,))
+            chunk = ChunkRetryPolicy(set([stage]))
+            # the receivers of a status change are called in no given order
+            receivers = [oom.task_status_changed, chunk.task_status_changed]
+            if reverse:
+                receivers.reverse()
+
+            stdout = self.touch('oom{}'.format(reverse), 'stdout_attempt1.txt')
+            with open(stdout, 'a') as f:
+                f.write('TERM_MEMLIMIT: job killed after reaching LSF memory usage limit.\n')
+            task = FakeTask(stage, '1.chunk1', stdout, 10000000)
+            for receiver in receivers:
+                receiver(task)
+            self.assertEqual(task.status, TaskStatus.no_attempt)
+            self.assertEqual(task.attempt, 2)
+            self.assertEqual(json.loads(task.drm_params)['M'], 15000000)
+            self.assertEqual(chunk.retries, {})
+
+            stdout = self.touch('exit{}'.format(reverse), 'stdout_attempt1.txt')
+            task = FakeTask(stage, '1.chunk2', stdout, 10000000)
+            for receiver in receivers:
+                receiver(task)
+            self.assertEqual(task.status, TaskStatus.no_attempt)
+            self.assertEqual(task.attempt, 2)
+            self.assertEqual(json.loads(task.drm_params)['M'], 10000000)
+            self.assertEqual(chunk.retries, { (stage, '1.chunk2') : 1 })
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import tempfile
+import shutil
+import subprocess
+import os
+from yaps2.scratch import TaskScratch, scratch_root, ENV_SCRATCH
+from yaps2.telemetry import run_command, wrap_command
+
+SCRATCH_SH = os.path.join(os.path.dirname(__file__), '..', 'yaps2', 'resources', 'scratch.sh')
+
+class TestScratch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, 'local')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_scratch_root(self):
+        self.assertEqual(scratch_root({'TMPDIR': '/local/job', 'YAPS2_SCRATCH_ROOT': '/ssd'}), '/ssd')
+        self.assertEqual(scratch_root({'TMPDIR': '/local/job'}), '/local/job')
+
+    def test_removed(self):
+        with TaskScratch('6-annotate', 'chr1', root=self.root) as scratch:
+            path = scratch.path
+            stats = run_command('echo x > ${}/a.tmp'.format(ENV_SCRATCH), interval=1, env=scratch.environment())
+            self.assertEqual(stats['exit_status'], 0)
+            self.assertTrue(os.path.isfile(os.path.join(path, 'a.tmp')))
+        self.assertFalse(os.path.exists(path))
+
+    def test_keep_intermediates(self):
+        keep = os.path.join(self.tmpdir, 'intermediates')
+        with TaskScratch('6-annotate', 'chr1', keep_dir=keep, root=self.root) as scratch:
+            with open(os.path.join(scratch.path, 'a.tmp'), 'w') as f:
+                f.write('x')
+        self.assertTrue(os.path.isfile(os.path.join(keep, '6-annotate', 'chr1', 'a.tmp')))
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_wrap_command(self):
+        cmd = wrap_command('true', 'jobs.db', 'wf', '1-stage', 'chr1', 1, 0, True, '/ws/intermediates')
+        self.assertIn('--scratch --keep-intermediates /ws/intermediates', cmd)
+        self.assertNotIn('--scratch', wrap_command('true', 'jobs.db', 'wf', '1-stage', 'chr1', 1, 0))
+
+    def test_stage_out(self):
+        scratch = os.path.join(self.tmpdir, 'scratch')
+        os.makedirs(scratch)
+        final = os.path.join(self.tmpdir, 'out.vcf.gz')
+        script = 'source {} && tmp=$(stage_tmp_path {}) && echo x > $tmp && stage_out $tmp {} && echo $tmp'
+        out = subprocess.check_output(['/bin/bash', '-c', script.format(SCRATCH_SH, final, final)],
+                                      env=dict(os.environ, YAPS2_SCRATCH=scratch))
+        self.assertEqual(out.decode().strip(), os.path.join(scratch, 'out.vcf.gz.tmp'))
+        self.assertTrue(os.path.isfile(final))
+        self.assertEqual(os.listdir(scratch), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import tempfile
+import shutil
+import os
+from yaps2.telemetry import run_command, record, fetch, wrap_command, input_size
+
+class TestTelemetry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmpdir, 'jobs.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_run_command(self):
+        out = os.path.join(self.tmpdir, 'out.txt')
+        stats = run_command('seq 1 1000 > {} && sleep 0.2'.format(out), interval=1)
+        self.assertEqual(stats['exit_status'], 0)
+        self.assertGreater(stats['wall_time'], 0.1)
+        self.assertGreater(stats['max_rss_kb'], 0)
+        self.assertTrue(os.path.isfile(out))
+
+    def test_failing_command(self):
+        stats = run_command('false | cat', interval=1)
+        self.assertEqual(stats['exit_status'], 1)
+
+    def test_record_and_fetch(self):
+        record(self.db, {'stage': '1-stage', 'uid': '1', 'exit_status': 0, 'max_rss_kb': 10})
+        record(self.db, {'stage': '1-stage', 'uid': '2', 'exit_status': 1, 'max_rss_kb': 20})
+        record(self.db, {'stage': '2-stage', 'uid': '1', 'exit_status': 0, 'max_rss_kb': 30})
+        rows = fetch(self.db, stage='1-stage')
+        self.assertEqual([ r['uid'] for r in rows ], ['1'])
+        self.assertEqual(len(fetch(self.db, stage='1-stage', successful_only=False)), 2)
+        self.assertEqual(fetch(os.path.join(self.tmpdir, 'missing.db')), [])
+
+    def test_wrap_command(self):
+        cmd = wrap_command("echo 'a b' > out", self.db, 'wf', '1-stage', 'chr1', 1, 0)
+        self.assertIn("'echo '\"'\"'a b'\"'\"' > out'", cmd)
+        self.assertIn('--uid chr1', cmd)
+
+    def test_input_size(self):
+        path = os.path.join(self.tmpdir, 'in.txt')
+        with open(path, 'w') as f:
+            f.write('12345')
+        self.assertEqual(input_size({'in_a': path, 'in_b': [path, path], 'in_c': 3}), 15)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,294 @@
+from __future__ import print_function, division
+
+import io, sys, gzip, datetime
+
+import click
+
+from yaps2.utils import tabix_record_count
+
+def log(msg):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print('[-- annotation {} --] {}'.format(timestamp, msg), file=sys.stderr)
+
+def open_text(path, mode='r'):
+    """Opens a (b)gzipped or plain text file, or stdin/stdout for '-'."""
+    if path == '-':
+        return sys.stdin if 'r' in mode else sys.stdout
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(io.BufferedReader(gzip.open(path, mode + 'b')))
+    return io.open(path, mode)
+
+class VcfStream(object):
+    """The header and records of a VCF, read line by line without parsing
+    the sample columns (or of a genotype sidecar, with maxsplit=4)."""
+
+    def __init__(self, path, maxsplit=8):
+        self.path = path
+        self.maxsplit = maxsplit
+        self.f = open_text(path)
+        self.meta = []
+        self.columns = None
+        self.pending = None
+        for line in self.f:
+            if line.startswith('##'):
+                self.meta.append(line.rstrip('\n'))
+            elif line.startswith('#'):
+                self.columns = line.rstrip('\n')
+                break
+        if self.columns is None:
+            raise ValueError('{} has no #CHROM header line'.format(path))
+
+    def __iter__(self):
+        for line in self.f:
+            yield line.rstrip('\n').split('\t', self.maxsplit)
+
+    def close(self):
+        if self.f is not sys.stdin:
+            self.f.close()
+
+class ChainedVcfStream(object):
+    """The records of VCFs holding consecutive parts of the same records
+    (e.g. annotated chunks), read in order; the header is the first's."""
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.path = ','.join(self.paths)
+        self.streams = [ VcfStream(p) for p in self.paths ]
+        self.meta = self.streams[0].meta
+        self.columns = self.streams[0].columns
+
+    def __iter__(self):
+        for stream in self.streams:
+            for fields in stream:
+                yield fields
+
+    def close(self):
+        for stream in self.streams:
+            stream.close()
+
+def open_annotated(paths):
+    if isinstance(paths, (list, tuple)):
+        return ChainedVcfStream(paths)
+    return VcfStream(paths)
+
+def site_key(fields):
+    # CHROM, POS, REF, ALT
+    return (fields[0], fields[1], fields[3], fields[4])
+
+def info_items(info):
+    if info == '.' or info == '':
+        return []
+    return info.split(';')
+
+def info_key(item):
+    return item.split('=', 1)[0]
+
+def header_id(line):
+    # e.g. '##INFO=<ID=CADD,...>' => ('INFO', 'CADD')
+    if not line.startswith('##') or '=<ID=' not in line:
+        return None
+    (kind, rest) = line[2:].split('=<ID=', 1)
+    return (kind, rest.split(',', 1)[0].rstrip('>'))
+
+def merge_meta(base, others):
+    """The base header lines followed by the lines of the others it does not
+    have (the same ID of the same kind, or the identical line)."""
+    merged = list(base)
+    seen_ids = set(header_id(line) for line in base)
+    seen = set(base)
+    for lines in others:
+        for line in lines:
+            hid = header_id(line)
+            if line in seen or (hid is not None and hid in seen_ids):
+                continue
+            merged.append(line)
+            seen.add(line)
+            seen_ids.add(hid)
+    return merged
+
+def merge_info(base_info, annotated_infos):
+    """The base INFO followed by the fields each annotated INFO adds to it."""
+    items = info_items(base_info)
+    keys = set(info_key(i) for i in items)
+    for info in annotated_infos:
+        for item in info_items(info):
+            key = info_key(item)
+            if key not in keys:
+                items.append(item)
+                keys.add(key)
+    return ';'.join(items) or '.'
+
+def passes_filters(filter_column, filters):
+    # like bcftools view --apply-filters: any of the record's FILTERs
+    return any(f in filters for f in filter_column.split(';'))
+
+def merge_annotations(base_path, annotated_paths, out, filters=None):
+    """Writes the records of the base VCF with the INFO fields added by each
+    annotated copy of it (e.g. the outputs of annotators run side by side on
+    the same sites).  The annotated VCFs must hold the base records in the
+    same order; the base's other columns (e.g. its samples) are kept as is.
+    A list of paths in annotated_paths is read as one VCF split in chunks.
+
+    With filters, the annotated VCFs only hold the base records with one of
+    those FILTERs (e.g. PASS); the other records are written as they are,
+    without the annotations."""
+    base = VcfStream(base_path)
+    annotated = [ open_annotated(p) for p in annotated_paths ]
+
+    for line in merge_meta(base.meta, [ a.meta for a in annotated ]):
+        print(line, file=out)
+    print(base.columns, file=out)
+
+    iterators = [ iter(a) for a in annotated ]
+    n_records = 0
+    n_passed = 0
+    for fields in base:
+        if filters and not passes_filters(fields[6], filters):
+            print('\t'.join(fields), file=out)
+            n_records += 1
+            n_passed += 1
+            continue
+        infos = []
+        for (a, it) in zip(annotated, iterators):
+            other = next(it, None)
+            if other is None or site_key(other) != site_key(fields):
+                raise ValueError('{} does not line up with {} at record {} ({})'.format(
+                    a.path, base_path, n_records + 1, ':'.join(site_key(fields))))
+            infos.append(other[7])
+        fields[7] = merge_info(fields[7], infos)
+        print('\t'.join(fields), file=out)
+        n_records += 1
+
+    for (a, it) in zip(annotated, iterators):
+        if next(it, None) is not None:
+            raise ValueError('{} has more records than {}'.format(a.path, base_path))
+        a.close()
+    base.close()
+    log('merged the annotations of {} records ({} passed through)'.format(n_records, n_passed))
+    return n_records
+
+def chunk_bounds(n_records, n_chunks):
+    """The [start, end) record numbers of n_chunks balanced chunks."""
+    return [ (i * n_records // n_chunks, (i + 1) * n_records // n_chunks) for i in range(n_chunks) ]
+
+def count_records(path):
+    n_records = 0
+    stream = VcfStream(path)
+    for _ in stream:
+        n_records += 1
+    stream.close()
+    return n_records
+
+def split_sites(path, n_chunks, out_prefix):
+    """Writes the sites of a VCF (its first 8 columns) as n_chunks
+    consecutive chunks of about as many records each, to
+    <out_prefix>.1.vcf ... <out_prefix>.<n_chunks>.vcf."""
+    n_records = tabix_record_count(path)
+    if n_records is None:
+        n_records = count_records(path)
+
+    stream = VcfStream(path)
+    records = iter(stream)
+    paths = []
+    for (number, (start, end)) in enumerate(chunk_bounds(n_records, n_chunks), 1):
+        chunk = '{}.{}.vcf'.format(out_prefix, number)
+        with io.open(chunk, 'w') as out:
+            for line in stream.meta:
+                print(line, file=out)
+            print('\t'.join(stream.columns.split('\t')[:8]), file=out)
+            for _ in range(end - start):
+                fields = next(records, None)
+                if fields is None:
+                    raise ValueError('{} has fewer records than its index lists ({})'.format(path, n_records))
+                print('\t'.join(fields[:8]), file=out)
+        paths.append(chunk)
+    if next(records, None) is not None:
+        raise ValueError('{} has more records than its index lists ({})'.format(path, n_records))
+    stream.close()
+    log('split {} records into {} chunks'.format(n_records, n_chunks))
+    return paths
+
+def attach_genotypes(pairs, out):
+    """Writes the records of sites-only VCFs (e.g. the annotated shards of a
+    chromosome, in order) with the sample columns of their genotype sidecars.
+
+    A sidecar is a tab-separated '#CHROM POS REF ALT FORMAT <samples>' table
+    of the records of its sites VCF, in the same order; the sidecars must
+    all list the same samples.  The records are not sorted, so the shards
+    must be given in order: a record before the one written last fails."""
+    n_records = 0
+    columns = None
+    last = None
+    for (sites_path, genotypes_path) in pairs:
+        sites = VcfStream(sites_path)
+        genotypes = VcfStream(genotypes_path, maxsplit=4)
+        samples = genotypes.columns.split('\t', 4)[4]
+        if columns is None:
+            columns = samples
+            for line in sites.meta:
+                print(line, file=out)
+            print('\t'.join(sites.columns.split('\t')[:8] + [samples]), file=out)
+        elif samples != columns:
+            raise ValueError('{} does not list the samples of the first sidecar'.format(genotypes_path))
+
+        it = iter(genotypes)
+        n_sites = 0
+        for fields in sites:
+            other = next(it, None)
+            if other is None or tuple(other[:4]) != site_key(fields):
+                raise ValueError('{} does not line up with {} at record {} ({})'.format(
+                    genotypes_path, sites_path, n_sites + 1, ':'.join(site_key(fields))))
+            position = (fields[0], int(fields[1]))
+            if last is not None and position[0] == last[0] and position[1] < last[1]:
+                raise ValueError('{}:{} in {} comes before {}:{}, written last; the shards must be given in order and must not overlap'.format(
+                    position[0], position[1], sites_path, last[0], last[1]))
+            last = position
+            print('\t'.join(fields[:8] + [other[4]]), file=out)
+            n_sites += 1
+        if next(it, None) is not None:
+            raise ValueError('{} has more records than {}'.format(genotypes_path, sites_path))
+        sites.close()
+        genotypes.close()
+        n_records += n_sites
+    log('attached the genotypes of {} records'.format(n_records))
+    return n_records
+
+@click.group()
+def cli():
+    pass
+
+@cli.command()
+@click.option('--base', required=True, type=click.Path(exists=True),
+              help='the VCF that was annotated')
+@click.option('--annotated', 'annotated', multiple=True, type=click.Path(exists=True),
+              help='an annotated copy of the base records (repeatable)')
+@click.option('--chunks', 'chunks', multiple=True, type=click.Path(exists=True),
+              help='an annotated chunk of the base records (repeatable, in order)')
+@click.option('--filter', 'filters', multiple=True, type=click.STRING,
+              help='only the base records with this FILTER were annotated (repeatable)')
+def merge(base, annotated, chunks, filters):
+    if not annotated and not chunks:
+        raise click.UsageError('expected --annotated or --chunks')
+    annotated = list(annotated)
+    if chunks:
+        annotated.append(list(chunks))
+    merge_annotations(base, annotated, sys.stdout, set(filters) or None)
+
+@cli.command()
+@click.option('--vcf', required=True, type=click.Path(exists=True),
+              help='the VCF to split')
+@click.option('--chunks', 'n_chunks', required=True, type=click.IntRange(min=1),
+              help='the number of chunks')
+@click.option('--out-prefix', required=True, type=click.STRING,
+              help='the prefix of the <prefix>.<N>.vcf chunks')
+def split(vcf, n_chunks, out_prefix):
+    split_sites(vcf, n_chunks, out_prefix)
+
+@cli.command()
+@click.option('--pair', 'pairs', required=True, multiple=True, nargs=2, type=click.Path(exists=True),
+              help='a sites-only VCF and its genotype sidecar (repeatable, in order)')
+def attach(pairs):
+    attach_genotypes(pairs, sys.stdout)
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,339 @@
+from __future__ import print_function, division
+
+import os, sys, json, shutil, hashlib, datetime, subprocess
+from multiprocessing.pool import ThreadPool
+
+import click
+
+from yaps2.utils import to_json, ensure_directory
+from yaps2.lsf import set_memory, set_cores, memory_mb, bsub_args, index_spec, lsf_command
+from yaps2.telemetry import wrap_command, input_size
+
+def log(msg):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print('[-- bundle {} --] {}'.format(timestamp, msg), file=sys.stderr)
+
+def command_digest(cmd):
+    return hashlib.sha1(cmd.encode('utf-8')).hexdigest()
+
+def safe_name(uid):
+    return uid.replace(':', '_').replace('/', '_')
+
+# Manifests ###################################################################
+def write_manifest(path, manifest):
+    ensure_directory(os.path.dirname(path))
+    tmp = '.'.join([path, 'tmp'])
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.rename(tmp, path)
+
+def read_manifest(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def is_done(member):
+    # a member only counts as done if it finished the command it has now
+    if not os.path.isfile(member['done']):
+        return False
+    with open(member['done'], 'r') as f:
+        return f.read().strip() == command_digest(member['cmd'])
+
+def pending_members(manifest):
+    """Returns the (1-based index, member) pairs that still need to run."""
+    members = enumerate(manifest['members'], start=1)
+    return [ (i, m) for i, m in members if not is_done(m) ]
+
+def next_attempt(member):
+    attempt = 1
+    if os.path.isfile(member['attempts']):
+        with open(member['attempts'], 'r') as f:
+            attempt = int(f.read().strip()) + 1
+    with open(member['attempts'], 'w') as f:
+        print(attempt, file=f)
+    return attempt
+
+def member_command(member, telemetry=None):
+    """The command of a member, run under the telemetry runner (as cosmos
+    runs a standalone task) when the bundle records telemetry."""
+    if not telemetry:
+        return member['cmd']
+    return wrap_command(
+        member['cmd'],
+        uid=member['uid'],
+        attempt=next_attempt(member),
+        input_bytes=input_size({ 'inputs' : member['inputs'] }),
+        **telemetry
+    )
+
+def run_member(member, telemetry=None):
+    for d in member['outdirs']:
+        ensure_directory(d)
+
+    log("running {}".format(member['uid']))
+    cmd = member_command(member, telemetry)
+    with open(member['log'], 'w') as out:
+        rc = subprocess.call(
+            ['/bin/bash', '-e', '-o', 'pipefail', '-c', cmd],
+            stdout=out,
+            stderr=subprocess.STDOUT
+        )
+
+    if rc == 0:
+        with open(member['done'], 'w') as f:
+            print(command_digest(member['cmd']), file=f)
+    else:
+        log("{} failed with exit code {} (see {})".format(member['uid'], rc, member['log']))
+    return rc
+
+def run_members(members, parallel=1, telemetry=None):
+    run = lambda member: run_member(member, telemetry)
+    if parallel > 1:
+        pool = ThreadPool(parallel)
+        try:
+            statuses = pool.map(run, members)
+        finally:
+            pool.close()
+    else:
+        statuses = [ run(m) for m in members ]
+    return all(rc == 0 for rc in statuses)
+
+def submit_array(manifest, manifest_path, parallel):
+    pending = pending_members(manifest)
+    if not pending:
+        log("all {} members are done".format(len(manifest['members'])))
+        return True
+
+    job_name = '{}[{}]'.format(manifest['job_name'], index_spec([ i for i, m in pending ]))
+    if parallel > 0:
+        job_name = '{}%{}'.format(job_name, parallel)
+
+    cmd = lsf_command('bsub') + ['-K', '-J', job_name, '-o', os.path.join(manifest['bundle_dir'], 'lsf.%I.out')]
+    cmd.extend(bsub_args(manifest['lsf_params']))
+    cmd.extend([
+        sys.executable, '-m', 'yaps2.bundle', 'run',
+        '--manifest', manifest_path,
+        '--lsf-array-element',
+    ])
+
+    log("submitting {} of {} members as {}".format(len(pending), len(manifest['members']), job_name))
+    subprocess.call(cmd)
+
+    # bsub -K reports the worst exit code of the array, so look at the
+    # members directly
+    remaining = pending_members(manifest)
+    for i, member in remaining:
+        log("{} did not finish (see {})".format(member['uid'], member['log']))
+    return len(remaining) == 0
+
+# Pipeline Construction #######################################################
+class BundledTask(object):
+    """Stands in for a single task that has been folded into a bundle job, so
+    that downstream stages can be constructed as if it was a regular task."""
+
+    def __init__(self, index, task_dict, bundle):
+        self.id = index
+        self.uid = task_dict['uid']
+        self.params = task_dict['params']
+        self.task = bundle
+
+    @property
+    def stage(self):
+        return self.task.stage
+
+def resolve_parents(parents):
+    tasks = []
+    for parent in parents:
+        task = getattr(parent, 'task', parent)
+        if not any(task is t for t in tasks):
+            tasks.append(task)
+    return tasks
+
+def input_paths(params):
+    paths = []
+    for key in sorted(params.keys()):
+        if key.startswith('in_'):
+            value = params[key]
+            paths.extend(value if isinstance(value, (list, tuple)) else [value])
+    return paths
+
+def output_dirs(params):
+    dirs = []
+    for key in sorted(params.keys()):
+        if not key.startswith('out_'):
+            continue
+        path = params[key]
+        d = path if key == 'out_dir' else os.path.dirname(path)
+        if d not in dirs:
+            dirs.append(d)
+    return dirs
+
+def bundle_lsf_params(lsf_params, parallel):
+    if parallel <= 1:
+        return lsf_params
+    params = set_memory(lsf_params, memory_mb(lsf_params) * parallel)
+    return set_cores(params, parallel)
+
+class Bundler(object):
+    """Adds the tasks of a stage to a workflow, optionally folding them into
+    bundle jobs.
+
+    With a bundle ``size`` of K (0 meaning the whole group), every K tasks
+    sharing the same ``key`` become one job that runs them in sequence, or
+    ``parallel`` at a time.  With ``array``, each bundle is instead run as an
+    LSF job array with one element per task.  Every bundled task leaves a
+    marker when it succeeds, so a restarted bundle only reruns the tasks that
+    did not finish.
+
+    With a ``telemetry_db``, every bundled task runs under the telemetry
+    runner and is recorded with its own stage, uid and attempt, as it would
+    be as a standalone task.
+    """
+
+    def __init__(self, workflow, rootdir, project_name, size=1, parallel=1, array=False, restart=False,
+                 telemetry_db=None):
+        self.workflow = workflow
+        self.rootdir = rootdir
+        self.project_name = project_name
+        self.size = size
+        self.parallel = parallel
+        self.array = array
+        self.restart = restart
+        self.telemetry_db = telemetry_db
+
+    @property
+    def enabled(self):
+        return self.array or self.size != 1
+
+    def add_tasks(self, stage, task_dicts, lsf_params, key=None):
+        if not self.enabled:
+            tasks = []
+            for task in task_dicts:
+                task = dict(task, parents=resolve_parents(task.get('parents', [])))
+                tasks.append( self.workflow.add_task(**task) )
+            return tasks
+
+        members = []
+        for group, chunk in self.chunk(task_dicts, key):
+            bundle = self.add_bundle(stage, group, chunk, lsf_params)
+            for task in chunk:
+                members.append( BundledTask(len(members), task, bundle) )
+        return members
+
+    def chunk(self, task_dicts, key):
+        groups = []
+        for task in task_dicts:
+            group = key(task) if key else 'bundle'
+            if not groups or groups[-1][0] != group:
+                groups.append((group, []))
+            groups[-1][1].append(task)
+
+        for group, tasks in groups:
+            size = self.size if self.size > 0 else len(tasks)
+            for start in range(0, len(tasks), size):
+                yield ('{}:{:04d}'.format(group, start // size + 1), tasks[start:start + size])
+
+    def add_bundle(self, stage, uid, task_dicts, lsf_params):
+        bundle_dir = os.path.join(self.rootdir, stage, 'bundles', safe_name(uid))
+        if self.restart and os.path.isdir(bundle_dir):
+            shutil.rmtree(bundle_dir)
+
+        members = []
+        for task in task_dicts:
+            name = safe_name(task['uid'])
+            members.append({
+                'uid' : task['uid'],
+                'cmd' : task['func'](**task['params']),
+                'inputs' : input_paths(task['params']),
+                'outdirs' : output_dirs(task['params']),
+                'log' : os.path.join(bundle_dir, '{}.log'.format(name)),
+                'done' : os.path.join(bundle_dir, '{}.done'.format(name)),
+                'attempts' : os.path.join(bundle_dir, '{}.attempts'.format(name)),
+            })
+
+        telemetry = None
+        if self.telemetry_db is not None:
+            # the arguments of yaps2.telemetry.wrap_command shared by the members
+            telemetry = {
+                'db' : self.telemetry_db,
+                'workflow' : self.project_name,
+                'stage' : stage,
+            }
+
+        manifest_path = '.'.join([bundle_dir, 'json'])
+        write_manifest(manifest_path, {
+            'stage' : stage,
+            'uid' : uid,
+            'bundle_dir' : bundle_dir,
+            'job_name' : '{}.{}.{}'.format(self.project_name, stage, safe_name(uid)),
+            'lsf_params' : lsf_params,
+            'telemetry' : telemetry,
+            'members' : members,
+        })
+        ensure_directory(bundle_dir)
+
+        parents = []
+        for task in task_dicts:
+            parents.extend(task.get('parents', []))
+
+        task = {
+            'func' : bundle_array if self.array else bundle,
+            'params' : {
+                'in_manifest' : manifest_path,
+                # for arrays, a limit on the elements running at once
+                'parallel' : self.parallel if (self.parallel > 1 or not self.array) else 0,
+            },
+            'stage_name' : stage,
+            'uid' : uid,
+            'drm_params' : to_json(lsf_params if self.array else bundle_lsf_params(lsf_params, self.parallel)),
+            'parents' : resolve_parents(parents),
+        }
+        if self.array:
+            # the array is submitted (and waited on) from the workflow host
+            task['drm'] = 'local'
+        return self.workflow.add_task(**task)
+
+def bundle(in_manifest, parallel):
+    return "{python} -m yaps2.bundle run --manifest {in_manifest} --parallel {parallel}".format(
+        python=sys.executable, in_manifest=in_manifest, parallel=parallel
+    )
+
+def bundle_array(in_manifest, parallel):
+    return "{python} -m yaps2.bundle submit-array --manifest {in_manifest} --parallel {parallel}".format(
+        python=sys.executable, in_manifest=in_manifest, parallel=parallel
+    )
+
+# Command Line ################################################################
+@click.group()
+def cli():
+    pass
+
+@cli.command()
+@click.option('--manifest', required=True, type=click.Path(exists=True),
+              help='the bundle manifest')
+@click.option('--parallel', default=1, type=click.INT,
+              help='the number of members to run at a time')
+@click.option('--lsf-array-element', is_flag=True, default=False,
+              help='only run the member given by $LSB_JOBINDEX')
+def run(manifest, parallel, lsf_array_element):
+    data = read_manifest(manifest)
+    if lsf_array_element:
+        index = int(os.environ['LSB_JOBINDEX'])
+        members = [ m for i, m in pending_members(data) if i == index ]
+    else:
+        members = [ m for i, m in pending_members(data) ]
+        log("{} of {} members to run".format(len(members), len(data['members'])))
+    if not run_members(members, parallel, data.get('telemetry')):
+        sys.exit(1)
+
+@cli.command(name='submit-array')
+@click.option('--manifest', required=True, type=click.Path(exists=True),
+              help='the bundle manifest')
+@click.option('--parallel', default=0, type=click.INT,
+              help='the maximum number of array elements to run at a time [0 = no limit]')
+def submit_array_cmd(manifest, parallel):
+    data = read_manifest(manifest)
+    if not submit_array(data, manifest, parallel):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    cli()
@@ -7,6 +7,13 @@ from .version import __version__
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
+def validate_pools(ctx, param, value):
+    from yaps2.pools import parse_pools
+    try:
+        return parse_pools(value)
+    except ValueError as err:
+        raise click.BadParameter(str(err))
+
 @click.group(context_settings=CONTEXT_SETTINGS)
 @click.version_option(version=__version__)
 def cli():
@@ -69,9 +76,35 @@ def postvqsr(job_db, input_vcfs, project_name, email, workspace, drm, queue, res
               help='Do not prompt when resuming or restarting a pipeline [default=False]')
 @click.option('--task-flush', default=False, is_flag=True,
               help='Update the task database table as soon as a job is submitted [default=False]')
-def postvqsr38(job_db, input_vcfs, project_name, email, workspace, drm, drm_job_group, queue, restart, docker, skip_confirm, task_flush):
+@click.option('--autosize/--no-autosize', default=False,
+              help='Size LSF memory & core requests from the resource usage of previous runs [default=False]')
+@click.option('--history-db', default=None, type=click.Path(exists=True),
+              help="A job DB with the resource telemetry of previous runs [default='<job-db>']")
+@click.option('--local-scratch/--no-local-scratch', default=False,
+              help='Write stage temporaries to node-local scratch ($TMPDIR) and copy only the final outputs to the workspace [default=False]')
+@click.option('--keep-intermediates', default=False, is_flag=True,
+              help="Copy the local scratch of every job to '<workspace>/intermediates' for debugging [default=False]")
+@click.option('--refcache/--no-refcache', default=False,
+              help='Read the VEP, CADD & annotation sources from node-local copies, preferring hosts that hold them [default=False]')
+@click.option('--pool', 'pools', multiple=True, type=click.STRING, callback=validate_pools,
+              help="Cap the running tasks of the stages tagged with a pool, e.g. --pool vep-cache-io:6 --pool bigmem:10 (pools: vep-cache-io, cadd-io, bigmem)")
+@click.option('--annotation-dag', default='serial', type=click.Choice(['serial', 'parallel']),
+              help='Chain the annotation stages, or run them side by side on sites-only VCFs and merge their annotations [default=serial]')
+@click.option('--defer-genotypes/--no-defer-genotypes', default=False,
+              help='Annotate sites-only VCFs and re-attach the genotypes when concatenating [default=False]')
+@click.option('--vep-chunk-size', default=None, type=click.IntRange(min=1),
+              help='Run VEP as separate jobs over chunks of about this many records of a chromosome [default=whole chromosomes]')
+@click.option('--cadd-chunk-size', default=None, type=click.IntRange(min=1),
+              help='Score CADD as separate jobs over chunks of about this many records of a chromosome [default=whole chromosomes]')
+@click.option('--annotate-filter', 'annotate_filters', multiple=True, type=click.STRING,
+              help='Only annotate the records with this FILTER (e.g. PASS), passing the others through (repeatable) [default=all records]')
+def postvqsr38(job_db, input_vcfs, project_name, email, workspace, drm, drm_job_group, queue, restart, docker, skip_confirm, task_flush,
+               autosize, history_db, local_scratch, keep_intermediates, refcache, pools, annotation_dag,
+               defer_genotypes, vep_chunk_size, cadd_chunk_size, annotate_filters):
     from yaps2.pipelines.postvqsr38 import Config, Pipeline
-    config = Config(job_db, input_vcfs, project_name, email, workspace, docker, queue, drm_job_group)
+    config = Config(job_db, input_vcfs, project_name, email, workspace, docker, queue, drm_job_group,
+                    autosize, history_db, local_scratch, keep_intermediates, refcache, pools,
+                    annotation_dag, defer_genotypes, vep_chunk_size, cadd_chunk_size, annotate_filters)
     workflow = Pipeline(config, drm, restart, skip_confirm)
     workflow.run(task_flush)
 
@@ -98,13 +131,21 @@ def postvqsr38(job_db, input_vcfs, project_name, email, workspace, drm, drm_job_
               help='Job Mode -- [default=lsf]')
 @click.option('--restart/--no-restart', default=False,
               help='Restart Pipeline from scratch')
+@click.option('--bundle-size', default=1, type=click.IntRange(min=0),
+              help='Run this many chromosome MIE counting tasks per job [default=1; 0=all of them]')
+@click.option('--bundle-parallel', default=1, type=click.IntRange(min=1),
+              help='The number of bundled tasks to run at a time [default=1]')
+@click.option('--job-arrays/--no-job-arrays', default=False,
+              help='Submit each bundle as an LSF job array [default=False]')
 def mie(job_db, input_vcfs, percentiles, samples, tranches, plink_fam,
-        project_name, email, workspace, drm, restart):
+        project_name, email, workspace, drm, restart,
+        bundle_size, bundle_parallel, job_arrays):
     from yaps2.pipelines.mie import Config, Pipeline
     config = Config(
         job_db, input_vcfs,
         percentiles, samples, tranches, plink_fam,
-        project_name, email, workspace
+        project_name, email, workspace,
+        bundle_size, bundle_parallel, job_arrays
     )
     workflow = Pipeline(config, drm, restart)
     workflow.run()
@@ -118,17 +159,43 @@ def mie(job_db, input_vcfs, percentiles, samples, tranches, plink_fam,
               help='A file of chromosomal VCFs to process')
 @click.option('--project-name', default='yaps2.default', type=click.STRING,
               help='A prefix used to name batch jobs')
-@click.option('--vqslod-threshold', required=True, type=click.FLOAT,
-              help='A minimum VQSLOD tranche threshold to choose SNPs from [min. snp tranche 2 VQSLOD point]')
+@click.option('--vqslod-threshold', default=None, type=click.FLOAT,
+              help='A minimum VQSLOD tranche threshold to choose SNPs from [min. snp tranche 2 VQSLOD point; not needed with --projection-model]')
 @click.option('--email', default=None, type=click.STRING,
               help='An email used to notify about batch jobs [default=userid@genome.wustl.edu]')
+@click.option('--pca-engine', default='yaps2', type=click.Choice(['yaps2', 'smartpca']),
+              help='Compute the PCs with the yaps2 randomized PCA, or with convertf and smartpca [default=yaps2]')
 @click.option('--drm', default='lsf', type=click.Choice(['local', 'lsf']),
               help='Job Mode -- [default=lsf]')
 @click.option('--restart/--no-restart', default=False,
               help='Restart Pipeline from scratch')
-def pca(job_db, input_vcfs, project_name, email, workspace, vqslod_threshold, drm, restart):
+@click.option('--projection-model', default=None, type=click.Path(exists=True),
+              help="Project the samples of --input-vcfs onto the PCs of a previous run's 4-yaps2-pca/merged.eigenstrat.pca.model.npz")
+def pca(job_db, input_vcfs, project_name, email, workspace, vqslod_threshold, pca_engine, drm, restart, projection_model):
     from yaps2.pipelines.pca import Config, Pipeline
-    config = Config(job_db, input_vcfs, project_name, email, workspace, vqslod_threshold)
+    config = Config(job_db, input_vcfs, project_name, email, workspace, vqslod_threshold, pca_engine,
+                    projection_model)
+    workflow = Pipeline(config, drm, restart)
+    workflow.run()
+
+@cli.command(short_help="Convert chromosomal VCFs into a packed genotype store")
+@click.option('--workspace', required=True, type=click.Path(),
+              help='A directory to place outputs into')
+@click.option('--job-db', default=None, type=click.Path(),
+              help="Path to LSF job sqlite DB [default='<workspace>/.job_queue.db']")
+@click.option('--input-vcfs', required=True, type=click.Path(exists=True),
+              help='A file of chromosomal VCFs to process')
+@click.option('--project-name', default='yaps2.default', type=click.STRING,
+              help='A prefix used to name batch jobs')
+@click.option('--email', default=None, type=click.STRING,
+              help='An email used to notify about batch jobs [default=userid@genome.wustl.edu]')
+@click.option('--drm', default='lsf', type=click.Choice(['local', 'lsf']),
+              help='Job Mode -- [default=lsf]')
+@click.option('--restart/--no-restart', default=False,
+              help='Restart Pipeline from scratch')
+def ingest(job_db, input_vcfs, project_name, email, workspace, drm, restart):
+    from yaps2.pipelines.ingest import Config, Pipeline
+    config = Config(job_db, input_vcfs, project_name, email, workspace)
     workflow = Pipeline(config, drm, restart)
     workflow.run()
 
@@ -149,8 +216,16 @@ def pca(job_db, input_vcfs, project_name, email, workspace, vqslod_threshold, dr
               help='An LSF job group to control cluster usage')
 @click.option('--restart/--no-restart', default=False,
               help='Restart Pipeline from scratch')
-def b38_realign(job_db, input_sample_bams, project_name, email, workspace, drm, drm_job_group, restart):
+@click.option('--scatter/--no-scatter', default=False,
+              help='Realign each input BAM of a sample as its own job, then merge and mark duplicates [default=False]')
+@click.option('--local-scratch/--no-local-scratch', default=False,
+              help='Write stage temporaries to node-local scratch ($TMPDIR) and copy only the final outputs to the workspace [default=False]')
+@click.option('--keep-intermediates', default=False, is_flag=True,
+              help="Copy the local scratch of every job to '<workspace>/intermediates' for debugging [default=False]")
+def b38_realign(job_db, input_sample_bams, project_name, email, workspace, drm, drm_job_group, restart, scatter,
+                local_scratch, keep_intermediates):
     from yaps2.pipelines.b38 import Config, Pipeline
-    config = Config(job_db, input_sample_bams, project_name, email, workspace, drm_job_group)
+    config = Config(job_db, input_sample_bams, project_name, email, workspace, drm_job_group, scatter,
+                    local_scratch, keep_intermediates)
     workflow = Pipeline(config, drm, restart)
     workflow.run()
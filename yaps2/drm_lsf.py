@@ -0,0 +1,149 @@
+from __future__ import print_function, division
+
+import os, shlex, subprocess
+
+from cosmos.api import TaskStatus, NOOP
+from cosmos.job.JobManager import JobManager
+from cosmos.job.drm.DRM_Base import DRM
+
+from yaps2.lsf import BjobsPoller, bsub_many, lsf_command
+
+def lsf_submit_args(task):
+    args = ['-o', task.output_stdout_path, '-e', task.output_stderr_path]
+    if task.drm_native_specification:
+        # the native specification is rendered for a shell
+        args.extend(shlex.split(task.drm_native_specification))
+    args.append(task.output_command_script_path)
+    return args
+
+class DRM_BatchedLSF(DRM):
+    """An LSF driver that answers status questions from a cache kept fresh
+    by one bjobs call per (adaptive) interval, instead of calling bjobs for
+    every status check."""
+
+    name = 'lsf'
+    # the poller decides when bjobs actually runs
+    poll_interval = 1
+
+    def __init__(self, jobmanager, poller=None):
+        self.jobmanager = jobmanager
+        self.poller = poller or BjobsPoller()
+
+    def submit_job(self, task):
+        return self.submit_jobs([task])[0]
+
+    def submit_jobs(self, tasks):
+        job_ids = bsub_many([ lsf_submit_args(t) for t in tasks ])
+        for job_id in job_ids:
+            if not isinstance(job_id, Exception):
+                self.poller.watch(job_id)
+        return job_ids
+
+    def filter_is_done(self, tasks):
+        self.poller.poll()
+        for task in tasks:
+            if task.drm_jobID is None:
+                # bsub itself failed
+                yield task, {'exit_status' : 1}
+            elif self.poller.is_finished(task.drm_jobID):
+                status = self.poller.status(task.drm_jobID)
+                self.poller.forget(task.drm_jobID)
+                yield task, self.get_task_return_data(task, status)
+
+    def get_task_return_data(self, task, status):
+        if status['stat'] == 'DONE':
+            exit_status = 0
+        else:
+            exit_status = status['exit_code'] or 1
+        return {'exit_status' : exit_status}
+
+    def drm_statuses(self, tasks):
+        statuses = {}
+        for task in tasks:
+            status = self.poller.status(task.drm_jobID)
+            statuses[task.drm_jobID] = status['stat'] if status else '???'
+        return statuses
+
+    def kill_tasks(self, tasks):
+        job_ids = [ str(t.drm_jobID) for t in tasks if t.drm_jobID is not None ]
+        if job_ids:
+            subprocess.call(lsf_command('bkill') + job_ids)
+
+class BatchedJobManager(JobManager):
+    """A cosmos JobManager that submits all the LSF tasks that are ready in
+    one go, with several bsub calls in flight at once.
+
+    With ``pools`` (a yaps2.pools.ResourcePools), ready tasks of any driver
+    are held back while a pool of their stage has no free slot; cosmos
+    offers them again once a running task finishes.
+
+    ``prepare_task`` is called with every task about to be submitted, e.g.
+    to size its drm_params from inputs that only exist by then.
+
+    With ``priority`` (a function of a task), the ready LSF tasks are
+    submitted in decreasing order of it; cosmos hands them over in no given
+    order.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.pools = kwargs.pop('pools', None)
+        self.prepare_task = kwargs.pop('prepare_task', None)
+        self.priority = kwargs.pop('priority', None)
+        super(BatchedJobManager, self).__init__(*args, **kwargs)
+        self.drms['lsf'] = DRM_BatchedLSF(self)
+
+    def run_tasks(self, tasks):
+        if self.pools is not None:
+            (tasks, held) = self.pools.admit(tasks, self.running_tasks)
+            if held:
+                held[0].log.info('holding %s task(s) until a pool slot frees, pool usage: %s' % (
+                    len(held), self.pools.usage(self.running_tasks + tasks)))
+        if self.prepare_task is not None:
+            for task in tasks:
+                self.prepare_task(task)
+        lsf_tasks = [ t for t in tasks if t.drm.split(':')[0] == 'lsf' ]
+        other_tasks = [ t for t in tasks if t.drm.split(':')[0] != 'lsf' ]
+        if other_tasks:
+            super(BatchedJobManager, self).run_tasks(other_tasks)
+        if not lsf_tasks:
+            return
+        if self.priority is not None:
+            # a stable sort, the tasks of the same priority keep their order
+            lsf_tasks = sorted(lsf_tasks, key=self.priority, reverse=True)
+
+        self.running_tasks += lsf_tasks
+        commands = [ self.call_cmd_fxn(t) for t in lsf_tasks ]
+
+        # prepare every job first, the database objects are not thread safe
+        to_submit = []
+        for task, command in zip(lsf_tasks, commands):
+            if command == NOOP:
+                task.NOOP = True
+                task.status = TaskStatus.submitted
+                continue
+            task.log_dir = self.log_out_dir_func(task)
+            if not os.path.isdir(task.log_dir):
+                os.makedirs(task.log_dir)
+            write_command_script(task, command)
+            task.drm_native_specification = self.get_submit_args(task)
+            to_submit.append(task)
+
+        drm = self.drms['lsf']
+        for task, job_id in zip(to_submit, drm.submit_jobs(to_submit)):
+            if isinstance(job_id, Exception):
+                # reported as a failed job on the next poll
+                task.log.error('%s could not be submitted: %s' % (task, job_id))
+                with open(task.output_stderr_path, 'w') as f:
+                    f.write('bsub failed: {}\n'.format(job_id))
+                job_id = None
+            task.drm_jobID = job_id
+            task.status = TaskStatus.submitted
+
+def write_command_script(task, command):
+    with open(task.output_command_script_path, 'w') as f:
+        f.write(command)
+    os.chmod(task.output_command_script_path, 0o755)
+
+    for p in [task.output_stdout_path, task.output_stderr_path]:
+        if os.path.exists(p):
+            os.unlink(p)
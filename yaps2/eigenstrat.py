@@ -0,0 +1,76 @@
+from __future__ import print_function, division
+
+import os, sys, datetime
+
+import click
+import numpy as np
+
+from yaps2.genotypes import BedFile
+from yaps2.pca import read_bfile_list
+from yaps2.utils import ensure_directory
+
+# variants written at a time
+BLOCK_SIZE = 4096
+
+# A2 allele counts (-1 when missing) + 1 => .geno characters
+GENO_CHARS = np.frombuffer(b'9012', dtype=np.uint8)
+
+SEX = {'1' : 'M', '2' : 'F'}
+
+def log(msg):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print('[-- eigenstrat {} --] {}'.format(timestamp, msg), file=sys.stderr)
+
+def ind_label(phenotype):
+    # convertf ignores samples with a -9 phenotype, so they are controls
+    # (see the EIGENSOFT FAQ: 'convertf decides to "ignore" all my samples')
+    if phenotype == '2':
+        return 'Case'
+    if phenotype in ('1', '-9'):
+        return 'Control'
+    return phenotype
+
+def geno_lines(gts):
+    """The .geno lines of a (variants x samples) array of A2 allele counts:
+    a character per sample, 9 when missing."""
+    chars = np.empty((gts.shape[0], gts.shape[1] + 1), dtype=np.uint8)
+    chars[:, :-1] = GENO_CHARS[gts.astype(np.intp) + 1]
+    chars[:, -1] = ord('\n')
+    return chars.tobytes()
+
+def write_eigenstrat(prefixes, out_prefix):
+    """Writes the genotypes of plink binaries sharing the same samples (e.g.
+    one per chromosome) as <out_prefix>.geno/.snp/.indiv, counting the A2
+    allele, which the .snp lists as the reference allele."""
+    beds = [ BedFile(p) for p in prefixes ]
+    for bed in beds[1:]:
+        if bed.samples != beds[0].samples:
+            raise ValueError('{} does not have the samples of {}'.format(bed.prefix, beds[0].prefix))
+
+    ensure_directory(os.path.dirname(os.path.abspath(out_prefix)))
+    with open('.'.join([out_prefix, 'indiv']), 'w') as f:
+        for fields in beds[0].fam:
+            print('{}\t{}\t{}'.format(fields[1], SEX.get(fields[4], 'U'), ind_label(fields[5])), file=f)
+
+    n_variants = 0
+    with open('.'.join([out_prefix, 'geno']), 'wb') as geno, \
+         open('.'.join([out_prefix, 'snp']), 'w') as snp:
+        for bed in beds:
+            for start in range(0, bed.n_variants, BLOCK_SIZE):
+                geno.write(geno_lines(bed.genotypes(slice(start, start + BLOCK_SIZE))))
+            for (chrom, variant_id, cm, pos, a1, a2) in bed.bim:
+                morgans = float(cm) / 100
+                print('{}\t{}\t{}\t{}\t{}\t{}'.format(variant_id, chrom, morgans, pos, a2, a1), file=snp)
+            n_variants += bed.n_variants
+    log("{} samples x {} variants".format(len(beds[0].fam), n_variants))
+
+@click.command()
+@click.option('--bfile-list', required=True, type=click.Path(exists=True),
+              help='a file of plink binary prefixes (e.g. one per chromosome), one per line')
+@click.option('--out-prefix', required=True, type=click.STRING,
+              help='the prefix of the .geno, .snp and .indiv outputs')
+def main(bfile_list, out_prefix):
+    write_eigenstrat(read_bfile_list(bfile_list), out_prefix)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+from __future__ import print_function, division
+
+import os
+
+import numpy as np
+
+# plink .bed files: the magic number, then one row of 2-bit genotype codes per
+# variant (SNP-major), four samples to a byte with the first sample in the low
+# bits
+BED_MAGIC = bytearray([0x6c, 0x1b, 0x01])
+BED_MISSING = 0b01
+
+# the code of each genotype as the number of (bim column 6) A2 alleles
+BED_CODES = {0b00 : 0, 0b10 : 1, 0b11 : 2}
+
+def _decode_table():
+    table = np.empty((256, 4), dtype=np.int8)
+    for byte in range(256):
+        for i in range(4):
+            code = (byte >> (2 * i)) & 0b11
+            table[byte, i] = BED_CODES.get(code, -1)
+    return table
+
+# byte => the A2 allele counts (-1 when missing) of its four samples
+DECODE = _decode_table()
+
+def bytes_per_variant(n_samples):
+    return (n_samples + 3) // 4
+
+def read_fam(prefix):
+    with open('.'.join([prefix, 'fam']), 'r') as f:
+        return [ line.split() for line in f if line.strip() ]
+
+def read_bim(prefix):
+    with open('.'.join([prefix, 'bim']), 'r') as f:
+        return [ line.split() for line in f if line.strip() ]
+
+class BedFile(object):
+    """A memory-mapped plink .bed/.bim/.fam file set.
+
+    Rows of variants are decoded on demand into (variants x samples) arrays of
+    A2 allele counts, with -1 for missing genotypes.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.fam = read_fam(prefix)
+        self.bim = read_bim(prefix)
+        self.n_samples = len(self.fam)
+        self.n_variants = len(self.bim)
+
+        path = '.'.join([prefix, 'bed'])
+        with open(path, 'rb') as f:
+            magic = bytearray(f.read(3))
+        if magic != BED_MAGIC:
+            raise ValueError('{} is not a SNP-major plink .bed file'.format(path))
+
+        width = bytes_per_variant(self.n_samples)
+        expected = 3 + width * self.n_variants
+        if os.path.getsize(path) != expected:
+            raise ValueError('{} should be {} bytes long'.format(path, expected))
+
+        if self.n_variants:
+            self.packed = np.memmap(path, dtype=np.uint8, mode='r', offset=3,
+                                    shape=(self.n_variants, width))
+        else:
+            self.packed = np.zeros((0, width), dtype=np.uint8)
+
+    @property
+    def samples(self):
+        return [ fields[1] for fields in self.fam ]
+
+    @property
+    def variant_ids(self):
+        return [ fields[1] for fields in self.bim ]
+
+    def genotypes(self, rows):
+        """The allele counts of a slice or an index array of variants."""
+        return decode(self.packed[rows], self.n_samples)
+
+def decode(packed, n_samples):
+    return DECODE[packed].reshape(packed.shape[0], -1)[:, :n_samples]
+
+def encode(genotypes):
+    """Packs a (variants x samples) array of A2 allele counts (-1 when
+    missing) into .bed rows."""
+    genotypes = np.asarray(genotypes)
+    (n_variants, n_samples) = genotypes.shape
+    width = bytes_per_variant(n_samples)
+    codes = np.full((n_variants, width * 4), BED_MISSING, dtype=np.uint8)
+    lookup = np.array([0b00, 0b10, 0b11, BED_MISSING], dtype=np.uint8)
+    codes[:, :n_samples] = lookup[np.where(genotypes < 0, 3, genotypes)]
+    codes = codes.reshape(n_variants, width, 4)
+    return (codes[:, :, 0] | (codes[:, :, 1] << 2) |
+            (codes[:, :, 2] << 4) | (codes[:, :, 3] << 6)).astype(np.uint8)
+
+class BedWriter(object):
+    """Writes a plink .bed/.bim/.fam file set a block of variants at a time,
+    renaming the files into place when it is closed."""
+
+    def __init__(self, prefix, fam):
+        self.prefix = prefix
+        self.tmp = { ext : '.'.join([prefix, ext, 'tmp']) for ext in ('bed', 'bim', 'fam') }
+        with open(self.tmp['fam'], 'w') as f:
+            for fields in fam:
+                print('\t'.join(fields), file=f)
+        self.bed = open(self.tmp['bed'], 'wb')
+        self.bed.write(BED_MAGIC)
+        self.bim = open(self.tmp['bim'], 'w')
+
+    def write_packed(self, packed, bim):
+        self.bed.write(np.ascontiguousarray(packed, dtype=np.uint8).tobytes())
+        for fields in bim:
+            print('\t'.join(fields), file=self.bim)
+
+    def write(self, genotypes, bim):
+        self.write_packed(encode(genotypes), bim)
+
+    def close(self):
+        self.bed.close()
+        self.bim.close()
+        for (ext, tmp) in self.tmp.items():
+            os.rename(tmp, '.'.join([self.prefix, ext]))
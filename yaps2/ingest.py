@@ -0,0 +1,169 @@
+from __future__ import print_function, division
+
+import os, sys, datetime
+
+import click
+import numpy as np
+
+from yaps2.genotypes import BedFile, BedWriter
+from yaps2.utils import ensure_directory, natural_key
+
+# VCF records converted at a time
+BLOCK_SIZE = 10000
+
+# cyvcf2 gt_types (HOM_REF, HET, UNKNOWN, HOM_ALT) => ALT allele counts
+DOSAGE = np.array([0, 1, -1, 2], dtype=np.int8)
+
+# the site table columns, one .npy file each
+SITE_COLUMNS = (
+    ('pos', np.int64),
+    ('filter', np.int16),
+    ('vqslod', np.float32),
+    ('ac', np.int32),
+)
+
+PASS = 'PASS'
+
+def log(msg):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print('[-- ingest {} --] {}'.format(timestamp, msg), file=sys.stderr)
+
+def site_id(variant):
+    # the IDs given by 'bcftools annotate --set-id +%CHROM-%POS-%REF-%FIRST_ALT'
+    if variant.ID is not None:
+        return variant.ID
+    alt = variant.ALT[0] if variant.ALT else '.'
+    return '-'.join([variant.CHROM, str(variant.POS), variant.REF, alt])
+
+def allele_count(variant, dosage):
+    ac = variant.INFO.get('AC')
+    if ac is None:
+        return int(dosage[dosage > 0].sum())
+    if isinstance(ac, tuple):
+        return int(sum(ac))
+    return int(ac)
+
+class SiteTable(object):
+    """The per-site columns of a chromosome, with FILTER values coded as
+    indexes into a list of names (0 is PASS)."""
+
+    def __init__(self):
+        self.columns = { name : [] for (name, dtype) in SITE_COLUMNS }
+        self.filters = [PASS]
+        self.codes = { PASS : 0 }
+
+    def filter_code(self, value):
+        value = PASS if value is None else value
+        if value not in self.codes:
+            self.codes[value] = len(self.filters)
+            self.filters.append(value)
+        return self.codes[value]
+
+    def add(self, variant, dosage):
+        vqslod = variant.INFO.get('VQSLOD')
+        self.columns['pos'].append(variant.POS)
+        self.columns['filter'].append(self.filter_code(variant.FILTER))
+        self.columns['vqslod'].append(np.nan if vqslod is None else vqslod)
+        self.columns['ac'].append(allele_count(variant, dosage))
+
+    def save(self, directory):
+        ensure_directory(directory)
+        for (name, dtype) in SITE_COLUMNS:
+            np.save(os.path.join(directory, '{}.npy'.format(name)),
+                    np.array(self.columns[name], dtype=dtype))
+        with open(os.path.join(directory, 'filters.txt'), 'w') as f:
+            for value in self.filters:
+                print(value, file=f)
+
+def ingest_vcf(vcf_path, chrom, out_dir, block_size=BLOCK_SIZE):
+    """Converts the records of a chromosome VCF into <out_dir>/<chrom>/:
+    genotypes.bed/.bim/.fam (the ALT allele counts, 2 bits each, with
+    the .fam as the sample index) and sites/ (a .npy file per site column).
+    Multi-allelic records are skipped: their ALT allele counts would lump
+    the ALT alleles together (split them first with 'bcftools norm -m-')."""
+    from cyvcf2 import VCF
+
+    directory = os.path.join(out_dir, chrom)
+    ensure_directory(directory)
+
+    vcf = VCF(vcf_path)
+    samples = list(vcf.samples)
+    fam = [ [s, s, '0', '0', '0', '-9'] for s in samples ]
+    writer = BedWriter(os.path.join(directory, 'genotypes'), fam)
+    sites = SiteTable()
+
+    block = np.empty((block_size, len(samples)), dtype=np.int8)
+    bim = []
+    n_sites = 0
+    n_skipped = 0
+    for variant in vcf:
+        if len(variant.ALT) > 1:
+            n_skipped += 1
+            continue
+        dosage = DOSAGE[variant.gt_types]
+        block[len(bim)] = dosage
+        bim.append([ variant.CHROM, site_id(variant), '0', str(variant.POS),
+                     variant.REF, variant.ALT[0] if variant.ALT else '.' ])
+        sites.add(variant, dosage)
+        if len(bim) == block_size:
+            writer.write(block, bim)
+            n_sites += len(bim)
+            bim = []
+    if bim:
+        writer.write(block[:len(bim)], bim)
+        n_sites += len(bim)
+    vcf.close()
+
+    sites.save(os.path.join(directory, 'sites'))
+    writer.close()
+    log("{}: {} sites x {} samples ({} multi-allelic records skipped)".format(chrom, n_sites, len(samples), n_skipped))
+
+class GenotypeStore(object):
+    """The chromosomes written by ``ingest_vcf`` into a directory.
+
+    The genotypes and site columns are memory-mapped, so slicing sites or
+    samples only reads what is asked for.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @property
+    def chroms(self):
+        chroms = [ c for c in os.listdir(self.directory)
+                   if os.path.exists(os.path.join(self.directory, c, 'genotypes.bed')) ]
+        return sorted(chroms, key=natural_key)
+
+    def prefix(self, chrom):
+        return os.path.join(self.directory, chrom, 'genotypes')
+
+    def genotypes(self, chrom):
+        return BedFile(self.prefix(chrom))
+
+    def sites(self, chrom):
+        directory = os.path.join(self.directory, chrom, 'sites')
+        columns = { name : np.load(os.path.join(directory, '{}.npy'.format(name)), mmap_mode='r')
+                    for (name, dtype) in SITE_COLUMNS }
+        with open(os.path.join(directory, 'filters.txt'), 'r') as f:
+            columns['filters'] = [ line.rstrip('\n') for line in f ]
+        return columns
+
+    def sample_indices(self, chrom, samples):
+        index = { s : i for (i, s) in enumerate(self.genotypes(chrom).samples) }
+        missing = [ s for s in samples if s not in index ]
+        if missing:
+            raise ValueError('samples not in the {} store: {}'.format(chrom, ', '.join(missing[:5])))
+        return np.array([ index[s] for s in samples ], dtype=np.intp)
+
+@click.command()
+@click.option('--vcf', required=True, type=click.Path(exists=True),
+              help='the chromosome VCF to convert')
+@click.option('--chrom', required=True, type=click.STRING,
+              help='the chromosome of the VCF')
+@click.option('--out-dir', required=True, type=click.Path(),
+              help='the genotype store directory')
+def main(vcf, chrom, out_dir):
+    ingest_vcf(vcf, chrom, out_dir)
+
+if __name__ == '__main__':
+    main()
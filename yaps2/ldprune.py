@@ -0,0 +1,172 @@
+from __future__ import print_function, division
+
+import sys, datetime
+from multiprocessing.pool import ThreadPool
+
+import click
+import numpy as np
+
+from yaps2.genotypes import BedFile, BedWriter
+
+# plink's tolerance when comparing allele frequencies
+SMALL_EPSILON = 2.0 ** -44
+
+# variants decoded at a time when collecting statistics
+BLOCK_SIZE = 4096
+
+def log(msg):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print('[-- ldprune {} --] {}'.format(timestamp, msg), file=sys.stderr)
+
+def variant_stats(bed, block_size=BLOCK_SIZE):
+    """The minor allele frequency and missing call rate of every variant."""
+    maf = np.zeros(bed.n_variants, dtype=np.float64)
+    missing = np.zeros(bed.n_variants, dtype=np.float64)
+    for start in range(0, bed.n_variants, block_size):
+        gts = bed.genotypes(slice(start, start + block_size))
+        called = gts >= 0
+        n_called = called.sum(axis=1)
+        alleles = np.where(called, gts, 0).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            freq = alleles / (2.0 * n_called)
+        freq = np.where(n_called > 0, freq, 0.0)
+        stop = start + gts.shape[0]
+        maf[start:stop] = np.minimum(freq, 1 - freq)
+        missing[start:stop] = 1 - n_called / float(bed.n_samples)
+    return (maf, missing)
+
+def standardize(gts):
+    """Centers and scales the allele counts of every variant, with missing
+    genotypes set to the mean (zero)."""
+    called = gts >= 0
+    x = np.where(called, gts, 0).astype(np.float32)
+    n_called = np.maximum(called.sum(axis=1), 1).astype(np.float32)
+    mean = x.sum(axis=1) / n_called
+    x -= mean[:, np.newaxis]
+    x[~called] = 0
+    sd = np.sqrt((x * x).sum(axis=1) / n_called)
+    sd[sd == 0] = 1
+    return x / sd[:, np.newaxis]
+
+def r2_band(bed, variants, window, threads=1):
+    """The squared genotype correlations of every variant with the next
+    window - 1 variants, as a (variants x window - 1) array whose [i, d - 1]
+    entry is the r^2 of variants i and i + d.
+
+    It is built from blocked matrix products of the standardized allele
+    counts, each block only against the blocks within reach of a window.
+    """
+    n = len(variants)
+    reach = window - 1
+    band = np.zeros((n, max(reach, 1)), dtype=np.float32)
+    if n < 2 or reach < 1:
+        return band
+
+    block = max(reach, 64)
+    offsets = np.arange(1, reach + 1)
+
+    def fill(start):
+        stop = min(start + block, n)
+        z = standardize(bed.genotypes(variants[start:min(stop + reach, n)]))
+        samples = z.shape[1]
+        r = z[:stop - start].dot(z.T) / samples
+        rows = np.arange(stop - start)[:, np.newaxis]
+        cols = rows + offsets[np.newaxis, :]
+        valid = cols < z.shape[0]
+        values = np.zeros((stop - start, reach), dtype=np.float32)
+        values[valid] = r[np.broadcast_to(rows, cols.shape)[valid], cols[valid]]
+        band[start:stop] = values * values
+
+    starts = range(0, n, block)
+    if threads > 1:
+        pool = ThreadPool(threads)
+        try:
+            pool.map(fill, starts)
+        finally:
+            pool.close()
+    else:
+        for start in starts:
+            fill(start)
+    return band
+
+def prune(band, maf, window, step, r2_threshold):
+    """plink's --indep-pairwise: within each window of variants, for every
+    remaining pair with an r^2 above the threshold, the variant with the lower
+    minor allele frequency (or on a tie, the later one) is pruned.  Returns
+    the mask of pruned variants."""
+    n = band.shape[0]
+    pruned = np.zeros(n, dtype=bool)
+    high = band > r2_threshold
+    # most variants are in no pair above the threshold at all
+    candidates = high.any(axis=1)
+
+    for start in range(0, n, step):
+        end = min(start + window, n)
+        for i in range(start, end - 1):
+            if pruned[i] or not candidates[i]:
+                continue
+            for d in np.nonzero(high[i, :end - i - 1])[0] + 1:
+                j = i + d
+                if pruned[j]:
+                    continue
+                if maf[i] < (1 - SMALL_EPSILON) * maf[j]:
+                    pruned[i] = True
+                    break
+                pruned[j] = True
+        if end == n:
+            break
+    return pruned
+
+def ld_prune(bfile, out, window=50, step=5, r2_threshold=0.3, min_maf=0.05, max_missing=0.0, threads=1):
+    """Writes <out>.prune.in and <out>.prune.out like plink's --maf --geno
+    --indep-pairwise, and the genotypes of the kept variants to
+    <out>.bed/.bim/.fam."""
+    bed = BedFile(bfile)
+    (maf, missing) = variant_stats(bed)
+    passing = np.nonzero((maf >= min_maf) & (missing <= max_missing))[0]
+    log("{} of {} variants pass the --maf {} --geno {} filters".format(
+        len(passing), bed.n_variants, min_maf, max_missing))
+
+    band = r2_band(bed, passing, window, threads)
+    pruned = prune(band, maf[passing], window, step, r2_threshold)
+    kept = passing[~pruned]
+    log("{} variants kept, {} pruned".format(len(kept), pruned.sum()))
+
+    ids = bed.variant_ids
+    with open('.'.join([out, 'prune.in']), 'w') as f:
+        for i in kept:
+            print(ids[i], file=f)
+    with open('.'.join([out, 'prune.out']), 'w') as f:
+        for i in passing[pruned]:
+            print(ids[i], file=f)
+
+    # the packed rows are copied as they are
+    writer = BedWriter(out, bed.fam)
+    for start in range(0, len(kept), BLOCK_SIZE):
+        rows = kept[start:start + BLOCK_SIZE]
+        writer.write_packed(bed.packed[rows], [ bed.bim[i] for i in rows ])
+    writer.close()
+    return kept
+
+@click.command()
+@click.option('--bfile', required=True, type=click.STRING,
+              help='the prefix of the input plink .bed/.bim/.fam files')
+@click.option('--out', required=True, type=click.STRING,
+              help='the prefix of the outputs')
+@click.option('--window', default=50, type=click.IntRange(min=2),
+              help='the window size in variants [default=50]')
+@click.option('--step', default=5, type=click.IntRange(min=1),
+              help='the number of variants to shift the window by [default=5]')
+@click.option('--r2', default=0.3, type=click.FLOAT,
+              help='the r^2 threshold [default=0.3]')
+@click.option('--maf', default=0.05, type=click.FLOAT,
+              help='the minimum minor allele frequency [default=0.05]')
+@click.option('--geno', default=0.0, type=click.FLOAT,
+              help='the maximum missing call rate of a variant [default=0]')
+@click.option('--threads', default=1, type=click.IntRange(min=1),
+              help='the number of blocks of correlations to compute at a time [default=1]')
+def main(bfile, out, window, step, r2, maf, geno, threads):
+    ld_prune(bfile, out, window, step, r2, maf, geno, threads)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+from __future__ import print_function, division
+
+import os, re, math, json, time, shlex, subprocess
+from multiprocessing.pool import ThreadPool
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+# 'M' is expressed in KB while the 'R' resource strings are in MB
+KB_PER_MB = 1000
+
+def task_lsf_params(task):
+    # stored as json by the pipelines
+    drm_params = task.drm_params
+    return json.loads(drm_params) if isinstance(drm_params, string_types) else dict(drm_params)
+
+def set_task_lsf_params(task, lsf_params):
+    is_json = isinstance(task.drm_params, string_types)
+    task.drm_params = json.dumps(lsf_params) if is_json else lsf_params
+
+def memory_mb(lsf_params):
+    return lsf_params.get('M', 0) // KB_PER_MB
+
+def set_memory(lsf_params, mem_mb):
+    mem_mb = int(mem_mb)
+    params = dict(lsf_params)
+    params['M'] = mem_mb * KB_PER_MB
+
+    resources = params.get('R', '')
+    resources = re.sub(r'mem>\d+', 'mem>{}'.format(mem_mb), resources)
+    if re.search(r'rusage\[[^\]]*mem=\d+', resources):
+        resources = re.sub(r'(rusage\[[^\]]*)mem=\d+', r'\g<1>mem={}'.format(mem_mb), resources)
+    else:
+        resources = ' '.join([resources, 'rusage[mem={}]'.format(mem_mb)]).strip()
+    params['R'] = resources
+
+    return params
+
+def set_tmp(lsf_params, tmp_mb):
+    """Requests (and reserves) tmp_mb of local /tmp space."""
+    tmp_mb = int(tmp_mb)
+    params = dict(lsf_params)
+    resources = params.get('R', '')
+
+    if re.search(r'tmp>\d+', resources):
+        resources = re.sub(r'tmp>\d+', 'tmp>{}'.format(tmp_mb), resources)
+    elif 'select[' in resources:
+        resources = re.sub(r'select\[([^\]]*)\]', r'select[\g<1> && tmp>{}]'.format(tmp_mb), resources, count=1)
+    else:
+        resources = ' '.join(['select[tmp>{}]'.format(tmp_mb), resources]).strip()
+
+    if re.search(r'tmp=\d+', resources):
+        resources = re.sub(r'tmp=\d+', 'tmp={}'.format(tmp_mb), resources)
+    elif 'rusage[' in resources:
+        resources = re.sub(r'rusage\[([^\]]*)\]', r'rusage[\g<1>,tmp={}]'.format(tmp_mb), resources, count=1)
+    else:
+        resources = ' '.join([resources, 'rusage[tmp={}]'.format(tmp_mb)]).strip()
+
+    params['R'] = resources
+    return params
+
+def set_cores(lsf_params, cores):
+    params = dict(lsf_params)
+    params['n'] = int(cores)
+    resources = params.get('R', '')
+    if cores > 1 and 'span[' not in resources:
+        params['R'] = ' '.join([resources, 'span[hosts=1]']).strip()
+    return params
+
+def prefer_hosts(lsf_params, hosts):
+    """Asks LSF to try the given hosts first (e.g. the ones already holding
+    a task's reference data), without ruling out the others."""
+    params = dict(lsf_params)
+    if hosts:
+        preference = ' '.join(['{}+1'.format(h) for h in hosts] + ['others'])
+        params['m'] = "'{}'".format(preference)
+    return params
+
+def estimate_peak_rss_kb(history, input_bytes=None):
+    """The largest peak RSS seen for a stage, scaled up when the new task has
+    a larger input than the one a historical measurement came from."""
+    estimates = []
+    for row in history:
+        scale = 1.0
+        if input_bytes and row.get('input_bytes'):
+            scale = max(1.0, input_bytes / row['input_bytes'])
+        estimates.append(row['max_rss_kb'] * scale)
+    return max(estimates) if estimates else None
+
+def estimate_cores(history):
+    usage = [
+        row['cpu_time'] / row['wall_time']
+        for row in history
+        if row.get('wall_time') and row.get('cpu_time') is not None
+    ]
+    return max(usage) if usage else None
+
+def autosize(lsf_params, history, input_bytes=None,
+             margin=1.25, min_memory_mb=1000, max_cores=16):
+    """Derives the memory (M and rusage[mem]) and core (n) requests of a task
+    from the recorded telemetry of the same stage in previous runs.
+
+    The static lsf_params are returned untouched if there is no usable
+    history.
+    """
+    history = [ row for row in history if row.get('max_rss_kb') ]
+    if not history:
+        return lsf_params
+
+    peak_rss_kb = estimate_peak_rss_kb(history, input_bytes)
+    mem_mb = peak_rss_kb * margin / KB_PER_MB
+    # round up to the next 100MB to keep the requests readable
+    mem_mb = int(math.ceil(mem_mb / 100) * 100)
+    params = set_memory(lsf_params, max(mem_mb, min_memory_mb))
+
+    cores = estimate_cores(history)
+    if cores is not None:
+        cores = min(max(int(round(cores)), 1), max_cores)
+        if cores > 1 or 'n' in params:
+            params = set_cores(params, cores)
+
+    return params
+
+def bsub_args(lsf_params):
+    """Renders lsf_params as a list of bsub arguments, suitable for running
+    without a shell."""
+    args = []
+    for flag in sorted(lsf_params.keys()):
+        args.append('-{}'.format(flag))
+        value = lsf_params[flag]
+        if value is None:
+            continue
+        value = str(value)
+        # some values are pre-quoted for the shell, e.g. the docker application
+        if len(value) > 1 and value[0] == value[-1] and value[0] in ('"', "'"):
+            value = value[1:-1]
+        args.append(value)
+    return args
+
+def index_spec(indices):
+    """Compresses sorted 1-based job array indices into an LSF index list,
+    e.g. [1, 2, 3, 7] => '1-3,7'."""
+    ranges = []
+    for i in sorted(indices):
+        if ranges and i == ranges[-1][1] + 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ','.join(
+        str(start) if start == end else '{}-{}'.format(start, end)
+        for start, end in ranges
+    )
+
+# Submission & Polling ########################################################
+# states after which a job will not change anymore
+FINISHED_STATES = ('DONE', 'EXIT', 'UNKWN', 'ZOMBI')
+
+def lsf_command(name):
+    """The command used to run an LSF tool, which can be pointed elsewhere
+    (e.g. the fake-lsf.py stand-in) with $YAPS2_BSUB, $YAPS2_BJOBS, ..."""
+    return shlex.split(os.environ.get('YAPS2_{}'.format(name.upper()), name))
+
+def parse_bsub_output(out):
+    match = re.search(r'Job <(\d+)>', out)
+    if match is None:
+        raise RuntimeError('could not find a job id in bsub output: {}'.format(out))
+    return int(match.group(1))
+
+def bsub(args, retries=3, delay=2):
+    """Submits a job, retrying transient bsub failures, and returns its id."""
+    cmd = lsf_command('bsub') + list(args)
+    for attempt in range(1, retries + 1):
+        try:
+            out = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+            return parse_bsub_output(out.decode('utf-8', 'replace'))
+        except (subprocess.CalledProcessError, RuntimeError):
+            if attempt == retries:
+                raise
+            time.sleep(delay * attempt)
+
+def bsub_many(submissions, workers=8, retries=3, delay=2):
+    """Submits many jobs concurrently, returning their job ids in order.
+
+    A failed submission is returned as the exception it raised, so that the
+    caller can fail just that job.
+    """
+    def submit(args):
+        try:
+            return bsub(args, retries, delay)
+        except Exception as err:
+            return err
+
+    if len(submissions) <= 1 or workers <= 1:
+        return [ submit(args) for args in submissions ]
+
+    pool = ThreadPool(min(workers, len(submissions)))
+    try:
+        return pool.map(submit, submissions)
+    finally:
+        pool.close()
+
+def parse_bjobs_json(text):
+    data = json.loads(text)
+    jobs = {}
+    for record in data.get('RECORDS', []):
+        # e.g. 'Job <123> is not found'
+        if 'ERROR' in record:
+            continue
+        exit_code = str(record.get('EXIT_CODE') or '').strip()
+        jobs[str(record['JOBID'])] = {
+            'stat' : record.get('STAT'),
+            'exit_code' : int(exit_code) if exit_code.isdigit() else None,
+        }
+    return jobs
+
+class BjobsPoller(object):
+    """An in-memory cache of LSF job states.
+
+    All the watched jobs are refreshed together with a single
+    ``bjobs -a -o ... -json`` call.  The time between calls starts at
+    ``min_interval`` and grows by ``backoff`` (up to ``max_interval``) while
+    nothing changes, dropping back as soon as a job changes state.
+    """
+
+    def __init__(self, min_interval=5, max_interval=60, backoff=1.5, missing_polls=3, clock=time.time):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.missing_polls = missing_polls
+        self.clock = clock
+
+        self.interval = min_interval
+        self.next_poll = 0
+        self.jobs = {}
+        self.missing = {}
+        self.calls = 0
+
+    def watch(self, jobid):
+        self.jobs[str(jobid)] = {'stat' : 'PEND', 'exit_code' : None}
+        # don't wait a long backoff to notice a new job finishing
+        self.interval = self.min_interval
+        self.next_poll = min(self.next_poll, self.clock() + self.min_interval)
+
+    def forget(self, jobid):
+        self.jobs.pop(str(jobid), None)
+        self.missing.pop(str(jobid), None)
+
+    def status(self, jobid):
+        return self.jobs.get(str(jobid))
+
+    def is_finished(self, jobid):
+        status = self.status(jobid)
+        return status is not None and status['stat'] in FINISHED_STATES
+
+    def bjobs(self):
+        self.calls += 1
+        cmd = lsf_command('bjobs') + ['-a', '-o', 'jobid stat exit_code', '-json']
+        out = subprocess.check_output(cmd)
+        return parse_bjobs_json(out.decode('utf-8', 'replace'))
+
+    def poll(self, force=False):
+        """Refreshes the cache if a poll is due, returning whether any watched
+        job changed state."""
+        now = self.clock()
+        if not self.jobs or (not force and now < self.next_poll):
+            return False
+
+        try:
+            current = self.bjobs()
+        except (subprocess.CalledProcessError, OSError, ValueError):
+            current = None
+
+        changed = False
+        if current is not None:
+            for jobid, status in self.jobs.items():
+                if status['stat'] in FINISHED_STATES:
+                    continue
+                if jobid in current:
+                    self.missing.pop(jobid, None)
+                    if current[jobid] != status:
+                        self.jobs[jobid] = current[jobid]
+                        changed = True
+                else:
+                    # jobs that already left the 'bjobs -a' history
+                    self.missing[jobid] = self.missing.get(jobid, 0) + 1
+                    if self.missing[jobid] >= self.missing_polls:
+                        self.jobs[jobid] = {'stat' : 'UNKWN', 'exit_code' : None}
+                        changed = True
+
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        self.next_poll = now + self.interval
+        return changed
@@ -0,0 +1,716 @@
+from __future__ import print_function, division
+
+import os, sys, json, time, random, sqlite3, datetime
+
+import click
+import numpy as np
+
+from yaps2.utils import ensure_directory
+
+# cyvcf2 gt_types codes (with the default gts012=False)
+HOM_REF, HET, UNKNOWN, HOM_ALT = 0, 1, 2, 3
+
+# rows of genotypes evaluated at a time
+BLOCK_SIZE = 10000
+
+def log(msg):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print('[-- mendel {} --] {}'.format(timestamp, msg), file=sys.stderr)
+
+# Trios #######################################################################
+def read_trios(fam_file):
+    """The (family, child, father, mother) entries of a plink .fam file that
+    have both of their parents given."""
+    trios = []
+    with open(fam_file, 'r') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 4:
+                continue
+            (fam, ind, dad, mom) = fields[:4]
+            if dad != '0' and mom != '0':
+                trios.append((fam, ind, dad, mom))
+    return trios
+
+def trio_samples(trios):
+    """Every sample that is part of a trio, in order of first appearance."""
+    samples = []
+    seen = set()
+    for (fam, ind, dad, mom) in trios:
+        for sample in (ind, dad, mom):
+            if sample not in seen:
+                seen.add(sample)
+                samples.append(sample)
+    return samples
+
+def trio_indices(trios, samples):
+    """The column of each trio's child, father and mother in a genotype
+    matrix whose columns are ``samples``."""
+    column = { s : i for i, s in enumerate(samples) }
+    missing = [ s for s in trio_samples(trios) if s not in column ]
+    if missing:
+        raise ValueError('trio samples missing from the VCF: {}'.format(', '.join(missing)))
+
+    child = np.array([ column[t[1]] for t in trios ], dtype=np.intp)
+    dad = np.array([ column[t[2]] for t in trios ], dtype=np.intp)
+    mom = np.array([ column[t[3]] for t in trios ], dtype=np.intp)
+    return (child, dad, mom)
+
+# Genotype Logic ##############################################################
+def informative_mask(gts, child, dad, mom):
+    """A (variants x trios) boolean array of the variants that are informative
+    for each trio: at least one alternate allele within the trio, and at least
+    one homozygous parent (otherwise no child genotype can be inconsistent).
+
+    This mirrors the former per-trio ``bcftools view --min-ac 1`` and
+    ``bcftools view -g hom`` filters.
+    """
+    kid_gts, dad_gts, mom_gts = gts[:, child], gts[:, dad], gts[:, mom]
+
+    def has_alt(g):
+        return (g == HET) | (g == HOM_ALT)
+
+    def is_hom(g):
+        return (g == HOM_REF) | (g == HOM_ALT)
+
+    alt_in_trio = has_alt(kid_gts) | has_alt(dad_gts) | has_alt(mom_gts)
+    hom_parent = is_hom(dad_gts) | is_hom(mom_gts)
+    return alt_in_trio & hom_parent
+
+def mendel_error_table():
+    """A lookup table of the (child, father, mother) gt_types codes that are
+    Mendelian errors, following plink's --mendel error codes 1-8: a
+    heterozygous child of two identical homozygous parents, or a homozygous
+    child of a parent homozygous for the other allele.  Nothing involving a
+    missing child genotype is an error."""
+    table = np.zeros((4, 4, 4), dtype=bool)
+    for dad in range(4):
+        for mom in range(4):
+            table[HET, dad, mom] = (dad == mom) and dad in (HOM_REF, HOM_ALT)
+            table[HOM_REF, dad, mom] = HOM_ALT in (dad, mom)
+            table[HOM_ALT, dad, mom] = HOM_REF in (dad, mom)
+    return table
+
+MENDEL_ERRORS = mendel_error_table()
+
+def mendel_error_mask(gts, child, dad, mom):
+    """A (variants x trios) boolean array of the Mendelian errors."""
+    return MENDEL_ERRORS[gts[:, child], gts[:, dad], gts[:, mom]]
+
+def is_autosome(chrom):
+    chrom = chrom[3:] if chrom.lower().startswith('chr') else chrom
+    return chrom.isdigit() and 1 <= int(chrom) <= 22
+
+# VCF Reading #################################################################
+def is_secondary(variant):
+    # the shell version dropped any record with 'SECONDARY' on its line
+    if 'SECONDARY' in (variant.ID or '') or 'SECONDARY' in (variant.FILTER or ''):
+        return True
+    for (key, value) in variant.INFO:
+        if 'SECONDARY' in key or 'SECONDARY' in str(value):
+            return True
+    return False
+
+def passes_filter(variant):
+    # cyvcf2 reports both '.' and 'PASS' as None
+    return variant.FILTER is None
+
+def allele_type(ref, alt):
+    # after bcftools' classification of the alternate alleles
+    if alt.startswith('<') or alt in ('*', '.') or alt == ref:
+        return 'other'
+    if len(ref) != len(alt):
+        return 'indels'
+    mismatches = sum(1 for (r, a) in zip(ref, alt) if r != a)
+    return 'snps' if mismatches == 1 else 'mnps'
+
+def variant_types(variant):
+    return set(allele_type(variant.REF, alt) for alt in variant.ALT)
+
+def vqslod(variant):
+    value = variant.INFO.get('VQSLOD')
+    return np.nan if value is None else float(value)
+
+def first_alt_only(variant, gts, order):
+    """Sets the genotypes carrying a second (or later) alternate allele to
+    missing, as plink does when it loads a multi-allelic VCF record."""
+    gts = gts.copy()
+    genotypes = variant.genotypes
+    for (i, j) in enumerate(order):
+        if any(a is not None and a > 1 for a in genotypes[j][:-1]):
+            gts[i] = UNKNOWN
+    return gts
+
+class GenotypeBlock(object):
+    """A block of (variants x samples) gt_types, with the per-variant flags
+    the counters select on."""
+
+    def __init__(self, size, n_samples):
+        self.gts = np.empty((size, n_samples), dtype=np.int8)
+        # the genotypes as plink sees them
+        self.plink_gts = np.empty((size, n_samples), dtype=np.int8)
+        self.secondary = np.empty(size, dtype=bool)
+        self.passed = np.empty(size, dtype=bool)
+        self.autosome = np.empty(size, dtype=bool)
+        self.vqslod = np.empty(size, dtype=np.float64)
+        # as with 'bcftools view -v', a record has a type if any of its
+        # alternate alleles do
+        self.snps = np.empty(size, dtype=bool)
+        self.indels = np.empty(size, dtype=bool)
+        self.size = 0
+
+    def add(self, variant, order):
+        n = self.size
+        gts = variant.gt_types[order]
+        self.gts[n] = gts
+        self.plink_gts[n] = first_alt_only(variant, gts, order) if len(variant.ALT) > 1 else gts
+        self.secondary[n] = is_secondary(variant)
+        self.passed[n] = passes_filter(variant)
+        self.autosome[n] = is_autosome(variant.CHROM)
+        self.vqslod[n] = vqslod(variant)
+        types = variant_types(variant)
+        self.snps[n] = 'snps' in types
+        self.indels[n] = 'indels' in types
+        self.size += 1
+
+    def trimmed(self):
+        for name in ('gts', 'plink_gts', 'secondary', 'passed', 'autosome', 'vqslod', 'snps', 'indels'):
+            setattr(self, name, getattr(self, name)[:self.size])
+        return self
+
+def genotype_blocks(vcf_path, samples, block_size=BLOCK_SIZE):
+    """Streams the genotypes of ``samples`` as GenotypeBlocks of at most
+    ``block_size`` variants."""
+    from cyvcf2 import VCF
+
+    vcf = VCF(vcf_path, samples=list(samples))
+    vcf_samples = list(vcf.samples)
+    order = np.array([ vcf_samples.index(s) for s in samples ], dtype=np.intp)
+
+    block = GenotypeBlock(block_size, len(samples))
+    for variant in vcf:
+        block.add(variant, order)
+        if block.size == block_size:
+            yield block
+            block = GenotypeBlock(block_size, len(samples))
+    if block.size:
+        yield block.trimmed()
+    vcf.close()
+
+def check_samples(vcf_path, samples):
+    from cyvcf2 import VCF
+    vcf = VCF(vcf_path)
+    present = set(vcf.samples)
+    vcf.close()
+    missing = [ s for s in samples if s not in present ]
+    if missing:
+        raise ValueError('trio samples missing from {}: {}'.format(vcf_path, ', '.join(missing)))
+
+def trio_counts(vcf_path, trios, pass_only=False, block_size=BLOCK_SIZE):
+    """Reads the VCF once, counting for every trio its informative variants
+    and its Mendelian errors.
+
+    Returns a dict of 'records' (every VCF record), 'variants' and 'mie'
+    (numpy arrays in the order of ``trios``).  As with the former plink and
+    bcftools steps, Mendelian errors are only counted on chromosomes 1-22,
+    while the informative variants skip SECONDARY records (and with
+    ``pass_only``, filtered ones).
+    """
+    samples = trio_samples(trios)
+    check_samples(vcf_path, samples)
+    (child, dad, mom) = trio_indices(trios, samples)
+
+    counts = {
+        'records' : 0,
+        'variants' : np.zeros(len(trios), dtype=np.int64),
+        'mie' : np.zeros(len(trios), dtype=np.int64),
+    }
+    for block in genotype_blocks(vcf_path, samples, block_size):
+        counts['records'] += block.size
+
+        keep = ~block.secondary
+        if pass_only:
+            keep &= block.passed
+        informative = informative_mask(block.gts[keep], child, dad, mom)
+        counts['variants'] += informative.sum(axis=0)
+
+        errors = mendel_error_mask(block.plink_gts[block.autosome], child, dad, mom)
+        counts['mie'] += errors.sum(axis=0)
+    return counts
+
+def count_informative(vcf_path, trios, pass_only=False, block_size=BLOCK_SIZE):
+    """The number of informative variants of every trio."""
+    return trio_counts(vcf_path, trios, pass_only, block_size)['variants']
+
+def write_mie_table(out_file, trios, counts):
+    # the layout aggregate-mie-statistics.py reads: a tab separated header
+    # line, then space separated rows
+    with open(out_file, 'w') as f:
+        print("Family\tVariants\tMIE", file=f)
+        rows = zip([ t[0] for t in trios ], counts['variants'], counts['mie'])
+        for (family, variants, mie) in sorted(rows):
+            print("{} {} {}".format(family, variants, mie), file=f)
+
+def write_summary(out_dir, trios, counts):
+    """Writes <out_dir>/unfiltered.mie.var.txt, or an 'empty-vcf' marker when
+    no variants were counted."""
+    ensure_directory(out_dir)
+    if counts['records'] == 0:
+        open(os.path.join(out_dir, 'empty-vcf'), 'w').close()
+        return
+
+    out_file = os.path.join(out_dir, 'unfiltered.mie.var.txt')
+    tmp = '.'.join([out_file, 'tmp'])
+    write_mie_table(tmp, trios, counts)
+    os.rename(tmp, out_file)
+
+def mie_summary(vcf_path, fam_file, out_dir, pass_only=False):
+    """Writes the per-family variants/MIE table of a VCF."""
+    trios = read_trios(fam_file)
+    counts = trio_counts(vcf_path, trios, pass_only)
+    if counts['records'] == 0:
+        log("{} has no variants!".format(vcf_path))
+    write_summary(out_dir, trios, counts)
+
+# VQSLOD Bins #################################################################
+def read_bins(path):
+    """A list of {'category', 'method', 'label', 'min', 'max'} VQSLOD bins."""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def read_samples(path):
+    with open(path, 'r') as f:
+        return [ line.strip() for line in f if line.strip() ]
+
+def bin_selection(block, bins):
+    """A (bins x variants) boolean array of the PASS records of a block that
+    fall in each bin.  Tranches are [min, max) intervals and percentiles are
+    (min, max] intervals; records without a VQSLOD are in none."""
+    selection = np.zeros((len(bins), block.size), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        for (i, b) in enumerate(bins):
+            if b['method'] == 'tranche':
+                in_bin = (block.vqslod >= b['min']) & (block.vqslod < b['max'])
+            else:
+                in_bin = (block.vqslod > b['min']) & (block.vqslod <= b['max'])
+            selection[i] = in_bin & getattr(block, b['category']) & block.passed
+    return selection
+
+def binned_trio_counts(vcf_path, trios, bins, histogram=None, block_size=BLOCK_SIZE):
+    """Reads the VCF once, counting the informative variants and Mendelian
+    errors of every trio within every VQSLOD bin, and optionally into a
+    VqslodHistogram.
+
+    Returns a list with a trio_counts()-like dict per bin.
+    """
+    samples = trio_samples(trios)
+    check_samples(vcf_path, samples)
+    (child, dad, mom) = trio_indices(trios, samples)
+
+    records = np.zeros(len(bins), dtype=np.int64)
+    variants = np.zeros((len(bins), len(trios)), dtype=np.int64)
+    mie = np.zeros((len(bins), len(trios)), dtype=np.int64)
+    for block in genotype_blocks(vcf_path, samples, block_size):
+        selection = bin_selection(block, bins).astype(np.int64)
+        records += selection.sum(axis=1)
+
+        informative = informative_mask(block.gts, child, dad, mom)
+        informative &= ~block.secondary[:, np.newaxis]
+        variants += selection.dot(informative.astype(np.int64))
+
+        errors = mendel_error_mask(block.plink_gts, child, dad, mom)
+        errors &= block.autosome[:, np.newaxis]
+        mie += selection.dot(errors.astype(np.int64))
+
+        if histogram is not None:
+            histogram.add(block, informative, errors)
+
+    return [
+        { 'records' : records[i], 'variants' : variants[i], 'mie' : mie[i] }
+        for i in range(len(bins))
+    ]
+
+def family_rows(trios, b, chrom, counts):
+    # trios of the same family are added together
+    totals = {}
+    for (trio, variants, mie) in zip(trios, counts['variants'], counts['mie']):
+        total = totals.setdefault(trio[0], [0, 0])
+        total[0] += int(variants)
+        total[1] += int(mie)
+    return [
+        (b['category'], b['method'], str(b['label']), chrom, family, variants, mie)
+        for (family, (variants, mie)) in sorted(totals.items())
+    ]
+
+def mie_bins_summary(vcf_path, fam_file, bins_file, samples_file, chrom, db, out_dir):
+    """Records the per-family variants/MIE counts of every VCF bin in the
+    results store, from one read of the VCF, and saves the VQSLOD histogram
+    of the chromosome under <out_dir>/histograms."""
+    trios = read_trios(fam_file)
+    controls = set(read_samples(samples_file))
+    missing = [ s for s in trio_samples(trios) if s not in controls ]
+    if missing:
+        raise ValueError('trio samples missing from {}: {}'.format(samples_file, ', '.join(missing)))
+
+    bins = read_bins(bins_file)
+    histogram = VqslodHistogram([ t[0] for t in trios ])
+    rows = []
+    for (b, counts) in zip(bins, binned_trio_counts(vcf_path, trios, bins, histogram)):
+        rows.extend(family_rows(trios, b, chrom, counts))
+    histogram.save(histogram_path(out_dir, chrom))
+    if not store_counts(db, chrom, rows):
+        raise RuntimeError('could not record the counts of {} in {}'.format(chrom, db))
+    log("recorded {} bins of {}".format(len(bins), vcf_path))
+
+# Results Store ###############################################################
+TABLE = 'mie_counts'
+
+COLUMNS = (
+    ('category', 'TEXT'),
+    ('method', 'TEXT'),
+    ('bin', 'TEXT'),
+    ('chrom', 'TEXT'),
+    ('family', 'TEXT'),
+    ('variants', 'INTEGER'),
+    ('mie', 'INTEGER'),
+)
+
+def connect(db, timeout=60):
+    conn = sqlite3.connect(db, timeout=timeout)
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS {} ({}, PRIMARY KEY (category, method, bin, chrom, family))'.format(
+            TABLE,
+            ', '.join(' '.join(c) for c in COLUMNS)
+        )
+    )
+    return conn
+
+def store_counts(db, chrom, rows, retries=8):
+    """Replaces the rows of a chromosome in the results store, in a single
+    transaction so that a rerun task never leaves a mix of old and new
+    counts."""
+    names = [ c[0] for c in COLUMNS ]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        TABLE,
+        ', '.join(names),
+        ', '.join('?' * len(names))
+    )
+
+    # every chromosome task of the stage finishes at about the same time,
+    # so back off (with some jitter) and retry when sqlite reports a lock
+    for attempt in range(1, retries + 1):
+        conn = None
+        try:
+            conn = connect(db)
+            conn.isolation_level = None
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM {} WHERE chrom = ?'.format(TABLE), (chrom,))
+            conn.executemany(sql, rows)
+            conn.execute('COMMIT')
+            return True
+        except sqlite3.OperationalError as err:
+            # closing the connection rolls back an unfinished transaction
+            log('attempt {} to record counts failed: {}'.format(attempt, err))
+            time.sleep(min(2 ** attempt, 60) * random.uniform(0.5, 1.5))
+        finally:
+            if conn is not None:
+                conn.close()
+    return False
+
+def aggregate_counts(db, category, method, chroms=None):
+    """The (bin, family, variants, mie) totals of a category and method,
+    over the given chromosomes, by default those of chromosomes 1-22."""
+    conn = connect(db)
+    try:
+        if chroms is None:
+            recorded = conn.execute('SELECT DISTINCT chrom FROM {}'.format(TABLE)).fetchall()
+            chroms = [ c for (c,) in recorded if is_autosome(c) ]
+        sql = ('SELECT bin, family, SUM(variants), SUM(mie) FROM {} '
+               'WHERE category = ? AND method = ? AND chrom IN ({}) '
+               'GROUP BY bin, family ORDER BY CAST(bin AS INTEGER), bin, family').format(
+                   TABLE, ', '.join('?' * len(chroms)))
+        return conn.execute(sql, [category, method] + list(chroms)).fetchall()
+    finally:
+        conn.close()
+
+def write_stats_table(out_file, category, method, rows):
+    ensure_directory(os.path.dirname(os.path.abspath(out_file)))
+    header = ['category', 'method', 'bucket', 'family', 'variants', 'mie']
+    with open(out_file, 'w') as f:
+        print("\t".join(header), file=f)
+        for (bucket, family, variants, mie) in rows:
+            line = [ category, method, bucket, family, variants, mie ]
+            print("\t".join(str(i) for i in line), file=f)
+
+# VQSLOD Histograms ###########################################################
+CATEGORIES = ('snps', 'indels')
+MEASURES = ('variants', 'mie')
+
+# the default grid, VQSLODs are usually reported to two decimals
+HISTOGRAM_START = -50.0
+HISTOGRAM_STOP = 50.0
+HISTOGRAM_STEP = 0.01
+
+def histogram_path(out_dir, chrom):
+    return os.path.join(out_dir, 'histograms', '{}.npz'.format(chrom))
+
+class VqslodHistogram(object):
+    """The informative variant and Mendelian error counts of every trio, for
+    each category, over a fine grid of VQSLOD values.
+
+    A record is counted at the grid value nearest to its VQSLOD, and records
+    beyond the grid at its first or last value.  The counts of any VQSLOD
+    interval then come from cumulative sums, and they are exact for
+    intervals of VQSLODs with no more precision than the grid.
+    """
+
+    def __init__(self, families, start=HISTOGRAM_START, stop=HISTOGRAM_STOP,
+                 step=HISTOGRAM_STEP, counts=None):
+        self.families = list(families)
+        self.start = start
+        self.stop = stop
+        self.step = step
+        size = int(round((stop - start) / step)) + 1
+        # rounded, so that e.g. 1.23 on the grid compares equal to 1.23
+        self.values = np.round(start + np.arange(size) * step, 6)
+        if counts is None:
+            counts = {
+                (category, measure) : np.zeros((size, len(self.families)), dtype=np.int32)
+                for category in CATEGORIES for measure in MEASURES
+            }
+        self.counts = counts
+        self.cumulative = {}
+
+    def index(self, vqslod):
+        index = np.rint((vqslod - self.start) / self.step)
+        return np.clip(index, 0, len(self.values) - 1).astype(np.intp)
+
+    def add(self, block, informative, errors):
+        selected = block.passed & ~np.isnan(block.vqslod)
+        for category in CATEGORIES:
+            rows = selected & getattr(block, category)
+            if not rows.any():
+                continue
+            index = self.index(block.vqslod[rows])
+            np.add.at(self.counts[(category, 'variants')], index, informative[rows])
+            np.add.at(self.counts[(category, 'mie')], index, errors[rows])
+        self.cumulative = {}
+
+    def merge(self, other):
+        if other.families != self.families or not np.array_equal(other.values, self.values):
+            raise ValueError('histograms of different families or grids cannot be merged')
+        for key in self.counts:
+            self.counts[key] += other.counts[key]
+        self.cumulative = {}
+
+    def interval_counts(self, category, measure, min_vqslod, max_vqslod, method):
+        """The per-trio counts of a tranche ([min, max)) or percentile
+        ((min, max]) VQSLOD interval."""
+        key = (category, measure)
+        if key not in self.cumulative:
+            counts = self.counts[key].astype(np.int64)
+            zeros = np.zeros((1, counts.shape[1]), dtype=np.int64)
+            self.cumulative[key] = np.vstack([zeros, np.cumsum(counts, axis=0)])
+        cumulative = self.cumulative[key]
+
+        if method == 'tranche':
+            first = np.searchsorted(self.values, min_vqslod, side='left')
+            last = np.searchsorted(self.values, max_vqslod, side='left')
+        else:
+            first = np.searchsorted(self.values, min_vqslod, side='right')
+            last = np.searchsorted(self.values, max_vqslod, side='right')
+        last = max(first, last)
+        return cumulative[last] - cumulative[first]
+
+    def save(self, path):
+        ensure_directory(os.path.dirname(path))
+        arrays = {
+            '_'.join(key) : counts for (key, counts) in self.counts.items()
+        }
+        tmp = '.'.join([path, 'tmp.npz'])
+        np.savez_compressed(
+            tmp,
+            families=np.array(self.families),
+            grid=np.array([self.start, self.stop, self.step]),
+            **arrays
+        )
+        os.rename(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        (start, stop, step) = data['grid'].tolist()
+        counts = {
+            (category, measure) : data['_'.join([category, measure])]
+            for category in CATEGORIES for measure in MEASURES
+        }
+        families = [ str(f) for f in data['families'] ]
+        return cls(families, start, stop, step, counts)
+
+def load_histograms(histogram_dir, chroms=None):
+    """Sums the per-chromosome histograms of a directory, by default those of
+    chromosomes 1-22."""
+    names = sorted(f[:-len('.npz')] for f in os.listdir(histogram_dir) if f.endswith('.npz'))
+    if chroms is None:
+        chroms = [ c for c in names if is_autosome(c) ]
+    missing = [ c for c in chroms if c not in names ]
+    if missing:
+        raise ValueError('no histograms for chromosomes: {}'.format(', '.join(missing)))
+
+    total = None
+    for chrom in chroms:
+        histogram = VqslodHistogram.load(os.path.join(histogram_dir, '{}.npz'.format(chrom)))
+        if total is None:
+            total = histogram
+        else:
+            total.merge(histogram)
+    return total
+
+def read_tranche_bins(path):
+    # "<snps-or-indels>\t<tranche>\t<vqslod min>" lines; as in the pipeline,
+    # tranche N covers VQSLODs from its minimum up to that of tranche N-1
+    with open(path, 'r') as f:
+        rawdata = [ line.rstrip().split("\t") for line in f if line.strip() ]
+    bins = []
+    for category in CATEGORIES:
+        levels = sorted((int(x[1]), float(x[2])) for x in rawdata if x[0] == category)
+        upper = 100000.0
+        for (label, min_vqslod) in levels:
+            bins.append({'category' : category, 'method' : 'tranche', 'label' : str(label),
+                         'min' : min_vqslod, 'max' : upper})
+            upper = min_vqslod
+    return bins
+
+def read_percentile_bins(path):
+    # "<snps-or-indels>\t<percentile>\t<vqslod min>\t<vqslod max>" lines
+    with open(path, 'r') as f:
+        rawdata = [ line.rstrip().split("\t") for line in f if line.strip() ]
+    return [
+        {'category' : x[0], 'method' : 'percentile', 'label' : x[1],
+         'min' : float(x[2]), 'max' : float(x[3])}
+        for x in sorted(rawdata, key=lambda x: (x[0], int(x[1])))
+    ]
+
+def query_histograms(histogram, bins):
+    """Yields a (bin, family, variants, mie) row for every family in every
+    bin."""
+    families = sorted(set(histogram.families))
+    columns = { f : [ i for (i, g) in enumerate(histogram.families) if g == f ] for f in families }
+    for b in bins:
+        counts = {
+            measure : histogram.interval_counts(b['category'], measure, b['min'], b['max'], b['method'])
+            for measure in MEASURES
+        }
+        for family in families:
+            yield (b, family,
+                   int(counts['variants'][columns[family]].sum()),
+                   int(counts['mie'][columns[family]].sum()))
+
+# Command Line ################################################################
+@click.group()
+def cli():
+    pass
+
+@cli.command()
+@click.option('--fam', required=True, type=click.Path(exists=True),
+              help='the plink .fam file describing the trios')
+@click.option('--vcf', required=True, type=click.Path(exists=True),
+              help='the VCF to count the informative variants of')
+@click.option('--pass-only', is_flag=True, default=False,
+              help="only count variants whose FILTER is '.' or 'PASS'")
+def informative(fam, vcf, pass_only):
+    """Prints the number of informative variants of every trio."""
+    trios = read_trios(fam)
+    counts = count_informative(vcf, trios, pass_only)
+    for (trio, count) in zip(trios, counts):
+        print("{}\t{}".format(trio[0], count))
+
+@cli.command()
+@click.option('--fam', required=True, type=click.Path(exists=True),
+              help='the plink .fam file describing the trios')
+@click.option('--vcf', required=True, type=click.Path(exists=True),
+              help='the VCF to evaluate')
+@click.option('--out-dir', required=True, type=click.Path(),
+              help='where to write unfiltered.mie.var.txt')
+@click.option('--pass-only', is_flag=True, default=False,
+              help="only count informative variants whose FILTER is '.' or 'PASS'")
+def summary(fam, vcf, out_dir, pass_only):
+    """Writes the informative variant and Mendelian error counts of every
+    family."""
+    mie_summary(vcf, fam, out_dir, pass_only)
+
+@cli.command()
+@click.option('--fam', required=True, type=click.Path(exists=True),
+              help='the plink .fam file describing the trios')
+@click.option('--vcf', required=True, type=click.Path(exists=True),
+              help='the (chromosome) VCF to evaluate')
+@click.option('--bins', required=True, type=click.Path(exists=True),
+              help='a JSON file of the VQSLOD bins to count')
+@click.option('--samples', required=True, type=click.Path(exists=True),
+              help='the control samples')
+@click.option('--chrom', required=True, type=click.STRING,
+              help='the chromosome of the VCF')
+@click.option('--db', required=True, type=click.Path(),
+              help='the sqlite results store to record the counts in')
+@click.option('--out-dir', required=True, type=click.Path(),
+              help='the base directory of the VQSLOD histograms')
+def bins(fam, vcf, bins, samples, chrom, db, out_dir):
+    """Records the informative variant and Mendelian error counts of every
+    family within each VQSLOD bin."""
+    mie_bins_summary(vcf, fam, bins, samples, chrom, db, out_dir)
+
+@cli.command()
+@click.option('--db', required=True, type=click.Path(exists=True),
+              help='the sqlite results store')
+@click.option('--category', required=True, type=click.Choice(['snps', 'indels']),
+              help='the category of stats')
+@click.option('--method', required=True, type=click.Choice(['tranche', 'percentile']),
+              help='the category of stat breakdowns')
+@click.option('--chroms', default=None, type=click.STRING,
+              help='a comma delimited set of chromosomes to include [default=1-22]')
+@click.option('--output-file', required=True, type=click.Path(),
+              help='where to write the table')
+def aggregate(db, category, method, chroms, output_file):
+    """Writes the per-family totals of every bin of a category and method."""
+    if chroms is not None:
+        chroms = [ c.strip() for c in chroms.split(',') ]
+    rows = aggregate_counts(db, category, method, chroms)
+    write_stats_table(output_file, category, method, rows)
+
+@cli.command()
+@click.option('--histograms', required=True, type=click.Path(exists=True),
+              help='the directory of per-chromosome VQSLOD histograms')
+@click.option('--tranches', default=None, type=click.Path(exists=True),
+              help='a tsv of category/tranche/min-vqslod lines')
+@click.option('--percentiles', default=None, type=click.Path(exists=True),
+              help='a tsv of category/percentile/min-vqslod/max-vqslod lines')
+@click.option('--chroms', default=None, type=click.STRING,
+              help='a comma delimited set of chromosomes to include [default=1-22]')
+@click.option('--output-file', default=None, type=click.Path(),
+              help='where to write the table [default=stdout]')
+def query(histograms, tranches, percentiles, chroms, output_file):
+    """Prints the informative variant and Mendelian error counts of every
+    family within arbitrary tranche or percentile VQSLOD intervals."""
+    bins = []
+    if tranches:
+        bins.extend(read_tranche_bins(tranches))
+    if percentiles:
+        bins.extend(read_percentile_bins(percentiles))
+    if not bins:
+        raise click.UsageError('give --tranches and/or --percentiles')
+
+    if chroms is not None:
+        chroms = [ c.strip() for c in chroms.split(',') ]
+    histogram = load_histograms(histograms, chroms)
+
+    out = open(output_file, 'w') if output_file else sys.stdout
+    header = ['category', 'method', 'bucket', 'family', 'variants', 'mie']
+    print("\t".join(header), file=out)
+    for (b, family, variants, mie) in query_histograms(histogram, bins):
+        line = [ b['category'], b['method'], b['label'], family, variants, mie ]
+        print("\t".join(str(i) for i in line), file=out)
+    if output_file:
+        out.close()
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,324 @@
+from __future__ import print_function, division
+
+import os, sys, datetime
+from multiprocessing.pool import ThreadPool
+
+import click
+import numpy as np
+
+from yaps2.genotypes import BedFile
+from yaps2.utils import ensure_directory, natural_key
+from yaps2.ingest import DOSAGE
+
+# variants standardized and multiplied at a time
+BLOCK_SIZE = 2048
+
+def log(msg):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print('[-- pca {} --] {}'.format(timestamp, msg), file=sys.stderr)
+
+def read_bfile_list(path):
+    with open(path, 'r') as f:
+        return [ line.strip() for line in f if line.strip() ]
+
+def normalization(gts):
+    """The mean allele count of every variant, and smartpca's scale
+    sqrt(p(1 - p)) with p = (1 + alleles) / (2 + 2 * called)."""
+    called = gts >= 0
+    n_called = called.sum(axis=1)
+    alleles = np.where(called, gts, 0).sum(axis=1).astype(np.float64)
+    mean = alleles / np.maximum(n_called, 1)
+    p = (1 + alleles) / (2 + 2.0 * n_called)
+    return (mean, np.sqrt(p * (1 - p)))
+
+def normalize(gts, mean, scale):
+    called = gts >= 0
+    x = (gts.astype(np.float64) - mean[:, np.newaxis]) / scale[:, np.newaxis]
+    x[~called] = 0
+    return x
+
+def smartpca_normalize(gts):
+    """Centers the allele counts of every variant on their mean and scales
+    them as smartpca does.  Missing genotypes become 0."""
+    (mean, scale) = normalization(gts)
+    return normalize(gts, mean, scale)
+
+class GenotypeMatrix(object):
+    """The normalized (variants x samples) genotype matrix of a set of plink
+    binaries sharing the same samples, read a block of variants at a time
+    from the memory-mapped .bed files."""
+
+    def __init__(self, prefixes, block_size=BLOCK_SIZE):
+        self.beds = [ BedFile(p) for p in prefixes ]
+        samples = self.beds[0].samples
+        for bed in self.beds[1:]:
+            if bed.samples != samples:
+                raise ValueError('{} does not have the samples of {}'.format(bed.prefix, self.beds[0].prefix))
+        self.samples = samples
+        self.n_samples = len(samples)
+        self.n_variants = sum(b.n_variants for b in self.beds)
+        self.blocks = [
+            (bed, start, min(start + block_size, bed.n_variants))
+            for bed in self.beds
+            for start in range(0, bed.n_variants, block_size)
+        ]
+
+    def block(self, index):
+        (bed, start, stop) = self.blocks[index]
+        return smartpca_normalize(bed.genotypes(slice(start, stop)))
+
+def map_blocks(fxn, n_blocks, threads):
+    if threads > 1:
+        pool = ThreadPool(threads)
+        try:
+            return pool.map(fxn, range(n_blocks))
+        finally:
+            pool.close()
+    return [ fxn(i) for i in range(n_blocks) ]
+
+def randomized_pca(matrix, k=10, oversample=10, iterations=4, threads=1, seed=0):
+    """The top k eigenvalues and (unit-norm, per sample) eigenvectors of
+    X'X, where X is the normalized (M variants x N samples) genotype matrix.
+    The eigenvalues are on smartpca's .eval scale: X'X is scaled so that its
+    trace, the sum of all N of its eigenvalues, is N - 1.
+
+    It is a randomized SVD (Halko, Martinsson & Tropp) with power iterations,
+    and reads the matrix iterations + 2 times, a block of variants at a time.
+    """
+    rank = min(k + oversample, matrix.n_samples)
+    n_blocks = len(matrix.blocks)
+
+    def sketch(i):
+        (bed, start, stop) = matrix.blocks[i]
+        omega = np.random.RandomState(seed + i).standard_normal((stop - start, rank))
+        return matrix.block(i).T.dot(omega)
+
+    y = np.sum(map_blocks(sketch, n_blocks, threads), axis=0)
+
+    for iteration in range(iterations):
+        (q, r) = np.linalg.qr(y)
+
+        def power(i):
+            x = matrix.block(i)
+            return x.T.dot(x.dot(q))
+
+        y = np.sum(map_blocks(power, n_blocks, threads), axis=0)
+        log("power iteration {} of {}".format(iteration + 1, iterations))
+
+    (q, r) = np.linalg.qr(y)
+
+    def project(i):
+        x = matrix.block(i)
+        z = x.dot(q)
+        return (z.T.dot(z), np.sum(x * x))
+
+    results = map_blocks(project, n_blocks, threads)
+    ztz = np.sum([ r[0] for r in results ], axis=0)
+    trace = sum(r[1] for r in results)
+    (s2, w) = np.linalg.eigh(ztz)
+    order = np.argsort(s2)[::-1][:k]
+    eigenvalues = s2[order] * (matrix.n_samples - 1) / trace
+    eigenvectors = q.dot(w[:, order])
+    # a deterministic sign for every component
+    signs = np.sign(eigenvectors[np.argmax(np.abs(eigenvectors), axis=0), np.arange(len(order))])
+    return (eigenvalues, eigenvectors * signs)
+
+def snp_loadings(matrix, eigenvectors, threads=1):
+    """The normalization of every variant, and the weights W = X U / S^2
+    that give the PC coordinates of a normalized sample y as y'W (for the
+    samples of the PCA, their eigenvector entries).  S^2, the eigenvalues
+    of X'X, are the squared norms of the columns of X U."""
+    def load(i):
+        (bed, start, stop) = matrix.blocks[i]
+        gts = bed.genotypes(slice(start, stop))
+        (mean, scale) = normalization(gts)
+        return (mean, scale, normalize(gts, mean, scale).dot(eigenvectors))
+
+    results = map_blocks(load, len(matrix.blocks), threads)
+    (mean, scale, xu) = tuple( np.concatenate([ r[i] for r in results ]) for i in range(3) )
+    return (mean, scale, xu / np.sum(xu * xu, axis=0))
+
+def save_model(path, matrix, eigenvalues, eigenvectors, threads=1):
+    """Saves what projecting other samples needs: the variants (with
+    their .bim alleles), their normalization and the SNP weights."""
+    (mean, scale, loadings) = snp_loadings(matrix, eigenvectors, threads)
+    bim = [ fields for bed in matrix.beds for fields in bed.bim ]
+    np.savez(
+        path,
+        ids=np.array([ b[1] for b in bim ]),
+        chroms=np.array([ b[0] for b in bim ]),
+        positions=np.array([ int(b[3]) for b in bim ], dtype=np.int64),
+        a1=np.array([ b[4] for b in bim ]),
+        a2=np.array([ b[5] for b in bim ]),
+        mean=mean,
+        scale=scale,
+        loadings=loadings,
+        eigenvalues=eigenvalues,
+    )
+
+def plink_chrom(chrom):
+    # plink writes '1' for both '1' and 'chr1' (b38) VCF chromosomes
+    return chrom[3:] if chrom.lower().startswith('chr') else chrom
+
+class PcaModel(object):
+    """A saved PCA, for projecting other samples onto its PCs."""
+
+    def __init__(self, path):
+        data = np.load(path)
+        for key in ('ids', 'chroms', 'positions', 'a1', 'a2', 'mean', 'scale', 'loadings', 'eigenvalues'):
+            setattr(self, key, data[key])
+        data.close()
+        self.plink_chroms = np.array([ plink_chrom(c) for c in self.chroms ])
+
+    def rows(self, chrom):
+        """The model's variants on a chromosome, named with or without a
+        'chr' prefix."""
+        return np.nonzero(self.plink_chroms == plink_chrom(chrom))[0]
+
+    def project(self, rows, gts):
+        """The PC coordinates contributed by the (rows x samples) A2 allele
+        counts of some of the model's variants; missing genotypes count as
+        the cohort mean."""
+        x = normalize(gts, self.mean[rows], self.scale[rows])
+        return x.T.dot(self.loadings[rows])
+
+def site_regions(positions, gap=10000):
+    """The tabix regions covering sorted positions, merging sites less than
+    gap bp apart."""
+    regions = []
+    for pos in positions:
+        if regions and pos - regions[-1][1] < gap:
+            regions[-1][1] = pos
+        else:
+            regions.append([pos, pos])
+    return regions
+
+def a2_dosage(variant, a1, a2):
+    """The A2 allele counts of a biallelic VCF record, or None when its
+    alleles aren't A1 and A2."""
+    alt_dosage = DOSAGE[variant.gt_types]
+    if (a1, a2) == (variant.REF, variant.ALT[0]):
+        return alt_dosage
+    if (a1, a2) == (variant.ALT[0], variant.REF):
+        return np.where(alt_dosage < 0, -1, 2 - alt_dosage)
+    return None
+
+def vcf_dosages(vcf_path, chrom, model, rows):
+    """The A2 allele counts of the VCF samples at the model's variants on a
+    chromosome (named as in the VCF), looked up through the VCF index.
+    Variants that are absent, or whose alleles don't match the model, are
+    missing (-1)."""
+    from cyvcf2 import VCF
+
+    vcf = VCF(vcf_path)
+    gts = np.full((len(rows), len(vcf.samples)), -1, dtype=np.int8)
+    positions = model.positions[rows]
+    order = np.argsort(positions, kind='mergesort')
+    wanted = {}
+    for i in order:
+        wanted.setdefault(int(positions[i]), []).append(i)
+
+    found = 0
+    for (start, stop) in site_regions(positions[order]):
+        for variant in vcf('{}:{}-{}'.format(chrom, start, stop)):
+            if len(variant.ALT) != 1:
+                continue
+            for i in wanted.get(variant.POS, ()):
+                dosage = a2_dosage(variant, model.a1[rows[i]], model.a2[rows[i]])
+                if dosage is not None:
+                    gts[i] = dosage
+                    found += 1
+    samples = list(vcf.samples)
+    vcf.close()
+    log("{}: {} of {} variants found".format(chrom, found, len(rows)))
+    return (samples, gts)
+
+def project_samples(model_path, vcfs, out_prefix):
+    """Writes <out_prefix>.pca.evec with the coordinates of the samples of
+    the chromosome VCFs (a {chrom : path} dict, with the chromosomes named
+    as in the VCFs) on the PCs of a model."""
+    model = PcaModel(model_path)
+    samples = None
+    coordinates = 0
+    for chrom in sorted(vcfs.keys(), key=natural_key):
+        rows = model.rows(chrom)
+        if not len(rows):
+            continue
+        (vcf_samples, gts) = vcf_dosages(vcfs[chrom], chrom, model, rows)
+        if samples is not None and vcf_samples != samples:
+            raise ValueError('{} does not have the samples of the other VCFs'.format(vcfs[chrom]))
+        samples = vcf_samples
+        coordinates = coordinates + model.project(rows, gts)
+
+    if samples is None:
+        raise ValueError('none of the VCF chromosomes are in the model')
+    ensure_directory(os.path.dirname(os.path.abspath(out_prefix)))
+    write_evec('.'.join([out_prefix, 'pca', 'evec']), samples, model.eigenvalues, coordinates)
+    return (samples, coordinates)
+
+def write_evec(path, samples, eigenvalues, eigenvectors, phenotype='Control'):
+    # the smartpca layout: a '#eigvals:' header, then a line per sample with
+    # its coordinates and phenotype
+    with open(path, 'w') as f:
+        header = ''.join('{:>10.3f}'.format(v) for v in eigenvalues)
+        print('{:>20}{}'.format('#eigvals:', header), file=f)
+        for (sample, row) in zip(samples, eigenvectors):
+            values = ''.join('{:>10.4f}'.format(v) for v in row)
+            print('{:>20}{}{:>14}'.format(sample, values, phenotype), file=f)
+
+def write_eval(path, eigenvalues):
+    with open(path, 'w') as f:
+        for v in eigenvalues:
+            print('{:>12.6f}'.format(v), file=f)
+
+def run_pca(prefixes, out_prefix, k=10, iterations=4, threads=1, seed=0):
+    """Writes <out_prefix>.pca.evec and <out_prefix>.eval, as smartpca
+    would for 'smartpca.perl -o <out_prefix>.pca -e <out_prefix>.eval', and
+    the model for projecting other samples to <out_prefix>.pca.model.npz."""
+    matrix = GenotypeMatrix(prefixes)
+    log("{} samples x {} variants in {} blocks".format(matrix.n_samples, matrix.n_variants, len(matrix.blocks)))
+    (eigenvalues, eigenvectors) = randomized_pca(matrix, k, iterations=iterations, threads=threads, seed=seed)
+
+    ensure_directory(os.path.dirname(os.path.abspath(out_prefix)))
+    write_evec('.'.join([out_prefix, 'pca', 'evec']), matrix.samples, eigenvalues, eigenvectors)
+    write_eval('.'.join([out_prefix, 'eval']), eigenvalues)
+    save_model('.'.join([out_prefix, 'pca', 'model', 'npz']), matrix, eigenvalues, eigenvectors, threads)
+    return (eigenvalues, eigenvectors)
+
+# Command Line ################################################################
+@click.group()
+def cli():
+    pass
+
+@cli.command()
+@click.option('--bfile-list', required=True, type=click.Path(exists=True),
+              help='a file of plink binary prefixes (e.g. one per chromosome), one per line')
+@click.option('--out-prefix', required=True, type=click.STRING,
+              help='the prefix of the .pca.evec and .eval outputs')
+@click.option('--k', default=10, type=click.IntRange(min=1),
+              help='the number of principal components [default=10]')
+@click.option('--iterations', default=4, type=click.IntRange(min=0),
+              help='the number of power iterations [default=4]')
+@click.option('--threads', default=1, type=click.IntRange(min=1),
+              help='the number of blocks to process at a time [default=1]')
+@click.option('--seed', default=0, type=click.INT,
+              help='the random seed [default=0]')
+def run(bfile_list, out_prefix, k, iterations, threads, seed):
+    """Computes the top principal components of the samples."""
+    run_pca(read_bfile_list(bfile_list), out_prefix, k, iterations, threads, seed)
+
+@cli.command()
+@click.option('--model', required=True, type=click.Path(exists=True),
+              help='the .pca.model.npz of a previous run')
+@click.option('--input-vcfs', required=True, type=click.Path(exists=True),
+              help='a tsv of <chrom> and indexed VCF lines with the samples to project')
+@click.option('--out-prefix', required=True, type=click.STRING,
+              help='the prefix of the .pca.evec output')
+def project(model, input_vcfs, out_prefix):
+    """Projects the samples of VCFs onto the PCs of a previous run."""
+    with open(input_vcfs, 'r') as f:
+        vcfs = dict( tuple(line.rstrip().split("\t")) for line in f if line.strip() )
+    project_samples(model, vcfs, out_prefix)
+
+if __name__ == '__main__':
+    cli()
@@ -1,19 +1,31 @@
 from __future__ import print_function, division
 
-import os, sys, pwd, json
+import os, sys, pwd, json, math
 import pkg_resources
 from cosmos.api import Cosmos, Dependency, default_get_submit_args
 from yaps2.utils import to_json, merge_params, natural_key, ensure_directory
+from yaps2.telemetry import telemetry_cmd_wrapper
+from yaps2.retry import OOMRetryPolicy
+from yaps2.drm_lsf import BatchedJobManager
+from yaps2.lsf import set_memory, set_cores, set_tmp
 
 class Config(object):
     def __init__(self, job_db,
-                 input_json_sample_bams, project_name, email, workspace, drm_job_group):
+                 input_json_sample_bams, project_name, email, workspace, drm_job_group,
+                 scatter=False, local_scratch=False, keep_intermediates=False):
         self.email = email
         self.db = job_db
         self.project_name = project_name
         self.rootdir = workspace
         self.input_json_sample_bams = input_json_sample_bams
         self.drm_job_group = drm_job_group
+        self.scatter = scatter
+
+        # stage temporaries on node-local scratch, optionally kept for debugging
+        self.local_scratch = local_scratch
+        self.intermediates_dir = None
+        if keep_intermediates:
+            self.intermediates_dir = os.path.join(os.path.abspath(self.rootdir), 'intermediates')
 
         self.ensure_rootdir()
 
@@ -27,6 +39,7 @@ class Config(object):
             )
 
         self.sample_data = self.collect_sample_data()
+        self.bam_sizes = self.stat_input_bams()
 
     def ensure_rootdir(self):
         if not os.path.exists(self.rootdir):
@@ -59,6 +72,17 @@ class Config(object):
             d = json.load(json_data)
         return d
 
+    def stat_input_bams(self):
+        return { path : os.path.getsize(path)
+                 for sample in self.sample_data.values() for path in sample['bams'] }
+
+    def sample_bytes(self, sample_id):
+        return sum(self.bam_sizes[path] for path in self.sample_data[sample_id]['bams'])
+
+    def samples_by_size(self):
+        # the largest samples first (see submit_priority)
+        return sorted(self.sample_data.keys(), key=lambda s: (-self.sample_bytes(s), s))
+
 class Pipeline(object):
     def __init__(self, config, drm, restart):
         self.config = config
@@ -92,12 +116,33 @@ class Pipeline(object):
 	# put set_successful to False if you intend to add more tasks to the
 	# pipeline later
         custom_log_dir = lambda task : os.path.join(self.config.rootdir, 'logs', task.stage.name, task.uid)
-        self.workflow.run(set_successful=False, log_out_dir_func=custom_log_dir)
+        # resubmit tasks killed for exceeding their memory limit with more memory
+        OOMRetryPolicy().install()
+        cmd_wrapper = telemetry_cmd_wrapper(self.config.db, self.config.local_scratch, self.config.intermediates_dir)
+        # submit LSF jobs concurrently, and poll them with one bjobs call per interval
+        self.workflow.jobmanager = BatchedJobManager(
+            get_submit_args=default_get_submit_args,
+            log_out_dir_func=custom_log_dir,
+            cmd_wrapper=cmd_wrapper,
+            # the largest inputs are submitted first
+            priority=submit_priority,
+        )
+        self.workflow.run(
+            set_successful=False,
+            log_out_dir_func=custom_log_dir,
+            cmd_wrapper=cmd_wrapper,
+        )
 
     def construct_pipeline(self):
-        speedseq_tasks = self.create_speedseq_realign_tasks()
+        if self.config.scatter:
+            speedseq_tasks = self.create_speedseq_realign_part_tasks()
+            gather_tasks = self.create_gather_realigned_bams_tasks(speedseq_tasks)
+        else:
+            speedseq_tasks = self.create_speedseq_realign_tasks()
 
-    def create_speedseq_realign_tasks(self):
+    def create_speedseq_realign_part_tasks(self):
+        # every input BAM of a sample is realigned on its own, so that a
+        # sample is spread over several nodes
         tasks = []
         stage = '1-exec-speedseq-realign'
         basedir = os.path.join(self.config.rootdir, stage)
@@ -105,12 +150,87 @@ class Pipeline(object):
         lsf_job_group = self.config.drm_job_group
         sample_data = self.config.sample_data
 
+        parts = []
         for sample_id in sample_data.keys():
+            for (i, bam_path) in enumerate(sample_data[sample_id]['bams']):
+                parts.append((sample_id, 'part{}'.format(i + 1), bam_path))
+        parts.sort(key=lambda p: (-self.config.bam_sizes[p[2]], p[0], p[1]))
+
+        for (sample_id, part, bam_path) in parts:
+            output_prefix = os.path.join(basedir, sample_id, part, "{}.{}.b38.realign".format(sample_id, part))
+            tmpdir = os.path.join(basedir, sample_id, part, 'tmpdir')
+            lsf_params = exec_speedseq_lsf_params(email, lsf_job_group, self.config.bam_sizes[bam_path])
+
+            task = {
+                'func'   : exec_speedseq,
+                'params' : {
+                    'output_prefix' : output_prefix,
+                    'tmpdir' : tmpdir,
+                    'input_bams' : bam_path,
+                    'threads' : lsf_params['n'],
+                    'sample_id' : sample_id,
+                    'input_bytes' : self.config.bam_sizes[bam_path],
+                },
+                'stage_name' : stage,
+                'uid' : '{}:{}'.format(sample_id, part),
+                'drm_params' : to_json(lsf_params),
+            }
+            tasks.append( self.workflow.add_task(**task) )
+
+        return tasks
+
+    def create_gather_realigned_bams_tasks(self, parent_tasks):
+        tasks = []
+        stage = '2-gather-realigned-bams'
+        basedir = os.path.join(self.config.rootdir, stage)
+        email = self.config.email
+        lsf_job_group = self.config.drm_job_group
+
+        parts = {}
+        for ptask in parent_tasks:
+            parts.setdefault(ptask.params['sample_id'], []).append(ptask)
+
+        for sample_id in self.config.samples_by_size():
+            if sample_id not in parts:
+                continue
+            ptasks = sorted(parts[sample_id], key=lambda t: t.id)
+            output_prefix = os.path.join(basedir, sample_id, "{}.b38.realign".format(sample_id))
+            tmpdir = os.path.join(basedir, sample_id, 'tmpdir')
+
+            task = {
+                'func'   : gather_realigned_bams,
+                'params' : {
+                    'output_prefix' : output_prefix,
+                    'tmpdir' : tmpdir,
+                    'part_prefixes' : ' '.join(t.params['output_prefix'] for t in ptasks),
+                    'input_bytes' : self.config.sample_bytes(sample_id),
+                },
+                'stage_name' : stage,
+                'uid' : sample_id,
+                'drm_params' :
+                    to_json(gather_realigned_bams_lsf_params(email, lsf_job_group,
+                                                             self.config.sample_bytes(sample_id))),
+                'parents' : ptasks,
+            }
+            tasks.append( self.workflow.add_task(**task) )
+
+        return tasks
+
+    def create_speedseq_realign_tasks(self):
+        tasks = []
+        stage = '1-exec-speedseq-realign'
+        basedir = os.path.join(self.config.rootdir, stage)
+        email = self.config.email
+        lsf_job_group = self.config.drm_job_group
+        sample_data = self.config.sample_data
+
+        for sample_id in self.config.samples_by_size():
             bam_paths = sample_data[sample_id]['bams']
             sample_name = sample_data[sample_id]['meta']['original-name']
             output_prefix = os.path.join(basedir, sample_id, "{}.b38.realign".format(sample_id))
             tmpdir = os.path.join(basedir, sample_id, 'tmpdir')
             input_bams = ' '.join(bam_paths)
+            lsf_params = exec_speedseq_lsf_params(email, lsf_job_group, self.config.sample_bytes(sample_id))
 
             task = {
                 'func'   : exec_speedseq,
@@ -118,11 +238,12 @@ class Pipeline(object):
                     'output_prefix' : output_prefix,
                     'tmpdir' : tmpdir,
                     'input_bams' : input_bams,
+                    'threads' : lsf_params['n'],
+                    'input_bytes' : self.config.sample_bytes(sample_id),
                 },
                 'stage_name' : stage,
                 'uid' : sample_id,
-                'drm_params' :
-                    to_json(exec_speedseq_lsf_params(email, lsf_job_group)),
+                'drm_params' : to_json(lsf_params),
             }
             tasks.append( self.workflow.add_task(**task) )
 
@@ -132,6 +253,7 @@ def exec_speedseq(output_prefix, tmpdir, input_bams, **kwargs):
     args = locals()
     default = {
         'script' : pkg_resources.resource_filename('yaps2', 'resources/b38/speedseq-realign.sh'),
+        'threads' : 8,
         # build 38
         'reference' : os.path.join(
             '/gscmnt/gc2802/halllab/ccdg_resources/genomes',
@@ -141,12 +263,40 @@ def exec_speedseq(output_prefix, tmpdir, input_bams, **kwargs):
 
     cmd_args = merge_params(default, args)
 
-    cmd = ("{script} {output_prefix} {tmpdir} {reference} {input_bams}").format(**cmd_args)
+    cmd = ("{script} {output_prefix} {tmpdir} {reference} {threads} {input_bams}").format(**cmd_args)
 
     return cmd
 
-def exec_speedseq_lsf_params(email, job_group):
-    return  {
+def submit_priority(task):
+    # the largest samples (or parts) are submitted first, so that they don't
+    # end up as the long tail of a run; cosmos hands the ready tasks to the
+    # job manager in no given order
+    return task.params.get('input_bytes', 0)
+
+def lsf_user_priority(input_bytes):
+    """The LSF user priority (bsub -sp) of a job with input_bytes of BAMs:
+    1 per 2 GB, from 1 up to LSF's default MAX_USER_PRIORITY of 100, so that
+    LSF dispatches the larger jobs first whatever order they were
+    submitted in."""
+    return min(max(int(input_bytes / 2e9), 1), 100)
+
+def realign_resources(input_bytes):
+    """The cores, memory (MB) and local tmp space (MB) to realign a sample
+    (or part of one) from input_bytes of BAMs.
+
+    The BAM size stands in for the number of bases, which would take a pass
+    over the BAMs to count.  Cores grow with the input to bound the wall
+    clock, memory covers the bwa index plus the per-thread buffers and the
+    sort, and tmp holds the interleaved FASTQ and the sort spills.
+    """
+    input_gb = input_bytes / 1e9
+    cores = min(max(int(math.ceil(input_gb / 12.5)), 4), 16)
+    mem_mb = 12000 + 4000 * cores
+    tmp_mb = int(math.ceil(3 * input_bytes / 1e6))
+    return (cores, mem_mb, tmp_mb)
+
+def exec_speedseq_lsf_params(email, job_group, input_bytes=None):
+    params = {
         'g' : job_group,
         'u' : email,
         'N' : None,
@@ -155,3 +305,41 @@ def exec_speedseq_lsf_params(email, job_group):
         'R' : 'select[mem>45000] rusage[mem=48000] span[hosts=1]',
         'n' : 8
     }
+    if input_bytes is None:
+        return params
+
+    (cores, mem_mb, tmp_mb) = realign_resources(input_bytes)
+    params = set_memory(params, mem_mb)
+    params = set_cores(params, cores)
+    params['sp'] = lsf_user_priority(input_bytes)
+    return set_tmp(params, tmp_mb)
+
+def gather_realigned_bams(output_prefix, tmpdir, part_prefixes, **kwargs):
+    args = locals()
+    default = {
+        'script' : pkg_resources.resource_filename('yaps2', 'resources/b38/gather-realigned-bams.sh'),
+        'threads' : 4,
+    }
+
+    cmd_args = merge_params(default, args)
+
+    cmd = ("{script} {output_prefix} {tmpdir} {threads} {part_prefixes}").format(**cmd_args)
+
+    return cmd
+
+def gather_realigned_bams_lsf_params(email, job_group, input_bytes=None):
+    params = {
+        'g' : job_group,
+        'u' : email,
+        'N' : None,
+        'q' : "long",
+        'M' : 16000000, # 16_000_000 (16 GB)
+        'R' : 'select[mem>16000] rusage[mem=16000] span[hosts=1]',
+        'n' : 4
+    }
+    if input_bytes is None:
+        return params
+
+    params['sp'] = lsf_user_priority(input_bytes)
+    # the merged BAM and the duplicate marking spills
+    return set_tmp(params, int(math.ceil(2 * input_bytes / 1e6)))
@@ -0,0 +1,147 @@
+from __future__ import print_function, division
+
+import os, sys, pwd
+from cosmos.api import Cosmos, Dependency, default_get_submit_args
+from yaps2.utils import to_json, merge_params, natural_key, ensure_directory
+from yaps2.telemetry import telemetry_cmd_wrapper
+from yaps2.retry import OOMRetryPolicy
+from yaps2.drm_lsf import BatchedJobManager
+
+class Config(object):
+    def __init__(self, job_db, input_vcfs_file, project_name, email, workspace):
+        self.email = email
+        self.db = job_db
+        self.project_name = project_name
+        self.rootdir = workspace
+
+        self.ensure_rootdir()
+
+        if self.email is None:
+            self.email = self.setup_email()
+
+        if self.db is None:
+            self.db = os.path.join(
+                os.path.abspath(self.rootdir),
+                '.job_queue.db'
+            )
+
+        self.vcfs = self.collect_input_vcfs(input_vcfs_file)
+        self.chroms = self.get_ordered_chroms()
+
+    def ensure_rootdir(self):
+        if not os.path.exists(self.rootdir):
+            os.makedirs(self.rootdir)
+
+    def setup_email(self):
+        user_id = pwd.getpwuid( os.getuid() ).pw_name
+        return '{}@genome.wustl.edu'.format(user_id)
+
+    def collect_input_vcfs(self, infile):
+        # expecting a tsv file of <chrom>\t<path-to-vcf-file> lines
+        with open(infile, 'r') as f:
+            vcfs = [ tuple(line.rstrip().split("\t")) for line in f ]
+        return dict(vcfs)
+
+    def get_ordered_chroms(self):
+        chroms = sorted(self.vcfs.keys(), key=natural_key)
+        return chroms
+
+class Pipeline(object):
+    def __init__(self, config, drm, restart):
+        self.config = config
+
+        self.cosmos = Cosmos(
+            database_url='sqlite:///{}'.format(self.config.db),
+            get_submit_args=default_get_submit_args,
+            default_drm=drm
+        )
+
+        self.cosmos.initdb()
+
+        primary_logfile = os.path.join(
+            self.config.rootdir,
+            '{}.log'.format(self.config.project_name),
+        )
+
+        self.workflow = self.cosmos.start(
+            self.config.project_name,
+            primary_log_path=primary_logfile,
+            restart=restart,
+        )
+
+        self.setup_pipeline()
+
+    def setup_pipeline(self):
+        self.construct_pipeline()
+        self.workflow.make_output_dirs()
+
+    def run(self):
+	# put set_successful to False if you intend to add more tasks to the
+	# pipeline later
+        custom_log_dir = lambda task : os.path.join(self.config.rootdir, 'logs', task.stage.name, task.uid)
+        # resubmit tasks killed for exceeding their memory limit with more memory
+        OOMRetryPolicy().install()
+        cmd_wrapper = telemetry_cmd_wrapper(self.config.db)
+        # submit LSF jobs concurrently, and poll them with one bjobs call per interval
+        self.workflow.jobmanager = BatchedJobManager(
+            get_submit_args=default_get_submit_args,
+            log_out_dir_func=custom_log_dir,
+            cmd_wrapper=cmd_wrapper,
+        )
+        self.workflow.run(
+            set_successful=False,
+            log_out_dir_func=custom_log_dir,
+            cmd_wrapper=cmd_wrapper,
+        )
+
+    def construct_pipeline(self):
+        ingest_tasks = self.create_ingest_tasks()
+
+    def create_ingest_tasks(self):
+        # the store is read by later analyses as
+        # yaps2.ingest.GenotypeStore('<workspace>/1-ingest')
+        tasks = []
+        stage = '1-ingest'
+        basedir = os.path.join(self.config.rootdir, stage)
+        email = self.config.email
+
+        for chrom in self.config.chroms:
+            task = {
+                'func' : ingest_vcf,
+                'params' : {
+                    'in_vcf' : self.config.vcfs[chrom],
+                    'in_chrom' : chrom,
+                    'out_dir' : basedir,
+                },
+                'stage_name' : stage,
+                'uid' : chrom,
+                'drm_params' :
+                    to_json(ingest_vcf_lsf_params(email)),
+            }
+            tasks.append( self.workflow.add_task(**task) )
+
+        return tasks
+
+def ingest_vcf(in_vcf, in_chrom, out_dir):
+    args = locals()
+    default = {
+        'python' : sys.executable,
+    }
+
+    cmd_args = merge_params(default, args)
+
+    cmd = ( "{python} -m yaps2.ingest "
+            "--vcf {in_vcf} "
+            "--chrom {in_chrom} "
+            "--out-dir {out_dir}" ).format(**cmd_args)
+
+    return cmd
+
+def ingest_vcf_lsf_params(email):
+    return  {
+        'u' : email,
+        'N' : None,
+        'q' : "long",
+        'M' : 8000000,
+        'R' : 'select[mem>8000] rusage[mem=8000]',
+    }
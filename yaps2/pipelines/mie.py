@@ -1,18 +1,25 @@
-import os, pwd
-import pkg_resources
+import os, sys, pwd, json
 from cosmos.api import Cosmos, Dependency, default_get_submit_args
 from yaps2.utils import to_json, merge_params, natural_key, ensure_directory
+from yaps2.telemetry import telemetry_cmd_wrapper
+from yaps2.retry import OOMRetryPolicy
+from yaps2.drm_lsf import BatchedJobManager
+from yaps2.bundle import Bundler, resolve_parents
 
 class Config(object):
     def __init__(self, job_db, input_vcfs_file,
                        percentiles_file, samples_file, tranches_file, plink_fam_file,
-                       project_name, email, workspace):
+                       project_name, email, workspace,
+                       bundle_size=1, bundle_parallel=1, job_arrays=False):
         self.email = email
         self.db = job_db
         self.project_name = project_name
         self.rootdir = workspace
         self.control_samples_file = samples_file
         self.plink_fam_file = plink_fam_file
+        self.bundle_size = bundle_size
+        self.bundle_parallel = bundle_parallel
+        self.job_arrays = job_arrays
 
         self.ensure_rootdir()
 
@@ -74,6 +81,26 @@ class Config(object):
             percentiles = { int(x[1]) : ( float(x[2]), float(x[3]) ) for x in rawdata if x[0] == category }
             self.percentiles[category] = percentiles
 
+    def vqslod_bins(self):
+        # tranches are [min, max) intervals, percentiles are (min, max]
+        bins = []
+        for category in ('snps', 'indels'):
+            methods = (
+                ('tranche', self.tranche_intervals[category]),
+                ('percentile', self.percentiles[category]),
+            )
+            for (method, intervals) in methods:
+                for label in sorted(intervals.keys()):
+                    (min_vqslod, max_vqslod) = intervals[label]
+                    bins.append({
+                        'category' : category,
+                        'method' : method,
+                        'label' : str(label),
+                        'min' : min_vqslod,
+                        'max' : max_vqslod,
+                    })
+        return bins
+
     def collect_input_vcfs(self, infile):
         # expecting a tsv file of <chrom>\t<path-to-vcf-file> lines
         with open(infile, 'r') as f:
@@ -107,6 +134,18 @@ class Pipeline(object):
             restart=restart,
         )
 
+        self.bundler = Bundler(
+            self.workflow,
+            self.config.rootdir,
+            self.config.project_name,
+            size=self.config.bundle_size,
+            parallel=self.config.bundle_parallel,
+            array=self.config.job_arrays,
+            restart=restart,
+            # the bundled tasks are recorded like the tasks cosmos runs
+            telemetry_db=self.config.db,
+        )
+
         self.setup_pipeline()
 
     def setup_pipeline(self):
@@ -117,43 +156,41 @@ class Pipeline(object):
 	# put set_successful to False if you intend to add more tasks to the
 	# pipeline later
         custom_log_dir = lambda task : os.path.join(self.config.rootdir, 'logs', task.stage.name, task.uid)
-        self.workflow.run(set_successful=False, log_out_dir_func=custom_log_dir)
+        # resubmit tasks killed for exceeding their memory limit with more memory
+        OOMRetryPolicy().install()
+        cmd_wrapper = telemetry_cmd_wrapper(self.config.db)
+        # submit LSF jobs concurrently, and poll them with one bjobs call per interval
+        self.workflow.jobmanager = BatchedJobManager(
+            get_submit_args=default_get_submit_args,
+            log_out_dir_func=custom_log_dir,
+            cmd_wrapper=cmd_wrapper,
+        )
+        self.workflow.run(
+            set_successful=False,
+            log_out_dir_func=custom_log_dir,
+            cmd_wrapper=cmd_wrapper,
+        )
 
     def construct_pipeline(self):
-        partition_tasks = self.create_vcf_partition_tasks()
-        plink_pipeline_tasks = self.create_plink_pipeline_tasks(partition_tasks)
-        aggregate_mie_stats_tasks = self.create_aggregate_mie_stats_tasks(plink_pipeline_tasks)
+        mie_count_tasks = self.create_mie_count_tasks()
+        aggregate_mie_stats_tasks = self.create_aggregate_mie_stats_tasks(mie_count_tasks)
 
     def create_aggregate_mie_stats_tasks(self, parent_tasks):
         tasks = []
-        stage = '3-aggregate-mie-stats'
+        stage = '2-aggregate-mie-stats'
         basedir = os.path.join(self.config.rootdir, stage)
         email = self.config.email
 
-        input_dir = os.path.join(self.config.rootdir, parent_tasks[0].stage.name)
-
-        parent_snp_tranche_tasks = \
-            [task for task in parent_tasks \
-                  if (task.params['type'] == 'snps' and task.params['method'] == 'tranche') ]
+        results_db = parent_tasks[0].params['out_db']
 
-        parent_snp_percentile_tasks = \
-            [task for task in parent_tasks \
-                  if (task.params['type'] == 'snps' and task.params['method'] == 'percentile') ]
-
-        parent_indel_tranche_tasks = \
-            [task for task in parent_tasks \
-                  if (task.params['type'] == 'indels' and task.params['method'] == 'tranche') ]
-
-        parent_indel_percentile_tasks = \
-            [task for task in parent_tasks \
-                  if (task.params['type'] == 'indels' and task.params['method'] == 'percentile') ]
-
-        task_groups = (parent_snp_tranche_tasks, parent_snp_percentile_tasks,
-                       parent_indel_tranche_tasks, parent_indel_percentile_tasks)
+        cases = (
+            ('snps', 'tranche'),
+            ('snps', 'percentile'),
+            ('indels', 'tranche'),
+            ('indels', 'percentile'),
+        )
 
-        for tgroup in task_groups:
-            category = tgroup[0].params['type']
-            method = tgroup[0].params['method']
+        for (category, method) in cases:
             out_filename = '.'.join([category, method, 'tsv'])
             output_file = os.path.join(basedir, out_filename)
             task = {
@@ -161,7 +198,7 @@ class Pipeline(object):
                 'params' : {
                     'in_category' : category,
                     'in_method' : method,
-                    'in_dir' : input_dir,
+                    'in_db' : results_db,
                     'out_file' : output_file,
                 },
                 'stage_name' : stage,
@@ -170,158 +207,68 @@ class Pipeline(object):
                 ),
                 'drm_params' :
                     to_json(aggregate_mie_statistics_lsf_params(email)),
-                'parents' : tgroup,
+                'parents' : resolve_parents(parent_tasks),
             }
             tasks.append( self.workflow.add_task(**task) )
 
-    def create_plink_pipeline_tasks(self, parent_tasks):
+    def create_mie_count_tasks(self):
+        # every chromosome VCF is read once, and its records sorted into all
+        # the tranche and percentile bins of both categories
         tasks = []
-        stage = '2-plink-pipeline'
+        stage = '1-mie-counts'
         basedir = os.path.join(self.config.rootdir, stage)
         email = self.config.email
 
-        for ptask in sorted(parent_tasks, key=lambda t: t.id):
-            chrom = ptask.params['in_chrom']
-            label = ptask.params['in_label']
-            method = ptask.params['in_method']
-            category = ptask.params['in_type']
-
-            output_dir = os.path.join(basedir, category, method, label, chrom)
-#            ensure_directory(output_dir)
-
-            task = {
-                'func' : plink_pipeline,
-                'params' : {
-                    'in_vcf' : ptask.params['out_vcf'],
-                    'in_trio_fam' : self.config.plink_fam_file,
-                    'chrom' : chrom,
-                    'type' : category,
-                    'method' : method,
-                    'chrom' : chrom,
-                    'label' : label,
-                    'out_dir' : output_dir,
-                },
-                'stage_name' : stage,
-                'uid' : '{category}:{method}:{label}:{chrom}'.format(
-                    chrom=chrom, method=method, category=category, label=label
-                ),
-                'drm_params' :
-                    to_json(plink_pipeline_lsf_params(email)),
-                'parents' : [ptask],
-            }
-            tasks.append( self.workflow.add_task(**task) )
-
-        return tasks
-
-    def create_vcf_partition_tasks(self):
-        all_tasks = []
-        cases = (
-            ('tranche', 'snps', self.config.tranche_intervals['snps']),
-            ('tranche', 'indels', self.config.tranche_intervals['indels']),
-            ('percentile', 'snps', self.config.percentiles['snps']),
-            ('percentile', 'indels', self.config.percentiles['indels']),
-        )
-
-        for case in cases:
-            tasks = self.generate_vcf_partition_tasks(*case)
-            all_tasks.extend( tasks )
-
-        return all_tasks
-
-    def generate_vcf_partition_tasks(self, method, category, intervals):
-        # method: 'tranche' or 'percentile'
-        # category: 'snps' or 'indels'
-        # label: 
-        #     tranche : 1, 2 or 3
-        #     percentile : 10, 20, 30, 40, 50, 60, 70, 80, 90, 100
-        tasks = []
-        for label in sorted(intervals.keys()) :
-            interval = intervals[label]
-            partition_tasks = self.create_vcf_partition_chromosome_tasks(
-                method=method,
-                label=str(label),
-                category=category,
-                interval=interval,
-            )
-            tasks.extend(partition_tasks)
-
-        return tasks
-
-    def create_vcf_partition_chromosome_tasks(self, method, label, category, interval):
-        tasks = []
-        stage = '1-partition-vcfs'
-        basedir = os.path.join(self.config.rootdir, stage, category, method, label)
-        email = self.config.email
+        bins_file = os.path.join(basedir, 'bins.json')
+        ensure_directory(basedir)
+        with open(bins_file, 'w') as f:
+            json.dump(self.config.vqslod_bins(), f, indent=2)
 
         for chrom in self.config.chroms:
-            vcf = self.config.vcfs[chrom]
-            output_vcf = 'selected.c{chrom}.vcf.gz'.format(chrom=chrom)
             task = {
-                'func'   : vcf_partition,
+                'func' : mie_counts,
                 'params' : {
-                    'in_vcf' : vcf,
-                    'out_vcf' : os.path.join(basedir, chrom, output_vcf),
-                    'in_min_vqslod' : interval[0],
-                    'in_max_vqslod' : interval[1],
+                    'in_vcf' : self.config.vcfs[chrom],
+                    'in_trio_fam' : self.config.plink_fam_file,
+                    'in_bins' : bins_file,
                     'in_samples' : self.config.control_samples_file,
-                    'in_type': category,
-                    'in_method': method,
                     'in_chrom' : chrom,
-                    'in_label' : label,
+                    'out_db' : os.path.join(basedir, 'mie.db'),
+                    'out_dir' : basedir,
                 },
                 'stage_name' : stage,
-                'uid' : '{category}:{method}:{label}:{chrom}'.format(
-                    chrom=chrom, method=method, category=category, label=label
-                ),
+                'uid' : chrom,
                 'drm_params' :
-                    to_json(vcf_partition_lsf_params(email)),
+                    to_json(mie_counts_lsf_params(email)),
             }
-            tasks.append( self.workflow.add_task(**task) )
-
-        return tasks
+            tasks.append(task)
 
-def vcf_partition(in_vcf, out_vcf, in_min_vqslod, in_max_vqslod, in_samples, in_type, in_method, in_chrom, in_label):
-    args = locals()
-    default = {
-        'script' : pkg_resources.resource_filename('yaps2', 'resources/mie/vcf-partition.sh'),
-    }
-
-    cmd_args = merge_params(default, args)
-
-    cmd = ( "{script} {in_vcf} {out_vcf} "
-            "{in_min_vqslod} "
-            "{in_max_vqslod} "
-            "{in_samples} "
-            "{in_type} "
-            "{in_method}").format(**cmd_args)
-
-    return cmd
-
-def vcf_partition_lsf_params(email):
-    return  {
-        'u' : email,
-        'N' : None,
-        'q' : "long",
-        'M' : 8000000,
-        'R' : 'select[mem>8000] rusage[mem=8000]',
-    }
+        return self.bundler.add_tasks(
+            stage,
+            tasks,
+            mie_counts_lsf_params(email),
+        )
 
-def plink_pipeline(in_vcf, in_trio_fam, out_dir, **kwargs):
+def mie_counts(in_vcf, in_trio_fam, in_bins, in_samples, in_chrom, out_db, out_dir):
     args = locals()
     default = {
-        'script' : pkg_resources.resource_filename('yaps2', 'resources/mie/plink.mk'),
+        'python' : sys.executable,
     }
 
     cmd_args = merge_params(default, args)
 
-    cmd = ( "make -f {script} "
-            "INPUT_VCF={in_vcf} "
-            "TRIO_FAM={in_trio_fam} "
-            "PRJ_DIR={out_dir}" ).format(**cmd_args)
+    cmd = ( "{python} -m yaps2.mendel bins "
+            "--vcf {in_vcf} "
+            "--fam {in_trio_fam} "
+            "--bins {in_bins} "
+            "--samples {in_samples} "
+            "--chrom {in_chrom} "
+            "--db {out_db} "
+            "--out-dir {out_dir}" ).format(**cmd_args)
 
     return cmd
 
-def plink_pipeline_lsf_params(email):
+def mie_counts_lsf_params(email):
     return  {
         'u' : email,
         'N' : None,
@@ -330,16 +277,16 @@ def plink_pipeline_lsf_params(email):
         'R' : 'select[mem>8000] rusage[mem=8000]',
     }
 
-def aggregate_mie_statistics(in_category, in_method, in_dir, out_file):
+def aggregate_mie_statistics(in_category, in_method, in_db, out_file):
     args = locals()
     default = {
-        'script' : pkg_resources.resource_filename('yaps2', 'resources/mie/aggregate-mie-statistics.py'),
+        'python' : sys.executable,
     }
 
     cmd_args = merge_params(default, args)
 
-    cmd = ( "{script} "
-            "--input-dir={in_dir} "
+    cmd = ( "{python} -m yaps2.mendel aggregate "
+            "--db={in_db} "
             "--output-file={out_file} "
             "--category={in_category} "
             "--method={in_method}" ).format(**cmd_args)
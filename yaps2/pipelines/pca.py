@@ -4,15 +4,25 @@ import os, sys, pwd
 import pkg_resources
 from cosmos.api import Cosmos, Dependency, default_get_submit_args
 from yaps2.utils import to_json, merge_params, natural_key, ensure_directory
+from yaps2.telemetry import telemetry_cmd_wrapper
+from yaps2.retry import OOMRetryPolicy
+from yaps2.drm_lsf import BatchedJobManager
 
 class Config(object):
     def __init__(self, job_db, 
-                 input_vcfs_file, project_name, email, workspace, vqslod_threshold):
+                 input_vcfs_file, project_name, email, workspace, vqslod_threshold,
+                 pca_engine='yaps2', projection_model=None):
         self.email = email
         self.db = job_db
         self.project_name = project_name
         self.rootdir = workspace
         self.vqslod_threshold = vqslod_threshold
+        self.pca_engine = pca_engine
+        self.projection_model = projection_model
+        self.input_vcfs_file = os.path.abspath(input_vcfs_file)
+
+        if self.projection_model is None and self.vqslod_threshold is None:
+            sys.exit("Please specify a --vqslod-threshold")
 
         self.ensure_rootdir()
 
@@ -90,19 +100,39 @@ class Pipeline(object):
 	# put set_successful to False if you intend to add more tasks to the
 	# pipeline later
         custom_log_dir = lambda task : os.path.join(self.config.rootdir, 'logs', task.stage.name, task.uid)
-        self.workflow.run(set_successful=False, log_out_dir_func=custom_log_dir)
+        # resubmit tasks killed for exceeding their memory limit with more memory
+        OOMRetryPolicy().install()
+        cmd_wrapper = telemetry_cmd_wrapper(self.config.db)
+        # submit LSF jobs concurrently, and poll them with one bjobs call per interval
+        self.workflow.jobmanager = BatchedJobManager(
+            get_submit_args=default_get_submit_args,
+            log_out_dir_func=custom_log_dir,
+            cmd_wrapper=cmd_wrapper,
+        )
+        self.workflow.run(
+            set_successful=False,
+            log_out_dir_func=custom_log_dir,
+            cmd_wrapper=cmd_wrapper,
+        )
 
     def construct_pipeline(self):
+        if self.config.projection_model is not None:
+            project_task = self.create_project_samples_task()
+            data_frame_task = self.create_data_frame_task(project_task, '2-make-data-frame')
+            return
+
         filter_biallelic_snps_tasks = self.create_filter_biallelic_snps_tasks()
         plink_binary_tasks = self.create_plink_binary_tasks(filter_biallelic_snps_tasks)
-        plink_ld_prune_tasks = self.create_plink_ld_prune_tasks(plink_binary_tasks)
-        plink_extract_prune_tasks = self.create_plink_extract_prune_tasks(plink_ld_prune_tasks)
-        plink_merge_prune_files_task = self.create_plink_merge_prune_file_task(plink_extract_prune_tasks)
-        eigenstrat_task = self.create_eigenstrat_smartpca_task(plink_merge_prune_files_task)
-        data_frame_task = self.create_data_frame_task(eigenstrat_task)
-
-    def create_data_frame_task(self, parent_task):
-        stage = '7-make-data-frame'
+        ld_prune_tasks = self.create_ld_prune_tasks(plink_binary_tasks)
+        if self.config.pca_engine == 'smartpca':
+            eigenstrat_merge_task = self.create_eigenstrat_merge_task(ld_prune_tasks)
+            eigenstrat_task = self.create_eigenstrat_smartpca_task(eigenstrat_merge_task)
+            data_frame_task = self.create_data_frame_task(eigenstrat_task, '6-make-data-frame')
+        else:
+            pca_task = self.create_yaps2_pca_task(ld_prune_tasks)
+            data_frame_task = self.create_data_frame_task(pca_task, '5-make-data-frame')
+
+    def create_data_frame_task(self, parent_task, stage):
         basedir = os.path.join(self.config.rootdir, stage)
         email = self.config.email
 
@@ -130,19 +160,71 @@ class Pipeline(object):
 
         return df_task
 
+    def create_project_samples_task(self):
+        # only the pruned variants of the model are looked up in the VCFs
+        stage = '1-project-samples'
+        basedir = os.path.join(self.config.rootdir, stage)
+        email = self.config.email
+
+        task = {
+            'func' : project_samples,
+            'params' : {
+                'in_model' : self.config.projection_model,
+                'in_vcfs_file' : self.config.input_vcfs_file,
+                'out_prj_dir' : basedir,
+            },
+            'stage_name' : stage,
+            'uid' : 'all-chroms',
+            'drm_params' :
+                to_json(project_samples_lsf_params(email)),
+        }
+
+        project_task = self.workflow.add_task(**task)
+
+        return project_task
+
+    def create_yaps2_pca_task(self, parent_tasks):
+        stage = '4-yaps2-pca'
+        basedir = os.path.join(self.config.rootdir, stage)
+        email = self.config.email
+
+        parent_tasks_sorted = sorted(parent_tasks, key=lambda t: t.id)
+
+        # the per-chromosome pruned binaries are read as they are, so there
+        # is no merge
+        bfile_list = os.path.join(basedir, 'allfiles.txt')
+        self._create_merge_list(bfile_list, parent_tasks_sorted)
+
+        task = {
+            'func' : yaps2_pca,
+            'params' : {
+                'in_bfile_list' : bfile_list,
+                'out_prj_dir' : basedir,
+            },
+            'stage_name' : stage,
+            'uid' : 'all-chroms',
+            'drm_params' :
+                to_json(yaps2_pca_lsf_params(email)),
+            'parents' : parent_tasks_sorted,
+        }
+
+        pca_task = self.workflow.add_task(**task)
+
+        return pca_task
+
     def create_eigenstrat_smartpca_task(self, parent_task):
-        stage = '6-eigenstrat-smartpca'
+        stage = '5-eigenstrat-smartpca'
         basedir = os.path.join(self.config.rootdir, stage)
         email = self.config.email
 
-        ped_file = "{}.ped".format(parent_task.params['out_path'])
-        map_file = "{}.map".format(parent_task.params['out_path'])
+        prefix = parent_task.params['out_path']
 
         task = {
             'func' : eigenstrat_smartpca_analysis,
             'params' : {
-                'in_ped_file' : ped_file,
-                'in_map_file' : map_file,
+                'in_geno_file' : "{}.geno".format(prefix),
+                'in_snp_file' : "{}.snp".format(prefix),
+                'in_ind_file' : "{}.indiv".format(prefix),
                 'out_prj_dir' : basedir,
             },
             'stage_name' : stage,
@@ -156,32 +238,30 @@ class Pipeline(object):
 
         return eigenstrat_task
 
-    def create_plink_merge_prune_file_task(self, parent_tasks):
-        stage = '5-plink-merge-prune-files'
+    def create_eigenstrat_merge_task(self, parent_tasks):
+        # the pruned binaries are written straight to EIGENSTRAT files,
+        # without a text PED for convertf
+        stage = '4-eigenstrat-merge-pruned'
         basedir = os.path.join(self.config.rootdir, stage)
         email = self.config.email
 
         parent_tasks_sorted = sorted(parent_tasks, key=lambda t: t.id)
 
-        first_task = parent_tasks_sorted[0]
-        remaining_tasks = parent_tasks_sorted[1:]
-
-        merge_list_file = os.path.join(basedir, 'allfiles.txt')
-        self._create_merge_list(merge_list_file, remaining_tasks)
+        bfile_list = os.path.join(basedir, 'allfiles.txt')
+        self._create_merge_list(bfile_list, parent_tasks_sorted)
 
-        output_path = os.path.join(basedir, 'merged')
+        output_path = os.path.join(basedir, 'merged.eigenstrat')
 
         task = {
-            'func' : plink_merge_pruned_files,
+            'func' : eigenstrat_merge_pruned_files,
             'params' : {
-                'in_ref' : first_task.params['out_path'],
-                'in_merge_file' : merge_list_file,
+                'in_bfile_list' : bfile_list,
                 'out_path' : output_path,
             },
             'stage_name' : stage,
             'uid' : 'all-chroms',
             'drm_params' :
-                to_json(plink_merge_pruned_files_lsf_params(email)),
+                to_json(eigenstrat_merge_pruned_files_lsf_params(email)),
             'parents' : parent_tasks_sorted,
         }
 
@@ -189,55 +269,24 @@ class Pipeline(object):
 
         return merge_task
 
-
     def _create_merge_list(self, merge_file, tasks):
         ensure_directory(os.path.dirname(merge_file))
         with open(merge_file, 'w') as f:
             for t in tasks:
                 print(t.params['out_path'], file=f)
 
-    def create_plink_extract_prune_tasks(self, parent_tasks):
+    def create_ld_prune_tasks(self, parent_tasks):
         tasks = []
-        stage = '4-plink-extract-prune'
+        stage = '3-ld-prune'
         basedir = os.path.join(self.config.rootdir, stage)
         email = self.config.email
 
         for ptask in sorted(parent_tasks, key=lambda t: t.id):
-            plink_extract_file = "{}.prune.in".format(ptask.params['out_path'])
-            orig_binary_data = ptask.params['in_path']
             chrom = ptask.params['chrom']
             output_path = os.path.join(basedir, chrom, 'c{}.extracted'.format(chrom))
 
             task = {
-                'func' : plink_extract_prune,
-                'params' : {
-                    'in_path' : orig_binary_data,
-                    'in_extract' : plink_extract_file,
-                    'out_path' : output_path,
-                    'chrom' : chrom,
-                },
-                'stage_name' : stage,
-                'uid' : '{chrom}'.format(chrom=chrom),
-                'drm_params' :
-                    to_json(plink_extract_prune_lsf_params(email)),
-                'parents' : [ptask],
-            }
-            tasks.append( self.workflow.add_task(**task) )
-
-        return tasks
-
-    def create_plink_ld_prune_tasks(self, parent_tasks):
-        tasks = []
-        stage = '3-plink-ld-prune'
-        basedir = os.path.join(self.config.rootdir, stage)
-        email = self.config.email
-
-        for ptask in sorted(parent_tasks, key=lambda t: t.id):
-            chrom = ptask.params['chrom']
-            output_path = os.path.join(basedir, chrom, 'c{}-pruned'.format(chrom))
-
-            task = {
-                'func' : plink_ld_prune,
+                'func' : ld_prune,
                 'params' : {
                     'in_path' : ptask.params['out_path'],
                     'out_path' : output_path,
@@ -246,7 +295,7 @@ class Pipeline(object):
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=chrom),
                 'drm_params' :
-                    to_json(plink_ld_prune_lsf_params(email)),
+                    to_json(ld_prune_lsf_params(email)),
                 'parents' : [ptask],
             }
             tasks.append( self.workflow.add_task(**task) )
@@ -329,91 +378,134 @@ def create_evec_data_frame_lsf_params(email):
         'R' : 'select[mem>4000] rusage[mem=4000]',
     }
 
-def eigenstrat_smartpca_analysis(in_ped_file, in_map_file, out_prj_dir):
+def yaps2_pca(in_bfile_list, out_prj_dir):
     args = locals()
     default = {
-        'script' : pkg_resources.resource_filename('yaps2', 'resources/pca/eigenstrat.mk'),
+        'python' : sys.executable,
+        'threads' : 8,
     }
 
     cmd_args = merge_params(default, args)
 
-    cmd = ( "make -f {script} "
-            "INPUT_PED={in_ped_file} "
-            "INPUT_MAP={in_map_file} "
-            "PRJ_DIR={out_prj_dir}" ).format(**cmd_args)
+    # writes the merged.eigenstrat.pca.evec and merged.eigenstrat.eval that
+    # eigenstrat.mk would
+    cmd = ( "{python} -m yaps2.pca run "
+            "--bfile-list {in_bfile_list} "
+            "--out-prefix {out_prj_dir}/merged.eigenstrat "
+            "--k 10 "
+            "--threads {threads}" ).format(**cmd_args)
 
     return cmd
 
-def eigenstrat_smartpca_analysis_lsf_params(email):
+def yaps2_pca_lsf_params(email):
     return  {
         'u' : email,
         'N' : None,
-        'q' : "hall-lab",
+        'q' : "long",
+        'n' : 8,
         'M' : 16000000,
-        'R' : 'select[mem>16000] rusage[mem=16000]',
+        'R' : 'select[mem>16000] rusage[mem=16000] span[hosts=1]',
     }
 
-def plink_merge_pruned_files(in_ref, in_merge_file, out_path):
+def project_samples(in_model, in_vcfs_file, out_prj_dir):
     args = locals()
     default = {
-        'script' : pkg_resources.resource_filename('yaps2', 'resources/pca/plink-merge-pruned.sh'),
+        'python' : sys.executable,
     }
 
     cmd_args = merge_params(default, args)
 
-    cmd = ("{script} {in_ref} {in_merge_file} {out_path}").format(**cmd_args)
+    cmd = ( "{python} -m yaps2.pca project "
+            "--model {in_model} "
+            "--input-vcfs {in_vcfs_file} "
+            "--out-prefix {out_prj_dir}/merged.eigenstrat" ).format(**cmd_args)
 
     return cmd
 
-def plink_merge_pruned_files_lsf_params(email):
+def project_samples_lsf_params(email):
     return  {
         'u' : email,
         'N' : None,
         'q' : "long",
+        'M' : 8000000,
+        'R' : 'select[mem>8000] rusage[mem=8000]',
+    }
+
+def eigenstrat_smartpca_analysis(in_geno_file, in_snp_file, in_ind_file, out_prj_dir):
+    args = locals()
+    default = {
+        'script' : pkg_resources.resource_filename('yaps2', 'resources/pca/eigenstrat.mk'),
+    }
+
+    cmd_args = merge_params(default, args)
+
+    cmd = ( "make -f {script} "
+            "INPUT_GENO={in_geno_file} "
+            "INPUT_SNP={in_snp_file} "
+            "INPUT_IND={in_ind_file} "
+            "PRJ_DIR={out_prj_dir}" ).format(**cmd_args)
+
+    return cmd
+
+def eigenstrat_smartpca_analysis_lsf_params(email):
+    return  {
+        'u' : email,
+        'N' : None,
+        'q' : "hall-lab",
         'M' : 16000000,
         'R' : 'select[mem>16000] rusage[mem=16000]',
     }
 
-def plink_extract_prune(in_path, in_extract, out_path, **kwargs):
+def eigenstrat_merge_pruned_files(in_bfile_list, out_path):
     args = locals()
     default = {
-        'script' : pkg_resources.resource_filename('yaps2', 'resources/pca/plink-extract-prune.sh'),
+        'python' : sys.executable,
     }
 
     cmd_args = merge_params(default, args)
 
-    cmd = ("{script} {in_path} {in_extract} {out_path}").format(**cmd_args)
+    cmd = ( "{python} -m yaps2.eigenstrat "
+            "--bfile-list {in_bfile_list} "
+            "--out-prefix {out_path}" ).format(**cmd_args)
 
     return cmd
 
-def plink_extract_prune_lsf_params(email):
+def eigenstrat_merge_pruned_files_lsf_params(email):
     return  {
         'u' : email,
         'N' : None,
         'q' : "long",
-        'M' : 16000000,
-        'R' : 'select[mem>16000] rusage[mem=16000]',
+        'M' : 4000000,
+        'R' : 'select[mem>4000] rusage[mem=4000]',
     }
 
-def plink_ld_prune(in_path, out_path, **kwargs):
+def ld_prune(in_path, out_path, **kwargs):
     args = locals()
     default = {
-        'script' : pkg_resources.resource_filename('yaps2', 'resources/pca/plink-ld-prune.sh'),
+        'python' : sys.executable,
+        'threads' : 4,
     }
 
     cmd_args = merge_params(default, args)
 
-    cmd = ("{script} {in_path} {out_path}").format(**cmd_args)
+    # plink's --indep-pairwise 50 5 0.3 --maf 0.05 --geno 0, and the
+    # extraction of the kept variants
+    cmd = ( "{python} -m yaps2.ldprune "
+            "--bfile {in_path} "
+            "--out {out_path} "
+            "--window 50 --step 5 --r2 0.3 --maf 0.05 --geno 0 "
+            "--threads {threads}" ).format(**cmd_args)
 
     return cmd
 
-def plink_ld_prune_lsf_params(email):
+def ld_prune_lsf_params(email):
     return  {
         'u' : email,
         'N' : None,
         'q' : "long",
+        'n' : 4,
         'M' : 16000000,
-        'R' : 'select[mem>16000] rusage[mem=16000]',
+        'R' : 'select[mem>16000] rusage[mem=16000] span[hosts=1]',
     }
 
 def plink_binary(in_vcf, out_path, **kwargs):
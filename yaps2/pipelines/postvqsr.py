@@ -3,6 +3,9 @@ import pkg_resources
 from itertools import groupby
 from cosmos.api import Cosmos, Dependency, default_get_submit_args
 from yaps2.utils import to_json, merge_params, natural_key, Region, empty_gzipped_vcf
+from yaps2.telemetry import telemetry_cmd_wrapper
+from yaps2.retry import OOMRetryPolicy
+from yaps2.drm_lsf import BatchedJobManager
 
 class Config(object):
     def __init__(self, job_db, input_vcf_list, project_name, email, workspace, docker, queue):
@@ -79,7 +82,21 @@ class Pipeline(object):
 	# put set_successful to False if you intend to add more tasks to the
 	# pipeline later
         custom_log_dir = lambda task : os.path.join(self.config.rootdir, 'logs', task.stage.name, task.uid)
-        self.workflow.run(set_successful=False, log_out_dir_func=custom_log_dir, db_task_flush=task_flush)
+        # resubmit tasks killed for exceeding their memory limit with more memory
+        OOMRetryPolicy().install()
+        cmd_wrapper = telemetry_cmd_wrapper(self.config.db)
+        # submit LSF jobs concurrently, and poll them with one bjobs call per interval
+        self.workflow.jobmanager = BatchedJobManager(
+            get_submit_args=default_get_submit_args,
+            log_out_dir_func=custom_log_dir,
+            cmd_wrapper=cmd_wrapper,
+        )
+        self.workflow.run(
+            set_successful=False,
+            log_out_dir_func=custom_log_dir,
+            db_task_flush=task_flush,
+            cmd_wrapper=cmd_wrapper,
+        )
 
     def construct_pipeline(self):
         # 1. remove unused alternates
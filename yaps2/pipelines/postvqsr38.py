@@ -1,11 +1,48 @@
-import os, pwd, sys, subprocess
+import os, re, pwd, sys, subprocess
 import pkg_resources
 from itertools import groupby
 from cosmos.api import Cosmos, Dependency, default_get_submit_args
-from yaps2.utils import to_json, merge_params, natural_key, empty_gzipped_vcf, get_chrom_number, Region
+from yaps2.utils import to_json, merge_params, natural_key, empty_gzipped_vcf, get_chrom_number, Region, tabix_record_count
+from yaps2.telemetry import telemetry_cmd_wrapper
+from yaps2.retry import OOMRetryPolicy, ChunkRetryPolicy
+from yaps2.drm_lsf import BatchedJobManager
+from yaps2.lsf import autosize, prefer_hosts, memory_mb, set_memory, task_lsf_params, set_task_lsf_params
+from yaps2.refcache import BUNDLES, bundle_hosts
+from yaps2.pools import ResourcePools
+from yaps2 import telemetry
+
+# the reference data bundles (see yaps2.refcache) read by each stage
+STAGE_BUNDLES = {
+    'annotate-w-1000G' : ['1000G'],
+    'annotate-w-gnomAD' : ['gnomAD'],
+    'vep-annotation' : ['vep-cache'],
+    'vep-chunk-annotation' : ['vep-cache'],
+    'cadd-annotation' : ['cadd'],
+    'cadd-chunk-annotation' : ['cadd'],
+    'Low-Confidence-Region-annotation' : ['grch38-annotations'],
+    'LINSIGHT-annotation' : ['grch38-annotations'],
+}
+
+# the resource pools (see yaps2.pools) taken by a running task of each stage
+STAGE_POOLS = {
+    'vep-annotation' : ['vep-cache-io', 'bigmem'],
+    'vep-chunk-annotation' : ['vep-cache-io'],
+    'cadd-annotation' : ['cadd-io', 'bigmem'],
+    'cadd-chunk-annotation' : ['cadd-io'],
+}
+
+# the docker image the stages run in when --docker is given
+DOCKER_APPLICATION = "'docker(registry.gsc.wustl.edu/genome/genome_perl_environment:23)'"
+
+def base_stage_name(stage):
+    # e.g. '8-vep-annotation' => 'vep-annotation'
+    return re.sub(r'^[\d.]+-', '', stage)
 
 class Config(object):
-    def __init__(self, job_db, input_vcf_list, project_name, email, workspace, docker, queue, drm_job_group):
+    def __init__(self, job_db, input_vcf_list, project_name, email, workspace, docker, queue, drm_job_group,
+                 autosize=False, history_db=None, local_scratch=False, keep_intermediates=False,
+                 refcache=False, pools=None, annotation_dag='serial', defer_genotypes=False,
+                 vep_chunk_size=None, cadd_chunk_size=None, annotate_filters=None):
         self.email = email
         self.db = job_db
         self.project_name = project_name
@@ -28,6 +65,44 @@ class Config(object):
                 '.job_queue.db'
             )
 
+        # resource telemetry of previous runs used to size the LSF requests
+        self.autosize = autosize
+        self.history_db = history_db or self.db
+        self.history = {}
+
+        # stage temporaries on node-local scratch, optionally kept for debugging
+        self.local_scratch = local_scratch
+        self.intermediates_dir = None
+        if keep_intermediates:
+            self.intermediates_dir = os.path.join(os.path.abspath(self.rootdir), 'intermediates')
+
+        # copy the reference data of the annotation stages to node-local caches,
+        # listing the hosts holding each copy in the registry
+        self.refcache = refcache
+        self.refcache_registry = None
+        if refcache:
+            self.refcache_registry = os.path.join(os.path.abspath(self.rootdir), '.refcache-hosts')
+
+        # e.g. { 'vep-cache-io' : 6, 'bigmem' : 10 }
+        self.pools = pools or {}
+
+        # 'serial' chains the annotators, 'parallel' runs them side by side
+        # on sites-only VCFs and merges their annotations afterwards
+        self.annotation_dag = annotation_dag
+
+        # annotate sites-only VCFs, re-attaching the genotypes when concatenating
+        self.defer_genotypes = defer_genotypes
+
+        # run VEP over chunks of about this many records, as separate jobs
+        self.vep_chunk_size = vep_chunk_size
+
+        # score CADD over chunks of about this many records, as separate jobs
+        self.cadd_chunk_size = cadd_chunk_size
+
+        # e.g. ['PASS']: only the records with one of these FILTERs are
+        # annotated, the others are passed through without annotations
+        self.annotate_filters = list(annotate_filters) if annotate_filters else None
+
         self.vcfs = self.collect_input_vcfs(input_vcf_list)
         self.chroms = self.get_ordered_chroms()
 
@@ -59,6 +134,62 @@ class Config(object):
         chroms = sorted(self.vcfs.keys(), key=natural_key)
         return chroms
 
+    def chunk_count(self, chrom, chunk_size):
+        """The number of chunks of about chunk_size records of a shard,
+        estimated from the index of its input VCF (1 without one)."""
+        n_records = None
+        if chrom in self.vcfs:
+            n_records = tabix_record_count(self.vcfs[chrom])
+        if not n_records:
+            return 1
+        return (n_records + chunk_size - 1) // chunk_size
+
+    def stage_bundles(self, stage):
+        if not self.refcache:
+            return []
+        return STAGE_BUNDLES.get(base_stage_name(stage), [])
+
+    def stage_pools(self, stage):
+        return STAGE_POOLS.get(base_stage_name(stage), [])
+
+    def bundle_hosts(self, stage):
+        """The hosts holding every bundle of a stage."""
+        hosts = None
+        for name in self.stage_bundles(stage):
+            found = set(bundle_hosts(self.refcache_registry, BUNDLES[name]))
+            hosts = found if hosts is None else hosts & found
+        return sorted(hosts or [])
+
+    def stage_history(self, stage):
+        """The telemetry of the stage in previous runs, whatever its step
+        number was (e.g. '7.1-concat-vcfs' and '7.2-concat-vcfs')."""
+        name = base_stage_name(stage)
+        if name not in self.history:
+            self.history[name] = [
+                row for row in telemetry.fetch(self.history_db)
+                if base_stage_name(row['stage']) == name
+            ]
+        return self.history[name]
+
+    def prepare_task(self, task):
+        """Completes the LSF request of a task about to be submitted with
+        what is only known by then: the size of its inputs, and the hosts
+        holding its reference data."""
+        lsf_params = task_lsf_params(task)
+        # a retry keeps the memory the OOM retries asked for
+        if self.autosize and task.attempt == 1:
+            sized = autosize(
+                lsf_params,
+                self.stage_history(task.stage.name),
+                telemetry.input_size(task.input_map)
+            )
+            if lsf_params.get('a') == DOCKER_APPLICATION and memory_mb(sized) < 16000:
+                sized = set_memory(sized, 16000)
+            lsf_params = sized
+        if self.refcache:
+            lsf_params = prefer_hosts(lsf_params, self.bundle_hosts(task.stage.name))
+        set_task_lsf_params(task, lsf_params)
+
 class Pipeline(object):
     def __init__(self, config, drm, restart, skip_confirm):
         self.config = config
@@ -71,6 +202,11 @@ class Pipeline(object):
 
         self.cosmos.initdb()
 
+        # the scattered stages whose failed tasks are retried on their own
+        self.chunk_stages = set()
+        # whether the annotators only see the sites (set by construct_pipeline)
+        self.sites_only = False
+
         primary_logfile = os.path.join(
             self.config.rootdir,
             '{}.log'.format(self.config.project_name),
@@ -93,7 +229,36 @@ class Pipeline(object):
         # put set_successful to False if you intend to add more tasks to the
         # pipeline later
         custom_log_dir = lambda task : os.path.join(self.config.rootdir, 'logs', task.stage.name, task.uid)
-        self.workflow.run(set_successful=False, log_out_dir_func=custom_log_dir, db_task_flush=task_flush)
+        # resubmit tasks killed for exceeding their memory limit with more memory
+        OOMRetryPolicy().install()
+        # retry a failed chunk of a scattered stage without failing its chromosome
+        if self.chunk_stages:
+            ChunkRetryPolicy(self.chunk_stages).install()
+        cmd_wrapper = telemetry_cmd_wrapper(
+            self.config.db,
+            self.config.local_scratch,
+            self.config.intermediates_dir,
+            self.config.stage_bundles,
+            self.config.refcache_registry,
+        )
+        # submit LSF jobs concurrently, and poll them with one bjobs call per interval
+        # hold tasks back while the pools of their stage are full
+        pools = None
+        if self.config.pools:
+            pools = ResourcePools(self.config.pools, self.config.stage_pools)
+        self.workflow.jobmanager = BatchedJobManager(
+            get_submit_args=default_get_submit_args,
+            log_out_dir_func=custom_log_dir,
+            cmd_wrapper=cmd_wrapper,
+            pools=pools,
+            prepare_task=self.config.prepare_task,
+        )
+        self.workflow.run(
+            set_successful=False,
+            log_out_dir_func=custom_log_dir,
+            db_task_flush=task_flush,
+            cmd_wrapper=cmd_wrapper,
+        )
 
     def construct_pipeline(self):
         # 1. calculate sample missingness (counting phase)
@@ -108,24 +273,68 @@ class Pipeline(object):
         filter_variant_missingness_tasks = self.create_filter_variant_missingness_tasks(rsa_tasks, 4)
         # 5. annotate allele balances
         allele_balance_annotation_tasks = self.create_allele_balance_annotation_tasks(filter_variant_missingness_tasks, 5)
-        # 6. annotate with 1000G
-        annotate_1000G_tasks = self.create_1000G_annotation_tasks(allele_balance_annotation_tasks, 6)
-        # 7. annotate with gnomAD
-        annotate_gnomAD_tasks = self.create_gnomAD_annotation_tasks(annotate_1000G_tasks, 7)
-        # 7.1 intermediate VCF concatenation
-        intermediate_concatenated_vcfs = self.create_concatenate_vcfs_task(annotate_gnomAD_tasks, "7.1")
-        # 8. VEP annotation
-        annotate_vep_tasks = self.create_vep_annotation_tasks(annotate_gnomAD_tasks, 8)
-        # 9. CADD annotation
-        annotate_cadd_tasks = self.create_cadd_annotation_tasks(annotate_vep_tasks, 9)
-        # 10. Low-Confidence-Region annotation
-        annotate_lcr_tasks = self.create_LCR_annotation_tasks(annotate_cadd_tasks, 10)
-        # 11. LINSIGHT annotation
-        annotate_linsight_tasks = self.create_LINSIGHT_annotation_tasks(annotate_lcr_tasks, 11)
-        # 12. VCF concatenation
-        concatenated_vcfs = self.create_concatenate_vcfs_task(annotate_linsight_tasks, 12)
+        genotype_tasks = None
+        if self.config.defer_genotypes:
+            # 5.1 split off the genotypes; only the sites are annotated
+            genotype_tasks = self.create_split_genotypes_tasks(allele_balance_annotation_tasks, 5.1)
+        # the records the annotations are merged into
+        full_tasks = genotype_tasks or allele_balance_annotation_tasks
+        if self.config.annotate_filters:
+            # 5.2 only the sites with one of the FILTERs are annotated
+            sites_tasks = self.create_select_sites_tasks(full_tasks, 5.2)
+        elif self.config.annotation_dag == 'parallel' and not genotype_tasks:
+            # 5.1 the sites-only VCFs all the annotators read
+            sites_tasks = self.create_extract_sites_tasks(allele_balance_annotation_tasks, 5.1)
+        else:
+            sites_tasks = full_tasks
+        # the annotators are told so; they do not re-attach any samples then
+        self.sites_only = sites_tasks is not allele_balance_annotation_tasks
+        if self.config.annotation_dag == 'parallel':
+            # 6.-11. the annotators, side by side
+            annotator_tasks = [
+                self.create_1000G_annotation_tasks(sites_tasks, 6),
+                self.create_gnomAD_annotation_tasks(sites_tasks, 7),
+                self.create_vep_annotation_tasks(sites_tasks, 8),
+                self.create_cadd_annotation_tasks(sites_tasks, 9),
+                self.create_LCR_annotation_tasks(sites_tasks, 10),
+                self.create_LINSIGHT_annotation_tasks(sites_tasks, 11),
+            ]
+            # 11.1 merge the annotations (into the VCFs with samples, unless they are deferred)
+            annotated_tasks = self.create_merge_annotations_tasks(full_tasks, annotator_tasks, 11.1)
+            stats_parent_tasks = annotated_tasks
+        else:
+            # 6. annotate with 1000G
+            annotate_1000G_tasks = self.create_1000G_annotation_tasks(sites_tasks, 6)
+            # 7. annotate with gnomAD
+            annotate_gnomAD_tasks = self.create_gnomAD_annotation_tasks(annotate_1000G_tasks, 7)
+            if self.config.annotate_filters:
+                # 7.1 the other records back in
+                merged_gnomAD_tasks = self.create_merge_annotations_tasks(full_tasks, [annotate_gnomAD_tasks], 7.1)
+                # 7.2 intermediate VCF concatenation
+                intermediate_concatenated_vcfs = self.create_concatenate_vcfs_task(merged_gnomAD_tasks, "7.2", genotype_tasks)
+                stats_parent_tasks = merged_gnomAD_tasks
+            else:
+                # 7.1 intermediate VCF concatenation
+                intermediate_concatenated_vcfs = self.create_concatenate_vcfs_task(annotate_gnomAD_tasks, "7.1", genotype_tasks)
+                stats_parent_tasks = annotate_gnomAD_tasks
+            # 8. VEP annotation
+            annotate_vep_tasks = self.create_vep_annotation_tasks(annotate_gnomAD_tasks, 8)
+            # 9. CADD annotation
+            annotate_cadd_tasks = self.create_cadd_annotation_tasks(annotate_vep_tasks, 9)
+            # 10. Low-Confidence-Region annotation
+            annotate_lcr_tasks = self.create_LCR_annotation_tasks(annotate_cadd_tasks, 10)
+            # 11. LINSIGHT annotation
+            annotated_tasks = self.create_LINSIGHT_annotation_tasks(annotate_lcr_tasks, 11)
+            if self.config.annotate_filters:
+                # 11.1 the other records back in
+                annotated_tasks = self.create_merge_annotations_tasks(full_tasks, [annotated_tasks], 11.1)
+        if genotype_tasks:
+            # the sample stats need the genotypes
+            stats_parent_tasks = allele_balance_annotation_tasks
+        # 12. VCF concatenation (re-attaching the deferred genotypes)
+        concatenated_vcfs = self.create_concatenate_vcfs_task(annotated_tasks, 12, genotype_tasks)
         # 13. bcftools stats
-        bcftools_stats_tasks = self.create_bcftools_stats_tasks(annotate_gnomAD_tasks, 13)
+        bcftools_stats_tasks = self.create_bcftools_stats_tasks(stats_parent_tasks, 13)
         # 13.1 Merge & Plot bcftools stats
         bcftools_stats_summary_task = self.create_bcftools_stats_summary_task(bcftools_stats_tasks, 13.1)
 #        # 14. GATK VariantEval
@@ -140,12 +349,6 @@ class Pipeline(object):
         prior_stage_name = parent_tasks[0].stage.name
         input_dir = os.path.join(self.config.rootdir, prior_stage_name)
 
-        lsf_params = get_lsf_params(
-                bcftools_stats_summary_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         task = {
             'func' : bcftools_stats_summary,
             'params' : {
@@ -154,24 +357,20 @@ class Pipeline(object):
             },
             'stage_name' : stage,
             'uid' : 'all-chroms',
-            'drm_params' : lsf_params_json,
             'parents' : parent_tasks,
         }
 
+        task['drm_params'] = to_json(
+            get_lsf_params(bcftools_stats_summary_lsf_params, self.config)
+        )
         summary_task = self.workflow.add_task(**task)
         return summary_task
 
-    def create_concatenate_vcfs_task(self, parent_tasks, step_number):
+    def create_concatenate_vcfs_task(self, parent_tasks, step_number, genotype_tasks=None):
         tasks = list()
         stage = self._construct_task_name('concat-vcfs', step_number)
         output_dir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                concatenate_vcfs_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         def region_key(task):
             reference_fai = '/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/all_sequences.fa.fai'
             return Region(reference_fai, task.params['in_chrom'])
@@ -180,6 +379,9 @@ class Pipeline(object):
             reference_fai = '/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/all_sequences.fa.fai'
             return Region(reference_fai, task.params['in_chrom']).chrom
 
+        # the genotype sidecars of the shards, when they were split off
+        sidecars = { t.params['in_chrom'] : t for t in (genotype_tasks or []) }
+
         for ref_chrom, chrom_tasks in groupby(sorted(parent_tasks, key=region_key), key=chromosome_key):
             ptasks = list(chrom_tasks)
             input_vcfs = [ x.params['out_vcf'] for x in ptasks ]
@@ -195,9 +397,16 @@ class Pipeline(object):
                 },
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=ref_chrom),
-                'drm_params' : lsf_params_json,
                 'parents' : ptasks,
             }
+            if sidecars:
+                gtasks = [ sidecars[x.params['in_chrom']] for x in ptasks ]
+                task['func'] = attach_genotypes
+                task['params']['in_genotypes'] = [ x.params['out_genotypes'] for x in gtasks ]
+                task['parents'] = ptasks + gtasks
+            task['drm_params'] = to_json(
+                get_lsf_params(concatenate_vcfs_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
         return tasks
 
@@ -208,12 +417,6 @@ class Pipeline(object):
         prior_stage_name = parent_tasks[0].stage.name
         input_dir = os.path.join(self.config.rootdir, prior_stage_name)
 
-        lsf_params = get_lsf_params(
-                variant_eval_summary_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         task = {
             'func' : variant_eval_summary,
             'params' : {
@@ -222,10 +425,12 @@ class Pipeline(object):
             },
             'stage_name' : stage,
             'uid' : 'all-chroms',
-            'drm_params' : lsf_params_json,
             'parents' : parent_tasks,
         }
 
+        task['drm_params'] = to_json(
+            get_lsf_params(variant_eval_summary_lsf_params, self.config)
+        )
         summary_task = self.workflow.add_task(**task)
         return summary_task
 
@@ -234,12 +439,6 @@ class Pipeline(object):
         stage = self._construct_task_name('bcftools-stats', step_number)
         basedir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                bcftools_stats_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         for ptask in parent_tasks:
             chrom = ptask.params['in_chrom']
             output_stats = '{}.stats.out'.format(chrom)
@@ -252,9 +451,11 @@ class Pipeline(object):
                 },
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=chrom),
-                'drm_params' : lsf_params_json,
                 'parents' : [ptask],
             }
+            task['drm_params'] = to_json(
+                get_lsf_params(bcftools_stats_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
 
         return tasks
@@ -264,12 +465,6 @@ class Pipeline(object):
         stage = self._construct_task_name('gatk-variant-eval', step_number)
         basedir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                gatk_variant_eval_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         for ptask in parent_tasks:
             chrom = ptask.params['in_chrom']
             output_stats = 'chrom-{}-variant-eval.out'.format(chrom)
@@ -284,9 +479,11 @@ class Pipeline(object):
                 },
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=chrom),
-                'drm_params' : lsf_params_json,
                 'parents' : [ptask],
             }
+            task['drm_params'] = to_json(
+                get_lsf_params(gatk_variant_eval_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
 
         return tasks
@@ -296,12 +493,6 @@ class Pipeline(object):
         stage = self._construct_task_name('LINSIGHT-annotation', step_number)
         basedir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                annotation_LINSIGHT_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         for ptask in parent_tasks:
             chrom = ptask.params['in_chrom']
             output_vcf = 'b38.LINSIGHT.annotated.c{}.vcf.gz'.format(chrom)
@@ -313,12 +504,15 @@ class Pipeline(object):
                     'in_chrom' : chrom,
                     'out_vcf' : os.path.join(basedir, chrom, output_vcf),
                     'out_log' : os.path.join(basedir, chrom, output_log),
+                    'sites_only' : self.sites_only,
                 },
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=chrom),
-                'drm_params' : lsf_params_json,
                 'parents' : [ptask],
             }
+            task['drm_params'] = to_json(
+                get_lsf_params(annotation_LINSIGHT_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
 
         return tasks
@@ -328,12 +522,6 @@ class Pipeline(object):
         stage = self._construct_task_name('Low-Confidence-Region-annotation', step_number)
         basedir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                annotation_LCR_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         for ptask in parent_tasks:
             chrom = ptask.params['in_chrom']
             output_vcf = 'b38.LCR.annotated.c{}.vcf.gz'.format(chrom)
@@ -345,27 +533,27 @@ class Pipeline(object):
                     'in_chrom' : chrom,
                     'out_vcf' : os.path.join(basedir, chrom, output_vcf),
                     'out_log' : os.path.join(basedir, chrom, output_log),
+                    'sites_only' : self.sites_only,
                 },
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=chrom),
-                'drm_params' : lsf_params_json,
                 'parents' : [ptask],
             }
+            task['drm_params'] = to_json(
+                get_lsf_params(annotation_LCR_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
 
         return tasks
 
     def create_cadd_annotation_tasks(self, parent_tasks, step_number):
+        if self.config.cadd_chunk_size:
+            return self.create_chunked_cadd_annotation_tasks(parent_tasks, step_number)
+
         tasks = []
         stage = self._construct_task_name('cadd-annotation', step_number)
         basedir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                annotation_cadd_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         for ptask in parent_tasks:
             chrom = ptask.params['in_chrom']
             output_vcf = 'b38.cadd.annotated.c{}.vcf.gz'.format(chrom)
@@ -377,27 +565,100 @@ class Pipeline(object):
                     'in_chrom' : chrom,
                     'out_vcf' : os.path.join(basedir, chrom, output_vcf),
                     'out_log' : os.path.join(basedir, chrom, output_log),
+                    'sites_only' : self.sites_only,
                 },
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=chrom),
-                'drm_params' : lsf_params_json,
                 'parents' : [ptask],
             }
+            task['drm_params'] = to_json(
+                get_lsf_params(annotation_cadd_lsf_params, self.config)
+            )
+            tasks.append( self.workflow.add_task(**task) )
+
+        return tasks
+
+    def create_chunked_cadd_annotation_tasks(self, parent_tasks, step_number):
+        prepare_stage = self._construct_task_name('cadd-prepare', step_number)
+        stage = self._construct_task_name('cadd-chunk-annotation', '{}.1'.format(step_number))
+        finish_stage = self._construct_task_name('cadd-finish', '{}.2'.format(step_number))
+        self.chunk_stages.add(stage)
+
+        tasks = []
+        for ptask in parent_tasks:
+            chrom = ptask.params['in_chrom']
+            chunks = self.config.chunk_count(chrom, self.config.cadd_chunk_size)
+            # the GRCh37 sites and their chunks, shared by the three stages
+            workdir = os.path.join(self.config.rootdir, prepare_stage, chrom)
+            task = {
+                'func' : cadd_prepare_chunks,
+                'params' : {
+                    'in_vcf' : ptask.params['out_vcf'],
+                    'in_chrom' : chrom,
+                    'chunks' : chunks,
+                    'out_dir' : workdir,
+                    'out_log' : os.path.join(workdir, 'cadd-prepare.{}.log'.format(chrom)),
+                },
+                'stage_name' : prepare_stage,
+                'uid' : '{chrom}'.format(chrom=chrom),
+                'parents' : [ptask],
+            }
+            task['drm_params'] = to_json(
+                get_lsf_params(cadd_prepare_chunks_lsf_params, self.config)
+            )
+            prepare_task = self.workflow.add_task(**task)
+
+            chunk_tasks = []
+            for number in range(1, chunks + 1):
+                outdir = os.path.join(self.config.rootdir, stage, chrom, 'chunk{}'.format(number))
+                task = {
+                    'func' : annotation_cadd_chunk,
+                    'params' : {
+                        'in_vcf' : os.path.join(workdir, 'chunk{}'.format(number), 'grc37.vcf.gz'),
+                        'in_chrom' : chrom,
+                        'out_tsv' : os.path.join(outdir, 'cadd-annotation.tsv.gz'),
+                        'out_log' : os.path.join(outdir, 'cadd.annotation.{}.{}.log'.format(chrom, number)),
+                    },
+                    'stage_name' : stage,
+                    'uid' : '{chrom}.chunk{number}'.format(chrom=chrom, number=number),
+                    'parents' : [prepare_task],
+                }
+                task['drm_params'] = to_json(
+                    get_lsf_params(annotation_cadd_chunk_lsf_params, self.config)
+                )
+                chunk_tasks.append( self.workflow.add_task(**task) )
+
+            finish_dir = os.path.join(self.config.rootdir, finish_stage, chrom)
+            task = {
+                'func' : cadd_finish_chunks,
+                'params' : {
+                    'in_vcf' : ptask.params['out_vcf'],
+                    'in_chunk_tsvs' : [ t.params['out_tsv'] for t in chunk_tasks ],
+                    'in_dir' : workdir,
+                    'in_chrom' : chrom,
+                    'out_vcf' : os.path.join(finish_dir, 'b38.cadd.annotated.c{}.vcf.gz'.format(chrom)),
+                    'out_log' : os.path.join(finish_dir, 'cadd-finish.{}.log'.format(chrom)),
+                    'sites_only' : self.sites_only,
+                },
+                'stage_name' : finish_stage,
+                'uid' : '{chrom}'.format(chrom=chrom),
+                'parents' : [ptask, prepare_task] + chunk_tasks,
+            }
+            task['drm_params'] = to_json(
+                get_lsf_params(cadd_finish_chunks_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
 
         return tasks
 
     def create_vep_annotation_tasks(self, parent_tasks, step_number):
+        if self.config.vep_chunk_size:
+            return self.create_chunked_vep_annotation_tasks(parent_tasks, step_number)
+
         tasks = []
         stage = self._construct_task_name('vep-annotation', step_number)
         basedir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                annotation_vep_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         for ptask in parent_tasks:
             chrom = ptask.params['in_chrom']
             output_vcf = 'b38.vep.annotated.c{}.vcf.gz'.format(chrom)
@@ -409,12 +670,85 @@ class Pipeline(object):
                     'in_chrom' : chrom,
                     'out_vcf' : os.path.join(basedir, chrom, output_vcf),
                     'out_log' : os.path.join(basedir, chrom, output_log),
+                    'sites_only' : self.sites_only,
                 },
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=chrom),
-                'drm_params' : lsf_params_json,
                 'parents' : [ptask],
             }
+            task['drm_params'] = to_json(
+                get_lsf_params(annotation_vep_lsf_params, self.config)
+            )
+            tasks.append( self.workflow.add_task(**task) )
+
+        return tasks
+
+    def create_chunked_vep_annotation_tasks(self, parent_tasks, step_number):
+        split_stage = self._construct_task_name('vep-split', step_number)
+        stage = self._construct_task_name('vep-chunk-annotation', '{}.1'.format(step_number))
+        gather_stage = self._construct_task_name('vep-gather', '{}.2'.format(step_number))
+        self.chunk_stages.add(stage)
+
+        tasks = []
+        for ptask in parent_tasks:
+            chrom = ptask.params['in_chrom']
+            chunks = self.config.chunk_count(chrom, self.config.vep_chunk_size)
+            chunk_dir = os.path.join(self.config.rootdir, split_stage, chrom)
+            task = {
+                'func' : split_vcf_chunks,
+                'params' : {
+                    'in_vcf' : ptask.params['out_vcf'],
+                    'in_chrom' : chrom,
+                    'chunks' : chunks,
+                    'out_dir' : chunk_dir,
+                    'out_log' : os.path.join(chunk_dir, 'vep-split.{}.log'.format(chrom)),
+                },
+                'stage_name' : split_stage,
+                'uid' : '{chrom}'.format(chrom=chrom),
+                'parents' : [ptask],
+            }
+            task['drm_params'] = to_json(
+                get_lsf_params(split_vcf_chunks_lsf_params, self.config)
+            )
+            split_task = self.workflow.add_task(**task)
+
+            chunk_tasks = []
+            for number in range(1, chunks + 1):
+                outdir = os.path.join(self.config.rootdir, stage, chrom, 'chunk{}'.format(number))
+                task = {
+                    'func' : annotation_vep_chunk,
+                    'params' : {
+                        'in_vcf' : os.path.join(chunk_dir, 'chunk.{}.vcf.gz'.format(number)),
+                        'in_chrom' : chrom,
+                        'out_vcf' : os.path.join(outdir, 'b38.vep.annotated.c{}.{}.vcf.gz'.format(chrom, number)),
+                        'out_log' : os.path.join(outdir, 'vep.annotation.{}.{}.log'.format(chrom, number)),
+                    },
+                    'stage_name' : stage,
+                    'uid' : '{chrom}.chunk{number}'.format(chrom=chrom, number=number),
+                    'parents' : [split_task],
+                }
+                task['drm_params'] = to_json(
+                    get_lsf_params(annotation_vep_chunk_lsf_params, self.config)
+                )
+                chunk_tasks.append( self.workflow.add_task(**task) )
+
+            gather_dir = os.path.join(self.config.rootdir, gather_stage, chrom)
+            task = {
+                'func' : gather_vep_chunks,
+                'params' : {
+                    'in_vcf' : ptask.params['out_vcf'],
+                    'in_chunk_vcfs' : [ t.params['out_vcf'] for t in chunk_tasks ],
+                    'in_chrom' : chrom,
+                    'out_vcf' : os.path.join(gather_dir, 'b38.vep.annotated.c{}.vcf.gz'.format(chrom)),
+                    'out_log' : os.path.join(gather_dir, 'vep-gather.{}.log'.format(chrom)),
+                },
+                'stage_name' : gather_stage,
+                'uid' : '{chrom}'.format(chrom=chrom),
+                'parents' : [ptask] + chunk_tasks,
+            }
+            task['drm_params'] = to_json(
+                get_lsf_params(merge_annotations_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
 
         return tasks
@@ -424,12 +758,6 @@ class Pipeline(object):
         stage = self._construct_task_name('annotate-w-gnomAD', step_number)
         basedir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                annotation_gnomAD_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         for ptask in parent_tasks:
             chrom = ptask.params['in_chrom']
             output_vcf = 'gnomAD-annotated.c{}.vcf.gz'.format(chrom)
@@ -441,12 +769,15 @@ class Pipeline(object):
                     'in_chrom' : chrom,
                     'out_vcf' : os.path.join(basedir, chrom, output_vcf),
                     'out_log' : os.path.join(basedir, chrom, output_log),
+                    'sites_only' : self.sites_only,
                 },
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=chrom),
-                'drm_params' : lsf_params_json,
                 'parents' : [ptask],
             }
+            task['drm_params'] = to_json(
+                get_lsf_params(annotation_gnomAD_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
 
         return tasks
@@ -456,12 +787,6 @@ class Pipeline(object):
         stage = self._construct_task_name('annotate-w-1000G', step_number)
         basedir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                annotation_1000G_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         for ptask in parent_tasks:
             chrom = ptask.params['in_chrom']
             output_vcf = '1kg-annotated.c{}.vcf.gz'.format(chrom)
@@ -473,12 +798,134 @@ class Pipeline(object):
                     'in_chrom' : chrom,
                     'out_vcf' : os.path.join(basedir, chrom, output_vcf),
                     'out_log' : os.path.join(basedir, chrom, output_log),
+                    'sites_only' : self.sites_only,
                 },
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=chrom),
-                'drm_params' : lsf_params_json,
                 'parents' : [ptask],
             }
+            task['drm_params'] = to_json(
+                get_lsf_params(annotation_1000G_lsf_params, self.config)
+            )
+            tasks.append( self.workflow.add_task(**task) )
+
+        return tasks
+
+    def create_merge_annotations_tasks(self, base_tasks, annotator_tasks, step_number):
+        tasks = []
+        stage = self._construct_task_name('merge-annotations', step_number)
+        basedir = os.path.join(self.config.rootdir, stage)
+
+        for btask in base_tasks:
+            chrom = btask.params['in_chrom']
+            annotated = [ t for stage_tasks in annotator_tasks for t in stage_tasks
+                          if t.params['in_chrom'] == chrom ]
+            output_vcf = 'annotated.c{}.vcf.gz'.format(chrom)
+            output_log = 'merge-annotations.{}.log'.format(chrom)
+            task = {
+                'func' : merge_annotations,
+                'params' : {
+                    'in_vcf' : btask.params['out_vcf'],
+                    'in_annotated_vcfs' : [ t.params['out_vcf'] for t in annotated ],
+                    'in_chrom' : chrom,
+                    'filters' : self.config.annotate_filters,
+                    'out_vcf' : os.path.join(basedir, chrom, output_vcf),
+                    'out_log' : os.path.join(basedir, chrom, output_log),
+                },
+                'stage_name' : stage,
+                'uid' : '{chrom}'.format(chrom=chrom),
+                'parents' : [btask] + annotated,
+            }
+            task['drm_params'] = to_json(
+                get_lsf_params(merge_annotations_lsf_params, self.config)
+            )
+            tasks.append( self.workflow.add_task(**task) )
+
+        return tasks
+
+    def create_split_genotypes_tasks(self, parent_tasks, step_number):
+        tasks = []
+        stage = self._construct_task_name('split-genotypes', step_number)
+        basedir = os.path.join(self.config.rootdir, stage)
+
+        for ptask in parent_tasks:
+            chrom = ptask.params['in_chrom']
+            output_vcf = 'sites.c{}.vcf.gz'.format(chrom)
+            output_genotypes = 'genotypes.c{}.tsv.gz'.format(chrom)
+            output_log = 'split-genotypes.{}.log'.format(chrom)
+            task = {
+                'func' : split_genotypes,
+                'params' : {
+                    'in_vcf' : ptask.params['out_vcf'],
+                    'in_chrom' : chrom,
+                    'out_vcf' : os.path.join(basedir, chrom, output_vcf),
+                    'out_genotypes' : os.path.join(basedir, chrom, output_genotypes),
+                    'out_log' : os.path.join(basedir, chrom, output_log),
+                },
+                'stage_name' : stage,
+                'uid' : '{chrom}'.format(chrom=chrom),
+                'parents' : [ptask],
+            }
+            task['drm_params'] = to_json(
+                get_lsf_params(split_genotypes_lsf_params, self.config)
+            )
+            tasks.append( self.workflow.add_task(**task) )
+
+        return tasks
+
+    def create_select_sites_tasks(self, parent_tasks, step_number):
+        tasks = []
+        stage = self._construct_task_name('select-sites', step_number)
+        basedir = os.path.join(self.config.rootdir, stage)
+
+        for ptask in parent_tasks:
+            chrom = ptask.params['in_chrom']
+            output_vcf = 'selected.sites.c{}.vcf.gz'.format(chrom)
+            output_log = 'select-sites.{}.log'.format(chrom)
+            task = {
+                'func' : extract_sites,
+                'params' : {
+                    'in_vcf' : ptask.params['out_vcf'],
+                    'in_chrom' : chrom,
+                    'filters' : self.config.annotate_filters,
+                    'out_vcf' : os.path.join(basedir, chrom, output_vcf),
+                    'out_log' : os.path.join(basedir, chrom, output_log),
+                },
+                'stage_name' : stage,
+                'uid' : '{chrom}'.format(chrom=chrom),
+                'parents' : [ptask],
+            }
+            task['drm_params'] = to_json(
+                get_lsf_params(extract_sites_lsf_params, self.config)
+            )
+            tasks.append( self.workflow.add_task(**task) )
+
+        return tasks
+
+    def create_extract_sites_tasks(self, parent_tasks, step_number):
+        tasks = []
+        stage = self._construct_task_name('extract-sites', step_number)
+        basedir = os.path.join(self.config.rootdir, stage)
+
+        for ptask in parent_tasks:
+            chrom = ptask.params['in_chrom']
+            output_vcf = 'sites.c{}.vcf.gz'.format(chrom)
+            output_log = 'extract-sites.{}.log'.format(chrom)
+            task = {
+                'func' : extract_sites,
+                'params' : {
+                    'in_vcf' : ptask.params['out_vcf'],
+                    'in_chrom' : chrom,
+                    'out_vcf' : os.path.join(basedir, chrom, output_vcf),
+                    'out_log' : os.path.join(basedir, chrom, output_log),
+                },
+                'stage_name' : stage,
+                'uid' : '{chrom}'.format(chrom=chrom),
+                'parents' : [ptask],
+            }
+            task['drm_params'] = to_json(
+                get_lsf_params(extract_sites_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
 
         return tasks
@@ -488,12 +935,6 @@ class Pipeline(object):
         stage = self._construct_task_name('allele-balance-annotation', step_number)
         basedir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                annotate_allele_balances_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         for ptask in parent_tasks:
             chrom = ptask.params['in_chrom']
             output_vcf = 'combined.c{chrom}.vcf.gz'.format(chrom=chrom)
@@ -508,9 +949,11 @@ class Pipeline(object):
                 },
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=chrom),
-                'drm_params' : lsf_params_json,
                 'parents' : [ptask],
             }
+            task['drm_params'] = to_json(
+                get_lsf_params(annotate_allele_balances_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
 
         return tasks
@@ -520,12 +963,6 @@ class Pipeline(object):
         stage = self._construct_task_name('filter-variant-missingness', step_number)
         basedir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                filter_variant_missingness_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         for ptask in parent_tasks:
             chrom = ptask.params['in_chrom']
             output_vcf = 'combined.c{chrom}.vcf.gz'.format(chrom=chrom)
@@ -540,9 +977,11 @@ class Pipeline(object):
                 },
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=chrom),
-                'drm_params' : lsf_params_json,
                 'parents' : [ptask],
             }
+            task['drm_params'] = to_json(
+                get_lsf_params(filter_variant_missingness_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
 
         return tasks
@@ -552,12 +991,6 @@ class Pipeline(object):
         stage = self._construct_task_name('remove-symbolic-alleles', step_number)
         basedir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                remove_symbolic_deletion_alleles_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         for ptask in parent_tasks:
             chrom = ptask.params['in_chrom']
             output_vcf = 'combined.c{chrom}.vcf.gz'.format(chrom=chrom)
@@ -572,9 +1005,11 @@ class Pipeline(object):
                         },
                     'stage_name' : stage,
                     'uid' : '{chrom}'.format(chrom=chrom),
-                    'drm_params' : lsf_params_json,
                     'parents' : [ptask],
                     }
+            task['drm_params'] = to_json(
+                get_lsf_params(remove_symbolic_deletion_alleles_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
 
         return tasks
@@ -584,12 +1019,6 @@ class Pipeline(object):
         stage = self._construct_task_name('decompose-normalize-uniq', step_number)
         basedir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                normalize_decompose_unique_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         for chrom in self.config.chroms:
             output_vcf = 'combined.c{chrom}.vcf.gz'.format(chrom=chrom)
             output_log = 'decompose-normalize-unique-{}.log'.format(chrom)
@@ -603,8 +1032,10 @@ class Pipeline(object):
                 },
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=chrom),
-                'drm_params' : lsf_params_json,
             }
+            task['drm_params'] = to_json(
+                get_lsf_params(normalize_decompose_unique_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
 
         return tasks
@@ -617,12 +1048,6 @@ class Pipeline(object):
         input_dir = os.path.join(self.config.rootdir, prior_stage_name)
         input_json_wildcard_path = os.path.join(input_dir, '*', '*.json')
 
-        lsf_params = get_lsf_params(
-                calculate_sample_missingness_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         task = {
             'func' : calculate_sample_missingness,
             'params' : {
@@ -632,10 +1057,12 @@ class Pipeline(object):
             },
             'stage_name' : stage,
             'uid' : '1-22',
-            'drm_params' : lsf_params_json,
             'parents' : parent_tasks,
         }
 
+        task['drm_params'] = to_json(
+            get_lsf_params(calculate_sample_missingness_lsf_params, self.config)
+        )
         summary_task = self.workflow.add_task(**task)
         return summary_task
 
@@ -644,12 +1071,6 @@ class Pipeline(object):
         stage = self._construct_task_name('count-sample-missingness', step_number)
         basedir = os.path.join(self.config.rootdir, stage)
 
-        lsf_params = get_lsf_params(
-                count_sample_missingness_lsf_params,
-                self.config
-        )
-        lsf_params_json = to_json(lsf_params)
-
         for chrom in self.config.chroms:
 
             # only count missing genotypes on chromosomes 1-22 (not X, Y, or MT)
@@ -668,8 +1089,10 @@ class Pipeline(object):
                 },
                 'stage_name' : stage,
                 'uid' : '{chrom}'.format(chrom=chrom),
-                'drm_params' : lsf_params_json,
             }
+            task['drm_params'] = to_json(
+                get_lsf_params(count_sample_missingness_lsf_params, self.config)
+            )
             tasks.append( self.workflow.add_task(**task) )
 
         return tasks
@@ -679,6 +1102,11 @@ class Pipeline(object):
         return task_name
 
 # C M D S #####################################################################
+def sites_only_env(sites_only):
+    """The environment telling an annotation script not to re-attach the
+    samples of its (sites-only) input."""
+    return 'YAPS2_SITES_ONLY=1 ' if sites_only else ''
+
 def get_lsf_params(task_lsf_fn, config):
     email = config.email
     docker = config.docker
@@ -691,7 +1119,7 @@ def get_lsf_params(task_lsf_fn, config):
         lsf_params['g'] = job_group
 
     if docker and ('a' not in lsf_params):
-        lsf_params['a'] = "'docker(registry.gsc.wustl.edu/genome/genome_perl_environment:23)'"
+        lsf_params['a'] = DOCKER_APPLICATION
         if lsf_params['q'] not in ('ccdg', 'research-hpc'):
             lsf_params['q'] = "ccdg"
         current_memory_request = lsf_params.get('M', 0)
@@ -778,6 +1206,22 @@ def concatenate_vcfs_lsf_params(email, queue):
         'R' : 'select[mem>10000 && ncpus>8] rusage[mem=10000]',
     }
 
+def attach_genotypes(in_vcfs, in_genotypes, in_chrom, out_vcf, out_log):
+    args = locals()
+    default = {
+        'script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/attach-genotypes.sh'),
+        'python_executable' : sys.executable,
+    }
+    cmd_args = merge_params(default, args)
+    cmd_args['pairs'] = ' '.join([ '{} {}'.format(v, g) for (v, g) in zip(in_vcfs, in_genotypes) ])
+
+    cmd = ( "{script} "
+            "{python_executable} "
+            "{out_vcf} {pairs} "
+            ">{out_log} 2>&1" ).format(**cmd_args)
+
+    return cmd
+
 def variant_eval_summary(in_dir, out_dir):
     args = locals()
     default = {
@@ -838,14 +1282,15 @@ def gatk_variant_eval_lsf_params(email, queue):
         'R' : 'select[mem>10000 && ncpus>8] rusage[mem=10000]',
     }
 
-def annotation_LINSIGHT(in_vcf, in_chrom, out_vcf, out_log):
+def annotation_LINSIGHT(in_vcf, in_chrom, out_vcf, out_log, sites_only=False):
     args = locals()
     default = {
         'main_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/annotate-w-LINSIGHT.sh'),
         'b37_to_b38_integration_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/integrate-b37-annotations-to-b38.py'),
     }
     cmd_args = merge_params(default, args)
-    cmd = ("{main_script} "
+    cmd_args['env'] = sites_only_env(sites_only)
+    cmd = ("{env}{main_script} "
            "{in_vcf} "
            "{out_vcf} "
            "{b37_to_b38_integration_script} "
@@ -861,13 +1306,14 @@ def annotation_LINSIGHT_lsf_params(email, queue):
         'R' : 'select[mem>28000 && ncpus>8] rusage[mem=28000]',
     }
 
-def annotation_LCR(in_vcf, in_chrom, out_vcf, out_log):
+def annotation_LCR(in_vcf, in_chrom, out_vcf, out_log, sites_only=False):
     args = locals()
     default = {
         'main_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/annotate-regions-of-low-confidence.sh'),
     }
     cmd_args = merge_params(default, args)
-    cmd = ("{main_script} "
+    cmd_args['env'] = sites_only_env(sites_only)
+    cmd = ("{env}{main_script} "
            "{in_vcf} "
            "{out_vcf} "
            ">{out_log} 2>&1" ).format(**cmd_args)
@@ -882,7 +1328,7 @@ def annotation_LCR_lsf_params(email, queue):
         'R' : 'select[mem>16000 && ncpus>8] rusage[mem=16000]',
     }
 
-def annotation_cadd(in_vcf, in_chrom, out_vcf, out_log):
+def annotation_cadd(in_vcf, in_chrom, out_vcf, out_log, sites_only=False):
     args = locals()
     default = {
         'main_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/run-cadd.sh'),
@@ -890,7 +1336,8 @@ def annotation_cadd(in_vcf, in_chrom, out_vcf, out_log):
         'b37_to_b38_integration_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/integrate-b37-annotations-to-b38.py'),
     }
     cmd_args = merge_params(default, args)
-    cmd = ("{main_script} "
+    cmd_args['env'] = sites_only_env(sites_only)
+    cmd = ("{env}{main_script} "
            "{in_vcf} "
            "{out_vcf} "
            "{merge_script} "
@@ -907,13 +1354,88 @@ def annotation_cadd_lsf_params(email, queue):
         'R' : 'select[mem>60000 && ncpus>8] rusage[mem=64000]',
     }
 
-def annotation_vep(in_vcf, in_chrom, out_vcf, out_log):
+def cadd_prepare_chunks(in_vcf, in_chrom, chunks, out_dir, out_log):
+    args = locals()
+    default = {
+        'main_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/run-cadd.sh'),
+        'python_executable' : sys.executable,
+    }
+    cmd_args = merge_params(default, args)
+    cmd = ("{main_script} --prepare-chunks "
+           "{in_vcf} "
+           "{out_dir} "
+           "{chunks} "
+           "{python_executable} "
+           ">{out_log} 2>&1" ).format(**cmd_args)
+    return cmd
+
+def cadd_prepare_chunks_lsf_params(email, queue):
+    return  {
+        'u' : email,
+        'N' : None,
+        'q' : queue,
+        'M' : 20000000,
+        'R' : 'select[mem>20000 && ncpus>8] rusage[mem=20000]',
+    }
+
+def annotation_cadd_chunk(in_vcf, in_chrom, out_tsv, out_log):
+    args = locals()
+    default = {
+        'main_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/run-cadd.sh'),
+    }
+    cmd_args = merge_params(default, args)
+    cmd = ("{main_script} --score-chunk "
+           "{in_vcf} "
+           "{out_tsv} "
+           ">{out_log} 2>&1" ).format(**cmd_args)
+    return cmd
+
+def annotation_cadd_chunk_lsf_params(email, queue):
+    return  {
+        'u' : email,
+        'N' : None,
+        'q' : queue,
+        'M' : 16000000,
+        'R' : 'select[mem>16000 && ncpus>8] rusage[mem=16000]',
+    }
+
+def cadd_finish_chunks(in_vcf, in_chunk_tsvs, in_dir, in_chrom, out_vcf, out_log, sites_only=False):
+    args = locals()
+    default = {
+        'main_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/run-cadd.sh'),
+        'merge_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/merge-in-cadd.py'),
+        'b37_to_b38_integration_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/integrate-b37-annotations-to-b38.py'),
+    }
+    cmd_args = merge_params(default, args)
+    cmd_args['env'] = sites_only_env(sites_only)
+    cmd_args['in_chunk_tsvs'] = ' '.join(in_chunk_tsvs)
+    cmd = ("{env}{main_script} --finish-chunks "
+           "{in_vcf} "
+           "{out_vcf} "
+           "{in_dir} "
+           "{merge_script} "
+           "{b37_to_b38_integration_script} "
+           "{in_chunk_tsvs} "
+           ">{out_log} 2>&1" ).format(**cmd_args)
+    return cmd
+
+def cadd_finish_chunks_lsf_params(email, queue):
+    return  {
+        'u' : email,
+        'N' : None,
+        'q' : queue,
+        'M' : 32000000,
+        'R' : 'select[mem>32000 && ncpus>8] rusage[mem=32000]',
+    }
+
+def annotation_vep(in_vcf, in_chrom, out_vcf, out_log, sites_only=False):
     args = locals()
     default = {
         'main_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/run-vep.sh'),
     }
     cmd_args = merge_params(default, args)
-    cmd = ("{main_script} "
+    cmd_args['env'] = sites_only_env(sites_only)
+    cmd = ("{env}{main_script} "
            "{in_vcf} "
            "{out_vcf} "
            ">{out_log} 2>&1" ).format(**cmd_args)
@@ -929,14 +1451,41 @@ def annotation_vep_lsf_params(email, queue):
         'R' : 'select[mem>60000 && ncpus>8] rusage[mem=68000]',
     }
 
-def annotation_gnomAD(in_vcf, in_chrom, out_vcf, out_log):
+def annotation_vep_chunk(in_vcf, in_chrom, out_vcf, out_log):
+    args = locals()
+    default = {
+        'main_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/run-vep.sh'),
+        'forks' : 4,
+    }
+    cmd_args = merge_params(default, args)
+    # the chunks only hold the sites (python -m yaps2.annotation split)
+    cmd = ("VEP_FORKS={forks} YAPS2_SITES_ONLY=1 "
+           "{main_script} "
+           "{in_vcf} "
+           "{out_vcf} "
+           ">{out_log} 2>&1" ).format(**cmd_args)
+    return cmd
+
+def annotation_vep_chunk_lsf_params(email, queue):
+    return  {
+        'u' : email,
+        'N' : None,
+        'a' : "'docker(willmclaren/ensembl-vep:release_88)'",
+        'q' : 'ccdg',
+        'M' : 24000000,
+        'R' : 'select[mem>24000 && ncpus>4] rusage[mem=24000]',
+        'n' : 4,
+    }
+
+def annotation_gnomAD(in_vcf, in_chrom, out_vcf, out_log, sites_only=False):
     args = locals()
     default = {
         'main_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/annotate-w-gnomAD.sh'),
         'b37_to_b38_integration_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/integrate-b37-annotations-to-b38.py'),
     }
     cmd_args = merge_params(default, args)
-    cmd = ("{main_script} "
+    cmd_args['env'] = sites_only_env(sites_only)
+    cmd = ("{env}{main_script} "
            "{in_chrom} "
            "{in_vcf} "
            "{out_vcf} "
@@ -953,14 +1502,15 @@ def annotation_gnomAD_lsf_params(email, queue):
         'R' : 'select[mem>16000 && ncpus>8] rusage[mem=16000]',
     }
 
-def annotation_1000G(in_vcf, in_chrom, out_vcf, out_log):
+def annotation_1000G(in_vcf, in_chrom, out_vcf, out_log, sites_only=False):
     args = locals()
     default = {
         'script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/annotate-w-1000G.sh'),
         'integrate_script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/integrate-b37-annotations-to-b38.py'),
     }
     cmd_args = merge_params(default, args)
-    cmd = "{script} {in_vcf} {out_vcf} {integrate_script} >{out_log} 2>&1".format(**cmd_args)
+    cmd_args['env'] = sites_only_env(sites_only)
+    cmd = "{env}{script} {in_vcf} {out_vcf} {integrate_script} >{out_log} 2>&1".format(**cmd_args)
     return cmd
 
 def annotation_1000G_lsf_params(email, queue):
@@ -972,6 +1522,109 @@ def annotation_1000G_lsf_params(email, queue):
         'R' : 'select[mem>16000 && ncpus>8] rusage[mem=16000]',
     }
 
+def merge_annotations(in_vcf, in_annotated_vcfs, in_chrom, out_vcf, out_log, filters=None):
+    args = locals()
+    default = {
+        'script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/merge-annotations.sh'),
+        'python_executable' : sys.executable,
+    }
+    cmd_args = merge_params(default, args)
+    cmd_args['merge_args'] = ' '.join(
+        [ '--annotated {}'.format(x) for x in in_annotated_vcfs ]
+        + [ '--filter {}'.format(x) for x in (filters or []) ]
+    )
+
+    cmd = ( "{script} "
+            "{python_executable} "
+            "{in_vcf} {out_vcf} {merge_args} "
+            ">{out_log} 2>&1" ).format(**cmd_args)
+
+    return cmd
+
+def gather_vep_chunks(in_vcf, in_chunk_vcfs, in_chrom, out_vcf, out_log):
+    args = locals()
+    default = {
+        'script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/merge-annotations.sh'),
+        'python_executable' : sys.executable,
+    }
+    cmd_args = merge_params(default, args)
+    cmd_args['merge_args'] = ' '.join([ '--chunks {}'.format(x) for x in in_chunk_vcfs ])
+
+    cmd = ( "{script} "
+            "{python_executable} "
+            "{in_vcf} {out_vcf} {merge_args} "
+            ">{out_log} 2>&1" ).format(**cmd_args)
+
+    return cmd
+
+def split_vcf_chunks(in_vcf, in_chrom, chunks, out_dir, out_log):
+    args = locals()
+    default = {
+        'script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/split-vcf-chunks.sh'),
+        'python_executable' : sys.executable,
+    }
+    cmd_args = merge_params(default, args)
+    cmd = ( "{script} "
+            "{python_executable} "
+            "{in_vcf} {out_dir} {chunks} "
+            ">{out_log} 2>&1" ).format(**cmd_args)
+    return cmd
+
+def split_vcf_chunks_lsf_params(email, queue):
+    return  {
+        'u' : email,
+        'N' : None,
+        'q' : queue,
+        'M' : 4000000,
+        'R' : 'select[mem>4000 && ncpus>8] rusage[mem=4000]',
+    }
+
+def merge_annotations_lsf_params(email, queue):
+    return  {
+        'u' : email,
+        'N' : None,
+        'q' : queue,
+        'M' : 4000000,
+        'R' : 'select[mem>4000 && ncpus>8] rusage[mem=4000]',
+    }
+
+def split_genotypes(in_vcf, in_chrom, out_vcf, out_genotypes, out_log):
+    args = locals()
+    default = {
+        'script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/split-genotypes.sh'),
+    }
+    cmd_args = merge_params(default, args)
+    cmd = "{script} {in_vcf} {out_vcf} {out_genotypes} >{out_log} 2>&1".format(**cmd_args)
+    return cmd
+
+def split_genotypes_lsf_params(email, queue):
+    return  {
+        'u' : email,
+        'N' : None,
+        'q' : queue,
+        'M' : 4000000,
+        'R' : 'select[mem>4000 && ncpus>8] rusage[mem=4000]',
+    }
+
+def extract_sites(in_vcf, in_chrom, out_vcf, out_log, filters=None):
+    args = locals()
+    default = {
+        'script' : pkg_resources.resource_filename('yaps2', 'resources/postvqsr38/extract-sites.sh'),
+    }
+    cmd_args = merge_params(default, args)
+    cmd_args['filters'] = ','.join(filters or [])
+    cmd = "{script} {in_vcf} {out_vcf} {filters} >{out_log} 2>&1".format(**cmd_args)
+    return cmd
+
+def extract_sites_lsf_params(email, queue):
+    return  {
+        'u' : email,
+        'N' : None,
+        'q' : queue,
+        'M' : 4000000,
+        'R' : 'select[mem>4000 && ncpus>8] rusage[mem=4000]',
+    }
+
 def annotate_allele_balances(in_vcf, in_chrom, out_vcf, out_log):
     args = locals()
     default = {
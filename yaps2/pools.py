@@ -0,0 +1,49 @@
+from __future__ import print_function, division
+
+def parse_pools(specs):
+    """Parses 'name:slots' pool declarations, e.g. ('vep-cache-io:6', 'bigmem:10')."""
+    pools = {}
+    for spec in specs:
+        (name, sep, slots) = spec.rpartition(':')
+        if not sep or not name or not slots.isdigit() or int(slots) < 1:
+            raise ValueError("expected a pool as '<name>:<slots>', got '{}'".format(spec))
+        pools[name] = int(slots)
+    return pools
+
+class ResourcePools(object):
+    """Named pools with a fixed number of slots, each taken by a running task
+    of a stage tagged with the pool.
+
+    ``stage_pools`` maps a stage name to the names of its pools; pools that
+    were not declared in ``limits`` are not capped.
+    """
+
+    def __init__(self, limits, stage_pools):
+        self.limits = dict(limits)
+        self.stage_pools = stage_pools
+
+    def pools_of(self, task):
+        return [ p for p in self.stage_pools(task.stage.name) if p in self.limits ]
+
+    def usage(self, running_tasks):
+        used = dict.fromkeys(self.limits, 0)
+        for task in running_tasks:
+            for pool in self.pools_of(task):
+                used[pool] += 1
+        return used
+
+    def admit(self, tasks, running_tasks):
+        """Splits the tasks ready to run into the ones that fit in the free
+        slots (taking them) and the ones held back until a slot frees."""
+        used = self.usage(running_tasks)
+        admitted = []
+        held = []
+        for task in tasks:
+            pools = self.pools_of(task)
+            if all(used[p] < self.limits[p] for p in pools):
+                for p in pools:
+                    used[p] += 1
+                admitted.append(task)
+            else:
+                held.append(task)
+        return (admitted, held)
@@ -0,0 +1,360 @@
+from __future__ import print_function, division
+
+import os, sys, json, time, errno, fcntl, shutil, socket, hashlib, datetime
+
+import click
+
+from yaps2.utils import ensure_directory
+
+# where the bundles are cached on a node, and how much space they may use
+ENV_CACHE_ROOT = 'YAPS2_REFCACHE_ROOT'
+ENV_CACHE_LIMIT_GB = 'YAPS2_REFCACHE_LIMIT_GB'
+DEFAULT_CACHE_ROOT = '/tmp/yaps2-refcache'
+DEFAULT_CACHE_LIMIT_GB = 200
+
+MANIFEST = '.yaps2-manifest.json'
+IN_USE = '.yaps2-in-use'
+LAST_USED = '.yaps2-last-used'
+
+COPY_CHUNK = 4 * 1024 * 1024
+
+# times to retry locking an entry that is replaced while it is being locked
+LOCK_ATTEMPTS = 3
+
+def log(msg):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print('[-- refcache {} --] {}'.format(timestamp, msg), file=sys.stderr)
+
+class Bundle(object):
+    """A reference data directory read by a stage.  The version names the
+    cached copy, so a new release of the data needs a new version."""
+
+    def __init__(self, name, source, version):
+        self.name = name
+        self.source = source
+        self.version = version
+
+    @property
+    def env(self):
+        # the variable pointing the stage scripts at the cached copy
+        return 'YAPS2_REF_{}'.format(self.name.upper().replace('-', '_'))
+
+BUNDLES = { b.name : b for b in (
+    Bundle('vep-cache', '/gscmnt/gc2719/halllab/genomes/human/GRCh38/.vep', '88'),
+    Bundle('cadd', '/gscmnt/gc2802/halllab/abelhj/CADD/CADD_v1.2', 'v1.2'),
+    Bundle('1000G',
+           '/gscmnt/gc2802/halllab/idas/jira/BIO-1984/data/manual/create-1000G-reformatted-af-annotations',
+           'phase3-v5'),
+    Bundle('gnomAD', '/gscmnt/gc2802/halllab/gnomAD/release-170228/processed/post-vqsr-pipeline', 'release-170228'),
+    Bundle('grch38-annotations', '/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/annotations', 'GRCh38DH'),
+)}
+
+def source_files(source):
+    """The (relative path, size) of every file under a bundle's source."""
+    files = []
+    for (dirpath, dirnames, filenames) in os.walk(source):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            files.append((os.path.relpath(path, source), os.path.getsize(path)))
+    return files
+
+def md5sum(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def copy_with_md5(src, dest):
+    """Copies a file, returning the md5 of what was read."""
+    digest = hashlib.md5()
+    with open(src, 'rb') as fin, open(dest, 'wb') as fout:
+        for chunk in iter(lambda: fin.read(COPY_CHUNK), b''):
+            digest.update(chunk)
+            fout.write(chunk)
+    shutil.copystat(src, dest)
+    return digest.hexdigest()
+
+def entry_size(manifest):
+    return sum(f['size'] for f in manifest['files'])
+
+def read_manifest(entry):
+    try:
+        with open(os.path.join(entry, MANIFEST), 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+class Checkout(object):
+    """A cached bundle in use by a task; it is not evicted until released."""
+
+    def __init__(self, bundle, path, lock_file):
+        self.bundle = bundle
+        self.path = path
+        self.lock_file = lock_file
+
+    def release(self):
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+class RefCache(object):
+    """Node-local copies of reference data bundles, at
+    <root>/<bundle>/<version>, evicting the least recently used ones to stay
+    under limit_bytes.
+
+    Files are md5-summed while copied from the source and re-checked after
+    landing, and a copy only becomes visible (by a rename) once it is
+    complete.  When a registry directory is given, the host of every cached
+    copy is listed there (<registry>/<bundle>/<version>/<host>) for the
+    pipelines to send tasks to hosts that already hold their bundles.
+    """
+
+    def __init__(self, root=None, limit_bytes=None, registry=None, host=None):
+        self.root = root or os.environ.get(ENV_CACHE_ROOT, DEFAULT_CACHE_ROOT)
+        if limit_bytes is None:
+            limit_gb = float(os.environ.get(ENV_CACHE_LIMIT_GB, DEFAULT_CACHE_LIMIT_GB))
+            limit_bytes = int(limit_gb * 1024 ** 3)
+        self.limit_bytes = limit_bytes
+        self.registry = registry
+        self.host = host or socket.gethostname()
+        ensure_directory(self.root)
+
+    def entry(self, bundle):
+        return os.path.join(self.root, bundle.name, bundle.version)
+
+    def checkout(self, bundle):
+        """The bundle's cached copy, made first if needed.  Returns None (use
+        the source) when it can not be cached."""
+        checkout = self._checkout_cached(bundle)
+        if checkout is not None:
+            return checkout
+
+        with open(os.path.join(self.root, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # another task on this host may have copied it in the meantime
+            checkout = self._checkout_cached(bundle)
+            if checkout is None and self._copy(bundle):
+                checkout = self._checkout_cached(bundle)
+        return checkout
+
+    def _lock_in_use(self, entry):
+        """Takes the shared lock of an entry, or returns None without one.
+
+        An entry evicted (or replaced) between the open and the lock leaves
+        the lock on the old IN_USE file, so the locked file is checked to
+        still be the entry's."""
+        path = os.path.join(entry, IN_USE)
+        for _ in range(LOCK_ATTEMPTS):
+            try:
+                lock_file = open(path, 'r')
+            except (IOError, OSError):
+                return None
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            locked = os.fstat(lock_file.fileno())
+            try:
+                current = os.stat(path)
+            except (IOError, OSError):
+                current = None
+            if current is not None and (current.st_dev, current.st_ino) == (locked.st_dev, locked.st_ino):
+                return lock_file
+            lock_file.close()
+        return None
+
+    def _checkout_cached(self, bundle):
+        entry = self.entry(bundle)
+        lock_file = self._lock_in_use(entry)
+        if lock_file is None:
+            return None
+        manifest = read_manifest(entry)
+        if manifest is None or manifest.get('version') != bundle.version or not self._intact(entry, manifest):
+            lock_file.close()
+            return None
+        with open(os.path.join(entry, LAST_USED), 'a'):
+            os.utime(os.path.join(entry, LAST_USED), None)
+        return Checkout(bundle, entry, lock_file)
+
+    def _intact(self, entry, manifest):
+        for f in manifest['files']:
+            path = os.path.join(entry, f['path'])
+            if not os.path.isfile(path) or os.path.getsize(path) != f['size']:
+                log('{} is damaged ({})'.format(entry, f['path']))
+                return False
+        return True
+
+    def _copy(self, bundle):
+        if not os.path.isdir(bundle.source):
+            log('{}: no source directory {}'.format(bundle.name, bundle.source))
+            return False
+        files = source_files(bundle.source)
+        needed = sum(size for (path, size) in files)
+        if not self.make_room(needed, keep=self.entry(bundle)):
+            log('{}: {} bytes do not fit in {}'.format(bundle.name, needed, self.root))
+            return False
+
+        entry = self.entry(bundle)
+        partial = '{}.partial.{}'.format(entry, os.getpid())
+        if os.path.exists(entry):
+            self._remove(entry)
+        start = time.time()
+        log('copying {} ({} files, {} bytes) to {}'.format(bundle.source, len(files), needed, entry))
+        try:
+            checked = []
+            for (path, size) in files:
+                dest = os.path.join(partial, path)
+                ensure_directory(os.path.dirname(dest))
+                digest = copy_with_md5(os.path.join(bundle.source, path), dest)
+                if os.path.getsize(dest) != size or md5sum(dest) != digest:
+                    raise IOError('{} was not copied intact'.format(path))
+                checked.append({ 'path' : path, 'size' : size, 'md5' : digest })
+            manifest = {
+                'name' : bundle.name,
+                'version' : bundle.version,
+                'source' : bundle.source,
+                'files' : checked,
+            }
+            with open(os.path.join(partial, MANIFEST), 'w') as f:
+                json.dump(manifest, f)
+            open(os.path.join(partial, IN_USE), 'w').close()
+            os.rename(partial, entry)
+        except (IOError, OSError) as err:
+            log('{}: copy failed: {}'.format(bundle.name, err))
+            shutil.rmtree(partial, ignore_errors=True)
+            return False
+
+        log('copied {} in {:.0f}s'.format(bundle.name, time.time() - start))
+        self._register(bundle.name, bundle.version)
+        return True
+
+    def entries(self):
+        """The complete cached copies, least recently used first."""
+        entries = []
+        for name in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, name)
+            if not os.path.isdir(directory):
+                continue
+            for version in sorted(os.listdir(directory)):
+                entry = os.path.join(directory, version)
+                manifest = read_manifest(entry)
+                if manifest is None:
+                    continue
+                last_used = os.path.join(entry, LAST_USED)
+                used = os.path.getmtime(last_used if os.path.exists(last_used) else entry)
+                entries.append((used, entry, manifest))
+        entries.sort(key=lambda e: e[0])
+        return entries
+
+    def make_room(self, needed, keep=None):
+        """Evicts least recently used copies that are not in use until needed
+        bytes fit under the limit."""
+        if needed > self.limit_bytes:
+            return False
+        entries = [ e for e in self.entries() if e[1] != keep ]
+        used = sum(entry_size(m) for (t, e, m) in entries)
+        for (last_used, entry, manifest) in entries:
+            if used + needed <= self.limit_bytes:
+                break
+            if self._evict(entry, manifest):
+                used -= entry_size(manifest)
+        return used + needed <= self.limit_bytes
+
+    def _evict(self, entry, manifest):
+        with open(os.path.join(entry, IN_USE), 'r') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError) as err:
+                if err.errno in (errno.EAGAIN, errno.EACCES):
+                    return False
+                raise
+            self._remove(entry)
+        log('evicted {}'.format(entry))
+        self._unregister(manifest['name'], manifest['version'])
+        return True
+
+    def _remove(self, entry):
+        # hide it from new checkouts before deleting it
+        doomed = '{}.evicted.{}'.format(entry, os.getpid())
+        os.rename(entry, doomed)
+        shutil.rmtree(doomed, ignore_errors=True)
+
+    def _register(self, name, version):
+        if self.registry is None:
+            return
+        try:
+            directory = os.path.join(self.registry, name, version)
+            ensure_directory(directory)
+            open(os.path.join(directory, self.host), 'w').close()
+        except (IOError, OSError) as err:
+            log('could not register {} on {}: {}'.format(name, self.host, err))
+
+    def _unregister(self, name, version):
+        if self.registry is None:
+            return
+        try:
+            os.unlink(os.path.join(self.registry, name, version, self.host))
+        except (IOError, OSError):
+            pass
+
+def bundle_hosts(registry, bundle):
+    """The hosts listed in the registry as holding a copy of the bundle."""
+    directory = os.path.join(registry, bundle.name, bundle.version)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.listdir(directory))
+
+def checkout_bundles(names, registry=None):
+    """Checks out the named bundles, returning their Checkouts and the
+    environment pointing the stage scripts at the cached copies.  Bundles
+    that could not be cached are left out, and read from their source."""
+    checkouts = []
+    env = {}
+    if not names:
+        return (checkouts, env)
+    if ENV_CACHE_ROOT not in os.environ and os.path.exists('/.dockerenv'):
+        # the default root would be inside the container, and gone with it
+        log('${} is not set inside a container -- reading the sources'.format(ENV_CACHE_ROOT))
+        return (checkouts, env)
+    try:
+        cache = RefCache(registry=registry)
+    except (IOError, OSError) as err:
+        log('no reference cache: {}'.format(err))
+        return (checkouts, env)
+    for name in names:
+        bundle = BUNDLES[name]
+        try:
+            checkout = cache.checkout(bundle)
+        except (IOError, OSError) as err:
+            log('{}: {}'.format(name, err))
+            checkout = None
+        if checkout is None:
+            log('{}: reading {}'.format(name, bundle.source))
+            continue
+        checkouts.append(checkout)
+        env[bundle.env] = checkout.path
+    return (checkouts, env)
+
+@click.group()
+def cli():
+    pass
+
+@cli.command(name='list')
+@click.option('--root', default=None, type=click.Path(), help="the cache directory [default=$YAPS2_REFCACHE_ROOT or /tmp/yaps2-refcache]")
+def list_entries(root):
+    cache = RefCache(root=root)
+    for (last_used, entry, manifest) in reversed(cache.entries()):
+        used_on = datetime.datetime.fromtimestamp(last_used).strftime("%Y-%m-%d %H:%M:%S")
+        print('\t'.join([manifest['name'], manifest['version'], str(entry_size(manifest)), used_on, entry]))
+
+@cli.command()
+@click.option('--bundle', 'names', required=True, multiple=True, type=click.Choice(sorted(BUNDLES.keys())),
+              help='a bundle to copy into the cache')
+@click.option('--registry', default=None, type=click.Path(), help='the directory listing the hosts of the cached bundles')
+def warm(names, registry):
+    (checkouts, env) = checkout_bundles(names, registry)
+    for checkout in checkouts:
+        print('{}\t{}'.format(checkout.bundle.name, checkout.path))
+        checkout.release()
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,54 @@
+#!/gsc/bin/bash
+
+# merges the coordinate-sorted speedseq realign outputs of a sample's input
+# BAMs (see speedseq-realign.sh), and marks duplicates across all of them
+
+SPEEDSEQ_DIR=/gscmnt/sata849/info/speedseq_testing/v0.2.0-gms-testing/speedseq
+SAMBAMBA=${SPEEDSEQ_DIR}/bin/sambamba
+
+create_dir() {
+    local dir=$1
+    if [ ! -d "$dir" ]; then
+        echo "Creating directory: $dir"
+        mkdir -p "$dir"
+    fi
+}
+
+OUTPUT_PREFIX=$1
+TEMP=${YAPS2_SCRATCH:-$2}
+THREADS=$3
+PART_PREFIXES="${@:4}"
+
+echo "PART_PREFIXES:$PART_PREFIXES"
+
+create_dir $TEMP
+
+set -o errexit
+set -o pipefail
+
+parts() {
+    local suffix=$1
+    local files=""
+    for prefix in ${PART_PREFIXES}; do
+        files="${files} ${prefix}${suffix}"
+    done
+    echo ${files}
+}
+
+MERGED=${OUTPUT_PREFIX}.merged.bam
+
+# the duplicate flags set within each part are recomputed over the whole sample
+merge_cmd="${SAMBAMBA} merge -t ${THREADS} ${MERGED} $(parts .bam)"
+markdup_cmd="${SAMBAMBA} markdup -t ${THREADS} --tmpdir=${TEMP} ${MERGED} ${OUTPUT_PREFIX}.bam.tmp"
+mv_cmd="mv ${OUTPUT_PREFIX}.bam.tmp ${OUTPUT_PREFIX}.bam && mv ${OUTPUT_PREFIX}.bam.tmp.bai ${OUTPUT_PREFIX}.bam.bai"
+
+for kind in splitters discordants; do
+    cmd="${SAMBAMBA} merge -t ${THREADS} ${OUTPUT_PREFIX}.${kind}.bam $(parts .${kind}.bam)"
+    echo "EXECUTING: ${cmd}"
+    eval ${cmd}
+done
+
+for cmd in "${merge_cmd}" "${markdup_cmd}" "${mv_cmd}" "rm -f ${MERGED} ${MERGED}.bai"; do
+    echo "EXECUTING: ${cmd}"
+    eval ${cmd}
+done
@@ -20,9 +20,10 @@ setup_virtualenv() {
 }
 
 OUTPUT_PREFIX=$1
-TEMP=$2
+TEMP=${YAPS2_SCRATCH:-$2}
 REF=$3
-BAM_STRING="${@:4}"
+THREADS=$4
+BAM_STRING="${@:5}"
 
 echo "BAM_STRING:$BAM_STRING"
 echo "REF:$REF"
@@ -30,6 +31,6 @@ echo "REF:$REF"
 create_dir $TEMP
 setup_virtualenv
 
-cmd="${SPEEDSEQ} realign -o ${OUTPUT_PREFIX} -t 8 -T ${TEMP} ${REF} ${BAM_STRING}"
+cmd="${SPEEDSEQ} realign -o ${OUTPUT_PREFIX} -t ${THREADS} -T ${TEMP} ${REF} ${BAM_STRING}"
 echo "EXECUTING: ${cmd}"
 eval ${cmd}
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks submitting and tracking many independent tasks through the
+fake-lsf.py stand-in, comparing the batched yaps2 driver to polling bjobs
+once per scheduler loop with one bsub at a time (the cosmos LSF driver).
+"""
+
+from __future__ import print_function, division
+import os, sys, time, shutil, tempfile, subprocess
+
+import click
+
+from yaps2.lsf import BjobsPoller, bsub, bsub_many, lsf_command
+
+def setup_fake_lsf(state_dir):
+    fake = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake-lsf.py')
+    for name in ('bsub', 'bjobs', 'bkill'):
+        os.environ['YAPS2_{}'.format(name.upper())] = ' '.join([sys.executable, fake, name])
+    os.environ['FAKE_LSF_DIR'] = state_dir
+
+def bjobs_all():
+    out = subprocess.check_output(lsf_command('bjobs') + ['-a'])
+    lines = out.decode('utf-8').splitlines()
+    return { l.split()[0] : l.split()[2] for l in lines[1:] if l.strip() }
+
+def run_naive(n_tasks, loop_sleep):
+    stats = {'bsub' : 0, 'bjobs' : 0}
+    outstanding = set()
+    start = time.time()
+    for i in range(n_tasks):
+        outstanding.add(str(bsub(['-q', 'bench', 'true'])))
+        stats['bsub'] += 1
+    stats['submitted'] = time.time() - start
+
+    failed = 0
+    while outstanding:
+        jobs = bjobs_all()
+        stats['bjobs'] += 1
+        for jobid in list(outstanding):
+            if jobs.get(jobid) in ('DONE', 'EXIT'):
+                failed += jobs[jobid] == 'EXIT'
+                outstanding.remove(jobid)
+        time.sleep(loop_sleep)
+
+    stats['failed'] = failed
+    stats['total'] = time.time() - start
+    return stats
+
+def run_batched(n_tasks, loop_sleep, workers, min_interval, max_interval):
+    stats = {'bsub' : 0}
+    poller = BjobsPoller(min_interval=min_interval, max_interval=max_interval)
+    start = time.time()
+    job_ids = bsub_many([ ['-q', 'bench', 'true'] for i in range(n_tasks) ], workers=workers)
+    stats['bsub'] = len(job_ids)
+    errors = [ j for j in job_ids if isinstance(j, Exception) ]
+    outstanding = set()
+    for jobid in job_ids:
+        if not isinstance(jobid, Exception):
+            poller.watch(jobid)
+            outstanding.add(jobid)
+    stats['submitted'] = time.time() - start
+
+    failed = len(errors)
+    while outstanding:
+        poller.poll()
+        for jobid in list(outstanding):
+            if poller.is_finished(jobid):
+                failed += poller.status(jobid)['stat'] != 'DONE'
+                poller.forget(jobid)
+                outstanding.remove(jobid)
+        time.sleep(loop_sleep)
+
+    stats['bjobs'] = poller.calls
+    stats['failed'] = failed
+    stats['total'] = time.time() - start
+    return stats
+
+@click.command()
+@click.option('--tasks', default=10000, type=click.INT, help='number of tasks to submit [default=10000]')
+@click.option('--mode', default='batched', type=click.Choice(['batched', 'naive']),
+              help='batched yaps2 driver or one-at-a-time submission and polling [default=batched]')
+@click.option('--workers', default=16, type=click.INT, help='concurrent bsub calls [default=16]')
+@click.option('--loop-sleep', default=0.3, type=click.FLOAT, help='scheduler loop sleep in seconds [default=0.3]')
+@click.option('--min-interval', default=5, type=click.FLOAT, help='shortest bjobs interval [default=5]')
+@click.option('--max-interval', default=60, type=click.FLOAT, help='longest bjobs interval [default=60]')
+@click.option('--state-dir', default=None, type=click.Path(),
+              help='fake-lsf state directory [default=a temporary directory]')
+def main(tasks, mode, workers, loop_sleep, min_interval, max_interval, state_dir):
+    cleanup = state_dir is None
+    state_dir = state_dir or tempfile.mkdtemp(prefix='fake-lsf-')
+    setup_fake_lsf(state_dir)
+    try:
+        if mode == 'naive':
+            stats = run_naive(tasks, loop_sleep)
+        else:
+            stats = run_batched(tasks, loop_sleep, workers, min_interval, max_interval)
+    finally:
+        if cleanup:
+            shutil.rmtree(state_dir)
+
+    print("mode\ttasks\tfailed\tbsub_calls\tbjobs_calls\tsubmit_secs\ttotal_secs\ttasks_per_sec")
+    print("\t".join(str(x) for x in (
+        mode, tasks, stats['failed'], stats['bsub'], stats['bjobs'],
+        round(stats['submitted'], 2), round(stats['total'], 2),
+        round(tasks / stats['total'], 2),
+    )))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+"""
+A stand-in for the LSF bsub, bjobs and bkill commands, to exercise and
+benchmark the yaps2 LSF driver without a cluster.
+
+    fake-lsf.py bsub [-o out] [-e err] [-K] [other bsub options] command ...
+    fake-lsf.py bjobs [-a] [-o "jobid stat exit_code"] [-json]
+    fake-lsf.py bkill jobid ...
+
+Point yaps2 at it with e.g. YAPS2_BSUB="python fake-lsf.py bsub" (and the same
+for YAPS2_BJOBS and YAPS2_BKILL).  It is configured through the environment:
+
+    FAKE_LSF_DIR         where the job state is kept [default=~/.fake-lsf]
+    FAKE_LSF_LATENCY     seconds every command takes to respond [default=0]
+    FAKE_LSF_PEND_TIME   seconds a job stays pending [default=0]
+    FAKE_LSF_RUN_TIME    seconds a job stays running [default=1]
+    FAKE_LSF_FAIL_RATE   fraction of the jobs that exit with an error [default=0]
+    FAKE_LSF_ERROR_RATE  fraction of the commands that fail outright [default=0]
+    FAKE_LSF_EXECUTE     if 1, really run the jobs' commands in the background,
+                         and report their real state and exit code [default=0]
+"""
+
+from __future__ import print_function, division
+import os, sys, json, time, random, sqlite3, subprocess
+
+# bsub options that do not take a value
+BSUB_FLAGS = ('-N', '-K', '-I', '-Ip', '-Is', '-B', '-x', '-r', '-rn', '-H')
+
+def setting(name, default, convert=float):
+    return convert(os.environ.get('FAKE_LSF_{}'.format(name), default))
+
+def state_dir():
+    path = os.environ.get('FAKE_LSF_DIR', os.path.join(os.path.expanduser('~'), '.fake-lsf'))
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
+
+def connect():
+    conn = sqlite3.connect(os.path.join(state_dir(), 'jobs.db'), timeout=120)
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS jobs ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+        'submitted REAL, fail INTEGER, killed INTEGER DEFAULT 0, '
+        'queue TEXT, command TEXT)'
+    )
+    return conn
+
+def exit_file(jobid):
+    return os.path.join(state_dir(), '{}.exit'.format(jobid))
+
+def job_state(job, now, pend_time, run_time):
+    jobid, submitted, fail, killed = job
+    if killed:
+        return ('EXIT', 130)
+
+    if setting('EXECUTE', 0, int):
+        path = exit_file(jobid)
+        if not os.path.isfile(path):
+            return ('RUN', None)
+        with open(path) as f:
+            code = int(f.read().strip() or 1)
+        return ('DONE', None) if code == 0 else ('EXIT', code)
+
+    elapsed = now - submitted
+    if elapsed < pend_time:
+        return ('PEND', None)
+    elif elapsed < pend_time + run_time:
+        return ('RUN', None)
+    elif fail:
+        return ('EXIT', 1)
+    else:
+        return ('DONE', None)
+
+def parse_bsub_args(args):
+    options = {}
+    i = 0
+    while i < len(args) and args[i].startswith('-'):
+        if args[i] in BSUB_FLAGS:
+            options[args[i]] = True
+            i += 1
+        else:
+            options[args[i]] = args[i + 1]
+            i += 2
+    return options, args[i:]
+
+def bsub(args):
+    options, command = parse_bsub_args(args)
+    if not command:
+        print('Job not submitted: no command given', file=sys.stderr)
+        return 255
+
+    queue = options.get('-q', 'normal')
+    fail = random.random() < setting('FAIL_RATE', 0)
+    conn = connect()
+    with conn:
+        cursor = conn.execute(
+            'INSERT INTO jobs (submitted, fail, queue, command) VALUES (?, ?, ?, ?)',
+            (time.time(), int(fail), queue, ' '.join(command))
+        )
+        jobid = cursor.lastrowid
+    conn.close()
+
+    for opt in ('-o', '-e'):
+        if opt in options:
+            open(options[opt], 'a').close()
+
+    if setting('EXECUTE', 0, int):
+        shell_cmd = '{cmd} >>{out} 2>>{err}; echo $? > {exit}'.format(
+            cmd=' '.join(command),
+            out=options.get('-o', '/dev/null'),
+            err=options.get('-e', '/dev/null'),
+            exit=exit_file(jobid),
+        )
+        env = dict(os.environ, LSB_JOBID=str(jobid))
+        subprocess.Popen(['/bin/bash', '-c', shell_cmd], env=env, close_fds=True)
+
+    print('Job <{}> is submitted to queue <{}>.'.format(jobid, queue))
+
+    if '-K' in options:
+        print('<<Waiting for dispatch ...>>')
+        while True:
+            state, code = bjobs_states([jobid])[jobid]
+            if state in ('DONE', 'EXIT'):
+                print('<<Job is finished>>')
+                return 0 if state == 'DONE' else (code or 1)
+            time.sleep(1)
+    return 0
+
+def bjobs_states(jobids=None):
+    pend_time = setting('PEND_TIME', 0)
+    run_time = setting('RUN_TIME', 1)
+    now = time.time()
+
+    conn = connect()
+    rows = conn.execute('SELECT id, submitted, fail, killed FROM jobs').fetchall()
+    conn.close()
+
+    if jobids is not None:
+        wanted = set(jobids)
+        rows = [ r for r in rows if r[0] in wanted ]
+    return { r[0] : job_state(r, now, pend_time, run_time) for r in rows }
+
+def bjobs(args):
+    as_json = '-json' in args
+    states = bjobs_states()
+    if '-a' not in args:
+        states = { k : v for k, v in states.items() if v[0] not in ('DONE', 'EXIT') }
+
+    if as_json:
+        records = [
+            {'JOBID' : str(jobid), 'STAT' : state, 'EXIT_CODE' : '' if code is None else str(code)}
+            for jobid, (state, code) in sorted(states.items())
+        ]
+        print(json.dumps({'COMMAND' : 'bjobs', 'JOBS' : len(records), 'RECORDS' : records}))
+    else:
+        print('   '.join(['JOBID', 'USER', 'STAT', 'QUEUE']))
+        user = os.environ.get('USER', 'user')
+        for jobid, (state, code) in sorted(states.items()):
+            print('   '.join([str(jobid), user, state, 'normal']))
+    return 0
+
+def bkill(args):
+    jobids = [ int(a) for a in args if a.isdigit() ]
+    conn = connect()
+    with conn:
+        conn.executemany('UPDATE jobs SET killed = 1 WHERE id = ?', [ (j,) for j in jobids ])
+    conn.close()
+    for jobid in jobids:
+        print('Job <{}> is being terminated'.format(jobid))
+    return 0
+
+def main(argv):
+    commands = { 'bsub' : bsub, 'bjobs' : bjobs, 'bkill' : bkill }
+    if len(argv) < 2 or argv[1] not in commands:
+        print(__doc__, file=sys.stderr)
+        return 1
+
+    time.sleep(setting('LATENCY', 0))
+    if random.random() < setting('ERROR_RATE', 0):
+        print('LSF is down. Please wait ...', file=sys.stderr)
+        return 255
+
+    return commands[argv[1]](argv[2:])
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
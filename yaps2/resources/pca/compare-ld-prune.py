@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""
+Checks the yaps2 LD pruning (yaps2.ldprune) against plink on a synthetic
+cohort: both prune the same simulated genotypes with
+--indep-pairwise 50 5 0.3 --maf 0.05 --geno 0, and the .prune.in sets are
+compared.
+"""
+
+from __future__ import print_function, division
+import os, sys, shutil, tempfile, subprocess
+
+import click
+import numpy as np
+
+from yaps2.genotypes import BedWriter
+from yaps2.ldprune import ld_prune
+
+def simulate(n_samples, n_variants, block_size, seed):
+    """Genotypes with LD: variants are drawn in blocks from a few founder
+    haplotypes, with mutations breaking down the correlations, and a few
+    missing calls and rare variants to exercise the filters."""
+    rng = np.random.RandomState(seed)
+    genotypes = np.empty((n_variants, n_samples), dtype=np.int8)
+    for start in range(0, n_variants, block_size):
+        stop = min(start + block_size, n_variants)
+        founders = rng.randint(0, 2, size=(4, stop - start))
+        origin = rng.randint(0, 4, size=2 * n_samples)
+        haplotypes = founders[origin].T
+        noise = rng.random_sample(haplotypes.shape) < rng.uniform(0, 0.3, size=(stop - start, 1))
+        haplotypes = np.where(noise, 1 - haplotypes, haplotypes)
+        rare = rng.random_sample(stop - start) < 0.05
+        haplotypes[rare] = rng.random_sample((rare.sum(), 2 * n_samples)) < 0.01
+        genotypes[start:stop] = haplotypes[:, :n_samples] + haplotypes[:, n_samples:]
+
+    missing = rng.random_sample(genotypes.shape) < 0.0005
+    genotypes[missing] = -1
+    return genotypes
+
+def write_cohort(prefix, genotypes):
+    (n_variants, n_samples) = genotypes.shape
+    fam = [ ['S{}'.format(i), 'S{}'.format(i), '0', '0', '0', '-9'] for i in range(n_samples) ]
+    bim = [ ['1', 'v{}'.format(i), '0', str(1000 * (i + 1)), 'A', 'C'] for i in range(n_variants) ]
+    writer = BedWriter(prefix, fam)
+    writer.write(genotypes, bim)
+    writer.close()
+
+def read_ids(path):
+    with open(path, 'r') as f:
+        return [ line.strip() for line in f if line.strip() ]
+
+@click.command()
+@click.option('--plink', default='plink', type=click.STRING, help='the plink 1.9 executable [default=plink]')
+@click.option('--samples', default=500, type=click.INT, help='simulated samples [default=500]')
+@click.option('--variants', default=20000, type=click.INT, help='simulated variants [default=20000]')
+@click.option('--block-size', default=40, type=click.INT, help='variants per LD block [default=40]')
+@click.option('--seed', default=1, type=click.INT, help='random seed [default=1]')
+@click.option('--keep', default=None, type=click.Path(), help='keep the files in this directory')
+def main(plink, samples, variants, block_size, seed, keep):
+    workdir = keep or tempfile.mkdtemp(prefix='compare-ld-prune-')
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    try:
+        cohort = os.path.join(workdir, 'cohort')
+        write_cohort(cohort, simulate(samples, variants, block_size, seed))
+
+        plink_out = os.path.join(workdir, 'plink')
+        subprocess.check_call([
+            plink, '--bfile', cohort, '--allow-no-sex',
+            '--maf', '0.05', '--geno', '0', '--indep-pairwise', '50', '5', '0.3',
+            '--out', plink_out,
+        ])
+        yaps2_out = os.path.join(workdir, 'yaps2')
+        ld_prune(cohort, yaps2_out)
+
+        expected = read_ids('.'.join([plink_out, 'prune.in']))
+        observed = read_ids('.'.join([yaps2_out, 'prune.in']))
+        common = set(expected) & set(observed)
+        print("plink_kept\tyaps2_kept\tshared\tonly_plink\tonly_yaps2")
+        print("\t".join(str(x) for x in (
+            len(expected), len(observed), len(common),
+            len(expected) - len(common), len(observed) - len(common),
+        )))
+        sys.exit(0 if expected == observed else 1)
+    finally:
+        if keep is None:
+            shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    main()
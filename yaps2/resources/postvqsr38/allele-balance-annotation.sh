@@ -2,6 +2,8 @@
 
 set -ueo pipefail
 
+source $(dirname ${BASH_SOURCE[0]})/../scratch.sh
+
 BGZIP=/gscmnt/gc2802/halllab/idas/software/local/bin/bgzip
 TABIX=/gscmnt/gc2802/halllab/idas/software/local/bin/tabix
 BCFTOOLS=/gscmnt/gc2802/halllab/idas/software/local/bin/bcftools1.4
@@ -42,7 +44,7 @@ function allele_balance_annotation {
         exit 0
     fi
 
-    TMPVCF=$OUTVCF.temp
+    TMPVCF=$(stage_tmp_path $OUTVCF)
 
     set -o xtrace
     ${PYTHON} ${SCRIPT} \
@@ -50,8 +52,8 @@ function allele_balance_annotation {
         ${INVCF} \
         | ${BGZIP} -c > ${TMPVCF} \
         && ${TABIX} -p vcf -f ${TMPVCF} \
-        && mv $TMPVCF.tbi $OUTVCF.tbi \
-        && mv $TMPVCF $OUTVCF ;
+        && stage_out $TMPVCF.tbi $OUTVCF.tbi \
+        && stage_out $TMPVCF $OUTVCF ;
     set +o xtrace
 }
 
@@ -2,6 +2,9 @@
 
 set -eo pipefail
 
+source $(dirname ${BASH_SOURCE[0]})/../scratch.sh
+source $(dirname ${BASH_SOURCE[0]})/vcf-samples.sh
+
 # http://stackoverflow.com/questions/9893667/is-there-a-way-to-write-a-bash-function-which-aborts-the-whole-execution-no-mat
 trap "exit 1" TERM
 export TOP_PID=$$
@@ -83,8 +86,8 @@ function tabix_and_finalize_vcf {
 	local finalvcf=$2
     local cmd="
     ${TABIX} -p vcf -f ${tmpvcf} \
-        && mv ${tmpvcf}.tbi ${finalvcf}.tbi \
-        && mv ${tmpvcf} ${finalvcf}
+        && stage_out ${tmpvcf}.tbi ${finalvcf}.tbi \
+        && stage_out ${tmpvcf} ${finalvcf}
     "
     run_cmd "${cmd}"
 }
@@ -122,7 +125,7 @@ function run_LCR_annotation {
     local tmpvcf=${outvcf}.tmp
 
     # the LCR annotation file
-    local base=/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/annotations
+    local base=${YAPS2_REF_GRCH38_ANNOTATIONS:-/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/annotations}
     local anno_vcf=${base}/LCR-hs38.bed.gz
 
     if [[ ! -e ${anno_vcf} ]]; then
@@ -168,7 +171,7 @@ function run_centromeres_annotation {
     local tmpvcf=${outvcf}.tmp
 
     # the centromeres annotation file
-    local base=/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/annotations
+    local base=${YAPS2_REF_GRCH38_ANNOTATIONS:-/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/annotations}
     local anno_vcf=${base}/centromeres.bed.gz
 
     if [[ ! -e ${anno_vcf} ]]; then
@@ -214,7 +217,7 @@ function run_segdups_annotation {
     local tmpvcf=${outvcf}.tmp
 
     # the segdups annotation file
-    local base=/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/annotations
+    local base=${YAPS2_REF_GRCH38_ANNOTATIONS:-/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/annotations}
     local anno_vcf=${base}/segdups.bed.gz
 
     if [[ ! -e ${anno_vcf} ]]; then
@@ -260,7 +263,7 @@ function run_satellite_annotation {
     local tmpvcf=${outvcf}.tmp
 
     # the satellite annotation file
-    local base=/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/annotations
+    local base=${YAPS2_REF_GRCH38_ANNOTATIONS:-/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/annotations}
     local anno_vcf=${base}/satellite.hg38.bed.gz
 
     if [[ ! -e ${anno_vcf} ]]; then
@@ -306,7 +309,7 @@ function run_full_pipeline_annotation {
     local tmpvcf=${outvcf}.tmp
 
     # the annotation files
-    local base=/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/annotations
+    local base=${YAPS2_REF_GRCH38_ANNOTATIONS:-/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/annotations}
     local lcr_vcf=${base}/LCR-hs38.bed.gz
     local centromeres_vcf=${base}/centromeres.bed.gz
     local segdups_vcf=${base}/segdups.bed.gz
@@ -398,7 +401,14 @@ function add_samples_on_b38_annotated_vcf {
         return 0;
     fi
 
-    local tmpvcf=${final_b38_output_vcf}.tmp
+    local tmpvcf=$(stage_tmp_path ${final_b38_output_vcf})
+
+    if sites_only; then
+        log "sites-only input -- not adding samples"
+        run_cmd "cp ${b38_annotated_no_samples_vcf} ${tmpvcf}"
+        tabix_and_finalize_vcf ${tmpvcf} ${final_b38_output_vcf}
+        return 0;
+    fi
 
     local cmd1="
 	vcf_add_samples ${b38_annotated_no_samples_vcf} ${original_b38_input_vcf} \
@@ -413,8 +423,7 @@ function annotate_vcf {
     local b38_invcf=$1
     local b38_outvcf=$2
 
-    local scratch_dir=$(dirname ${b38_outvcf})/scratch
-    mkdir -p ${scratch_dir}
+    local scratch_dir=$(stage_scratch_dir $(dirname ${b38_outvcf})/scratch)
 
     log "Remove samples on b38 input vcf"
     local b38_invcf_no_samples=$(prune_samples_on_b38_vcf ${b38_invcf} ${scratch_dir})
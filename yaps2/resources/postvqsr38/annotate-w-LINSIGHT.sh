@@ -2,6 +2,9 @@
 
 set -eo pipefail
 
+source $(dirname ${BASH_SOURCE[0]})/../scratch.sh
+source $(dirname ${BASH_SOURCE[0]})/vcf-samples.sh
+
 # http://stackoverflow.com/questions/9893667/is-there-a-way-to-write-a-bash-function-which-aborts-the-whole-execution-no-mat
 trap "exit 1" TERM
 export TOP_PID=$$
@@ -89,8 +92,8 @@ function tabix_and_finalize_vcf {
 	local finalvcf=$2
     local cmd="
     ${TABIX} -p vcf -f ${tmpvcf} \
-        && mv ${tmpvcf}.tbi ${finalvcf}.tbi \
-        && mv ${tmpvcf} ${finalvcf}
+        && stage_out ${tmpvcf}.tbi ${finalvcf}.tbi \
+        && stage_out ${tmpvcf} ${finalvcf}
     "
     run_cmd "${cmd}"
 }
@@ -217,7 +220,7 @@ function run_LINSIGHT_annotation {
     local tmpvcf=${outvcf}.tmp
 
     # the LINSIGHT annotation file
-    local base=/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/annotations
+    local base=${YAPS2_REF_GRCH38_ANNOTATIONS:-/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/annotations}
     local anno_vcf=${base}/LINSIGHT.bed.gz
 
     if [[ ! -e ${anno_vcf} ]]; then
@@ -290,7 +293,14 @@ function add_samples_on_b38_annotated_vcf {
         return 0;
     fi
 
-    local tmpvcf=${final_b38_output_vcf}.tmp
+    local tmpvcf=$(stage_tmp_path ${final_b38_output_vcf})
+
+    if sites_only; then
+        log "sites-only input -- not adding samples"
+        run_cmd "cp ${b38_annotated_no_samples_vcf} ${tmpvcf}"
+        tabix_and_finalize_vcf ${tmpvcf} ${final_b38_output_vcf}
+        return 0;
+    fi
 
     local cmd1="
 	vcf_add_samples ${b38_annotated_no_samples_vcf} ${original_b38_input_vcf} \
@@ -306,8 +316,7 @@ function annotate_vcf {
     local b38_outvcf=$2
     local integrate_script=$3
 
-    local scratch_dir=$(dirname ${b38_outvcf})/scratch
-    mkdir -p ${scratch_dir}
+    local scratch_dir=$(stage_scratch_dir $(dirname ${b38_outvcf})/scratch)
 
     log "Remove samples on b38 input vcf"
     local b38_invcf_no_samples=$(prune_samples_on_b38_vcf ${b38_invcf} ${scratch_dir})
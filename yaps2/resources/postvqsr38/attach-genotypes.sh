@@ -0,0 +1,46 @@
+#!/bin/bash
+
+set -ueo pipefail
+
+source $(dirname ${BASH_SOURCE[0]})/../scratch.sh
+
+BGZIP=/gscmnt/gc2802/halllab/idas/software/local/bin/bgzip
+TABIX=/gscmnt/gc2802/halllab/idas/software/local/bin/tabix
+
+PYTHON=$1
+OUTVCF=$2
+# <sites vcf> <genotype sidecar> pairs, in order
+PAIRS=( "${@:3}" )
+
+function log {
+    local timestamp=$(date +"%Y-%m-%d %T")
+    echo "---> [ ${timestamp} ] $@" >&2
+}
+
+function attach_genotypes {
+    if [ -e $OUTVCF ]
+    then
+        exit 0
+    fi
+
+    local pair_args=""
+    for ((i = 0; i < ${#PAIRS[@]}; i += 2)); do
+        pair_args+=" --pair ${PAIRS[$i]} ${PAIRS[$((i + 1))]}"
+    done
+
+    TMPVCF=$(stage_tmp_path $OUTVCF)
+    set -o xtrace
+    ${PYTHON} -m yaps2.annotation attach ${pair_args} \
+        | ${BGZIP} -c > ${TMPVCF} \
+        && ${TABIX} -p vcf -f ${TMPVCF} \
+        && stage_out ${TMPVCF}.tbi ${OUTVCF}.tbi \
+        && stage_out ${TMPVCF} ${OUTVCF} ;
+    set +o xtrace
+}
+
+function main {
+    log "Attaching the genotypes of ${PAIRS[@]}"
+    attach_genotypes ;
+}
+
+main ;
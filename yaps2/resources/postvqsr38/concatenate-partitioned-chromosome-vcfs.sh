@@ -2,6 +2,8 @@
 
 set -eo pipefail
 
+source $(dirname ${BASH_SOURCE[0]})/../scratch.sh
+
 # http://stackoverflow.com/questions/9893667/is-there-a-way-to-write-a-bash-function-which-aborts-the-whole-execution-no-mat
 trap "exit 1" TERM
 export TOP_PID=$$
@@ -83,8 +85,8 @@ function tabix_and_finalize_vcf {
 	local finalvcf=$2
     local cmd="
     ${TABIX} -p vcf -f ${tmpvcf} \
-        && mv ${tmpvcf}.tbi ${finalvcf}.tbi \
-        && mv ${tmpvcf} ${finalvcf}
+        && stage_out ${tmpvcf}.tbi ${finalvcf}.tbi \
+        && stage_out ${tmpvcf} ${finalvcf}
     "
     run_cmd "${cmd}"
 }
@@ -93,7 +95,7 @@ function merge {
     local params_string=$@
     eval "local -A params=${params_string}"
     local out_vcf=${params[final_merged_vcf]}
-    local tmp_vcf=${out_vcf}.tmp
+    local tmp_vcf=$(stage_tmp_path ${out_vcf})
     local input_vcfs=${params[input_vcfs]}
 
     if [[ -e "${out_vcf}" ]]; then
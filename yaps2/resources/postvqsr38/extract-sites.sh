@@ -0,0 +1,42 @@
+#!/bin/bash
+
+set -ueo pipefail
+
+source $(dirname ${BASH_SOURCE[0]})/../scratch.sh
+
+BCFTOOLS=/gscmnt/gc2802/halllab/idas/software/local/bin/bcftools1.4
+TABIX=/gscmnt/gc2802/halllab/idas/software/local/bin/tabix
+
+INVCF=$1
+OUTVCF=$2
+# e.g. 'PASS': only keep the records with one of these (comma-separated) FILTERs
+FILTERS=${3:-}
+
+function log {
+    local timestamp=$(date +"%Y-%m-%d %T")
+    echo "---> [ ${timestamp} ] $@" >&2
+}
+
+function extract_sites {
+    if [ -e $OUTVCF ]
+    then
+        exit 0
+    fi
+
+    local filter_args=""
+    if [ -n "${FILTERS}" ]
+    then
+        filter_args="--apply-filters ${FILTERS}"
+    fi
+
+    TMPVCF=$(stage_tmp_path $OUTVCF)
+    ${BCFTOOLS} view --drop-genotypes ${filter_args} $INVCF --output-type z --output-file $TMPVCF \
+        && ${TABIX} -p vcf -f $TMPVCF && stage_out $TMPVCF.tbi $OUTVCF.tbi && stage_out $TMPVCF $OUTVCF
+}
+
+function main {
+    log "Extracting the sites of ${INVCF}"
+    extract_sites ;
+}
+
+main ;
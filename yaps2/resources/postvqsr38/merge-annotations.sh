@@ -0,0 +1,42 @@
+#!/bin/bash
+
+set -ueo pipefail
+
+source $(dirname ${BASH_SOURCE[0]})/../scratch.sh
+
+BGZIP=/gscmnt/gc2802/halllab/idas/software/local/bin/bgzip
+TABIX=/gscmnt/gc2802/halllab/idas/software/local/bin/tabix
+
+PYTHON=$1
+INVCF=$2
+OUTVCF=$3
+# '--annotated <vcf>' / '--chunks <vcf>' arguments of `yaps2.annotation merge`
+MERGE_ARGS="${@:4}"
+
+function log {
+    local timestamp=$(date +"%Y-%m-%d %T")
+    echo "---> [ ${timestamp} ] $@" >&2
+}
+
+function merge_annotations {
+    if [ -e $OUTVCF ]
+    then
+        exit 0
+    fi
+
+    TMPVCF=$(stage_tmp_path $OUTVCF)
+    set -o xtrace
+    ${PYTHON} -m yaps2.annotation merge --base ${INVCF} ${MERGE_ARGS} \
+        | ${BGZIP} -c > ${TMPVCF} \
+        && ${TABIX} -p vcf -f ${TMPVCF} \
+        && stage_out ${TMPVCF}.tbi ${OUTVCF}.tbi \
+        && stage_out ${TMPVCF} ${OUTVCF} ;
+    set +o xtrace
+}
+
+function main {
+    log "Merging the annotations of ${MERGE_ARGS} into ${INVCF}"
+    merge_annotations ;
+}
+
+main ;
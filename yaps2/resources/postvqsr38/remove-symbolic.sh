@@ -2,6 +2,8 @@
 
 set -ueo pipefail
 
+source $(dirname ${BASH_SOURCE[0]})/../scratch.sh
+
 BCFTOOLS=/gscmnt/gc2802/halllab/idas/software/local/bin/bcftools1.4
 TABIX=/gscmnt/gc2802/halllab/idas/software/local/bin/tabix
 
@@ -38,9 +40,9 @@ function remove_symbolic {
         exit 0
     fi
 
-    TMPVCF=$OUTVCF.temp
+    TMPVCF=$(stage_tmp_path $OUTVCF)
     ${BCFTOOLS} view -e '%TYPE="other" || ALT="*"' $INVCF --output-type z --output-file $TMPVCF \
-        && ${TABIX} -p vcf -f $TMPVCF && mv $TMPVCF.tbi $OUTVCF.tbi && mv $TMPVCF $OUTVCF
+        && ${TABIX} -p vcf -f $TMPVCF && stage_out $TMPVCF.tbi $OUTVCF.tbi && stage_out $TMPVCF $OUTVCF
 }
 
 function main {
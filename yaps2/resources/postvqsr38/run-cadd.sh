@@ -2,6 +2,9 @@
 
 set -eo pipefail
 
+source $(dirname ${BASH_SOURCE[0]})/../scratch.sh
+source $(dirname ${BASH_SOURCE[0]})/vcf-samples.sh
+
 # http://stackoverflow.com/questions/9893667/is-there-a-way-to-write-a-bash-function-which-aborts-the-whole-execution-no-mat
 trap "exit 1" TERM
 export TOP_PID=$$
@@ -88,8 +91,8 @@ function tabix_and_finalize_vcf {
 	local finalvcf=$2
     local cmd="
     ${TABIX} -p vcf -f ${tmpvcf} \
-        && mv ${tmpvcf}.tbi ${finalvcf}.tbi \
-        && mv ${tmpvcf} ${finalvcf}
+        && stage_out ${tmpvcf}.tbi ${finalvcf}.tbi \
+        && stage_out ${tmpvcf} ${finalvcf}
     "
     run_cmd "${cmd}"
 }
@@ -220,7 +223,7 @@ function remove_grc37_unplaced_contigs {
 function run_cadd {
     local invcf=$1
     local outdir=$(dirname ${invcf})
-    local tsv=${outdir}/cadd-annotation.tsv.gz
+    local tsv=${2:-${outdir}/cadd-annotation.tsv.gz}
 
     if [[ -e "${tsv}" ]]; then
         log "shortcutting run_cadd"
@@ -236,7 +239,7 @@ function run_cadd {
     export PERL5LIB=/gscmnt/gc2719/halllab/src/speedseq/bin:${PERL5LIB}
     export PATH=${perl_path}:${awk_path}:${htslib_path}:${PATH}
 
-    local cadd_dir=/gscmnt/gc2802/halllab/abelhj/CADD/CADD_v1.2
+    local cadd_dir=${YAPS2_REF_CADD:-/gscmnt/gc2802/halllab/abelhj/CADD/CADD_v1.2}
     local cadd_score_script=${cadd_dir}/bin/score.sh
 
     local cmd="/bin/bash ${cadd_score_script} ${invcf} ${tmptsv} && mv ${tmptsv} ${tsv}"
@@ -313,7 +316,14 @@ function add_samples_on_b38_cadd_vcf {
         return 0;
     fi
 
-    local tmpvcf=${final_b38_output_vcf}.tmp
+    local tmpvcf=$(stage_tmp_path ${final_b38_output_vcf})
+
+    if sites_only; then
+        log "sites-only input -- not adding samples"
+        run_cmd "cp ${b38_annotated_no_samples_vcf} ${tmpvcf}"
+        tabix_and_finalize_vcf ${tmpvcf} ${final_b38_output_vcf}
+        return 0;
+    fi
 
     local cmd1="
 	vcf_add_samples ${b38_annotated_no_samples_vcf} ${original_b38_input_vcf} \
@@ -330,8 +340,7 @@ function annotate_vcf {
     local merge_script=$3
     local integrate_script=$4
 
-    local scratch_dir=$(dirname ${b38_outvcf})/scratch
-    mkdir -p ${scratch_dir}
+    local scratch_dir=$(stage_scratch_dir $(dirname ${b38_outvcf})/scratch)
 
     log "Remove samples on b38 input vcf"
     local b38_invcf_no_samples=$(prune_samples_on_b38_vcf ${b38_invcf} ${scratch_dir})
@@ -351,6 +360,129 @@ function annotate_vcf {
     add_samples_on_b38_cadd_vcf ${b38_invcf} ${b38_cadd_vcf} ${b38_outvcf}
 }
 
+# The chunked mode of the CADD stage (see create_chunked_cadd_annotation_tasks
+# in yaps2/pipelines/postvqsr38.py): --prepare-chunks lifts the sites over to
+# GRCh37 once and splits them into consecutive chunks of about the same
+# number of records, --score-chunk runs CADD on one of them (a job per
+# chunk), and --finish-chunks merges their scores and annotates the b38 vcf.
+# Every step is skipped when its output already exists.
+
+function prepare_chunks {
+    local b38_invcf=$1
+    local workdir=$2
+    local chunks=$3
+    # the python of the pipeline, which has yaps2 installed
+    local python=$4
+
+    if [[ -e "${workdir}/chunk${chunks}/grc37.vcf.gz" ]]; then
+        log "shortcutting prepare_chunks"
+        return 0;
+    fi
+
+    mkdir -p ${workdir}
+    log "Remove samples on b38 input vcf"
+    local b38_invcf_no_samples=$(prune_samples_on_b38_vcf ${b38_invcf} ${workdir})
+    local grc37_vcf=${b38_invcf_no_samples}
+    if ! is_empty_vcf ${b38_invcf} ; then
+        log "Entering liftOver hg19"
+        local hg19_vcf=$(run_liftover_hg19 ${b38_invcf_no_samples})
+        log "Entering liftOver GRCh37"
+        local grc37_all_vcf=$(run_liftover_grc37 ${hg19_vcf})
+        log "Entering remove unplaced GRCh37 contigs"
+        grc37_vcf=$(remove_grc37_unplaced_contigs ${grc37_all_vcf})
+    fi
+
+    log "Splitting ${grc37_vcf} into ${chunks} chunks"
+    run_cmd "${python} -m yaps2.annotation split --vcf ${grc37_vcf} --chunks ${chunks} --out-prefix ${workdir}/split"
+    for ((i = 1; i <= ${chunks}; i++)); do
+        mkdir -p ${workdir}/chunk${i}
+        local chunk=${workdir}/chunk${i}/grc37.vcf.gz
+        run_cmd "${BGZIP} -c ${workdir}/split.${i}.vcf > ${chunk}.tmp && mv ${chunk}.tmp ${chunk} && rm -f ${workdir}/split.${i}.vcf"
+    done
+}
+
+function score_chunk {
+    local chunkvcf=$1
+    local tsv=$2
+
+    if is_empty_vcf ${chunkvcf} ; then
+        if [[ ! -e "${tsv}" ]]; then
+            log "No variants to score. Writing an empty tsv..."
+            run_cmd "echo -n | ${BGZIP} -c > ${tsv}.tmp && mv ${tsv}.tmp ${tsv}"
+        fi
+        return 0;
+    fi
+
+    log "Entering run_cadd"
+    run_cadd ${chunkvcf} ${tsv} > /dev/null
+}
+
+function merge_chunk_tsvs {
+    local tsv=$1
+    shift
+    local -a chunk_tsvs=( "$@" )
+
+    if [[ -e "${tsv}" ]]; then
+        log "shortcutting merge_chunk_tsvs"
+        echo ${tsv}
+        return 0;
+    fi
+
+    local tmptsv=${tsv}.tmp
+
+    # every chunk is sorted, and they cover consecutive regions; the chunks
+    # without any sites to score are empty, without a header
+    local sorted_inputs=""
+    local header_tsv=""
+    for chunk_tsv in "${chunk_tsvs[@]}"; do
+        sorted_inputs+=" <(zcat ${chunk_tsv} | grep -v '^#')"
+        if [[ -z "${header_tsv}" && -n "$(zcat ${chunk_tsv} | head -c 1)" ]]; then
+            header_tsv=${chunk_tsv}
+        fi
+    done
+
+    local header="<(true)"
+    if [[ -n "${header_tsv}" ]]; then
+        header="<(zcat ${header_tsv} | grep '^#')"
+    fi
+
+    local cmd1="
+    cat ${header} \
+        <(LC_ALL=C sort -m -k1,1V -k2,2n ${sorted_inputs}) \
+    | ${BGZIP} -c \
+    > ${tmptsv} && mv ${tmptsv} ${tsv}
+    "
+    run_cmd "${cmd1}"
+    echo ${tsv}
+}
+
+function finish_chunks {
+    local b38_invcf=$1
+    local b38_outvcf=$2
+    local workdir=$3
+    local merge_script=$4
+    local integrate_script=$5
+    shift 5
+
+    if is_empty_vcf ${b38_invcf} ; then
+        log "No variants to process. Copying files over..."
+        copy_over_vcf ${b38_invcf} ${b38_outvcf} ;
+        return 0;
+    fi
+
+    local b38_invcf_no_samples=${workdir}/b38.nosamples.vcf.gz
+    local grc37_vcf_minus_unplaced_contigs=${workdir}/grc37.minus.unplaced.vcf.gz
+
+    log "Entering merge_chunk_tsvs"
+    local tsv=$(merge_chunk_tsvs ${workdir}/cadd-annotation.tsv.gz "$@")
+    log "Entering paste_cadd"
+    local b37_cadd_vcf=$(paste_cadd ${merge_script} ${grc37_vcf_minus_unplaced_contigs} ${tsv})
+    log "Entering integrate b37 cadd annotations back to b38"
+    local b38_cadd_vcf=$(integrate_b37_annotations_to_b38 ${integrate_script} ${b37_cadd_vcf} ${b38_invcf_no_samples} 'cadd')
+    log "Add samples on b38 cadd annotated vcf"
+    add_samples_on_b38_cadd_vcf ${b38_invcf} ${b38_cadd_vcf} ${b38_outvcf}
+}
+
 function main {
     local invcf=$1
     local outvcf=$2
@@ -367,9 +499,31 @@ function main {
     log 'All Done'
 }
 
-INVCF=$1
-OUTVCF=$2
-MERGE_SCRIPT=$3
-MIGRATE_B37_ANNOTATIONS_TO_B38_SCRIPT=$4
-
-main ${INVCF} ${OUTVCF} ${MERGE_SCRIPT} ${MIGRATE_B37_ANNOTATIONS_TO_B38_SCRIPT};
+case "${1:-}" in
+    --prepare-chunks)
+        # <b38 vcf> <work dir> <number of chunks> <python>
+        shift
+        prepare_chunks "$@"
+        log 'All Done'
+        ;;
+    --score-chunk)
+        # <chunk vcf> <cadd tsv>
+        shift
+        score_chunk "$@"
+        log 'All Done'
+        ;;
+    --finish-chunks)
+        # <b38 vcf> <b38 output vcf> <work dir> <merge script> <integrate script> <chunk tsvs, in order>
+        shift
+        finish_chunks "$@"
+        log 'All Done'
+        ;;
+    *)
+        INVCF=$1
+        OUTVCF=$2
+        MERGE_SCRIPT=$3
+        MIGRATE_B37_ANNOTATIONS_TO_B38_SCRIPT=$4
+
+        main ${INVCF} ${OUTVCF} ${MERGE_SCRIPT} ${MIGRATE_B37_ANNOTATIONS_TO_B38_SCRIPT};
+        ;;
+esac
@@ -1,5 +1,7 @@
 #!/bin/bash
 
+source $(dirname ${BASH_SOURCE[0]})/../scratch.sh
+
 # modified from @aregier
 #  ~aregier/scratch/dlarson-gatk-scripts/run_decompose.sh
 
@@ -17,6 +19,6 @@ then
 fi
 
 REF=/gscmnt/gc2802/halllab/ccdg_resources/genomes/human/GRCh38DH/all_sequences.fa
-TMPVCF=$OUTVCF.temp
+TMPVCF=$(stage_tmp_path $OUTVCF)
 ${TABIX} --print-header $INVCF $CHROM | sed 's/ID=AD,Number=./ID=AD,Number=R/' | sed 's/reads with MQ=255 or/reads with MQ equals 255 or/' | ${VT} decompose -s - | ${VT} normalize -r $REF - | ${VT} uniq - | bgzip -c > $TMPVCF
-${TABIX} -p vcf -f $TMPVCF && mv $TMPVCF.tbi $OUTVCF.tbi && mv $TMPVCF $OUTVCF
+${TABIX} -p vcf -f $TMPVCF && stage_out $TMPVCF.tbi $OUTVCF.tbi && stage_out $TMPVCF $OUTVCF
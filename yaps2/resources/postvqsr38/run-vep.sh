@@ -6,6 +6,9 @@
 
 set -eo pipefail
 
+source $(dirname ${BASH_SOURCE[0]})/../scratch.sh
+source $(dirname ${BASH_SOURCE[0]})/vcf-samples.sh
+
 # http://stackoverflow.com/questions/9893667/is-there-a-way-to-write-a-bash-function-which-aborts-the-whole-execution-no-mat
 trap "exit 1" TERM
 export TOP_PID=$$
@@ -95,8 +98,8 @@ function tabix_and_finalize_vcf {
 	local finalvcf=$2
     local cmd="
     ${TABIX} -p vcf -f ${tmpvcf} \
-        && mv ${tmpvcf}.tbi ${finalvcf}.tbi \
-        && mv ${tmpvcf} ${finalvcf}
+        && stage_out ${tmpvcf}.tbi ${finalvcf}.tbi \
+        && stage_out ${tmpvcf} ${finalvcf}
     "
     run_cmd "${cmd}"
 }
@@ -116,7 +119,7 @@ function run_vep {
 
     # see BIO-2229 for vep parameter details
     local vep=/home/vep/src/ensembl-vep/vep
-    local vep_cache=/gscmnt/gc2719/halllab/genomes/human/GRCh38/.vep
+    local vep_cache=${YAPS2_REF_VEP_CACHE:-/gscmnt/gc2719/halllab/genomes/human/GRCh38/.vep}
     local vep_fields="Consequence,Codons,Amino_acids,Gene,SYMBOL,Feature,EXON,PolyPhen,SIFT,Protein_position,BIOTYPE"
 
     # ensure that the correct perl and libraries are being used
@@ -140,7 +143,7 @@ function run_vep {
         | perl ${vep} \
             --force_overwrite \
             --offline \
-            --fork 12 \
+            --fork ${VEP_FORKS:-12} \
             --cache \
             --dir_cache ${vep_cache} \
             --cache_version 88 \
@@ -176,7 +179,14 @@ function add_samples_to_vep_vcf {
         return 0;
     fi
 
-    local tmpvcf=${outvcf}.tmp
+    local tmpvcf=$(stage_tmp_path ${outvcf})
+
+    if sites_only; then
+        log "sites-only input -- not adding samples"
+        run_cmd "cp ${vepvcf} ${tmpvcf}"
+        tabix_and_finalize_vcf ${tmpvcf} ${outvcf}
+        return 0;
+    fi
 
     cmd="vcf_add_samples ${vepvcf} ${invcf} | ${BGZIP} -c >${tmpvcf}"
     run_cmd "${cmd}"
@@ -191,8 +201,7 @@ function main {
         log "No variants to process. Copying files over..."
         copy_over_vcf ${invcf} ${outvcf} ;
     else
-        local outdir=$(dirname ${outvcf})/scratch
-        mkdir -p ${outdir}
+        local outdir=$(stage_scratch_dir $(dirname ${outvcf})/scratch)
         log "Entering run_vep"
         local vepvcf=$(run_vep ${invcf} ${outdir})
         log "Entering add_samples_to_vep_vcf"
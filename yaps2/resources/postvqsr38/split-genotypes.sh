@@ -0,0 +1,45 @@
+#!/bin/bash
+
+set -ueo pipefail
+
+source $(dirname ${BASH_SOURCE[0]})/../scratch.sh
+
+BCFTOOLS=/gscmnt/gc2802/halllab/idas/software/local/bin/bcftools1.4
+BGZIP=/gscmnt/gc2802/halllab/idas/software/local/bin/bgzip
+TABIX=/gscmnt/gc2802/halllab/idas/software/local/bin/tabix
+
+INVCF=$1
+OUTVCF=$2
+OUTGENOTYPES=$3
+
+function log {
+    local timestamp=$(date +"%Y-%m-%d %T")
+    echo "---> [ ${timestamp} ] $@" >&2
+}
+
+# the '#CHROM POS REF ALT FORMAT <samples>' columns of every record, in the
+# order of the sites VCF (see yaps2/annotation.py:attach_genotypes)
+function split_genotypes {
+    if [ -e $OUTVCF ] && [ -e $OUTGENOTYPES ]
+    then
+        exit 0
+    fi
+
+    TMPVCF=$(stage_tmp_path $OUTVCF)
+    TMPGENOTYPES=$(stage_tmp_path $OUTGENOTYPES)
+    set -o xtrace
+    zcat $INVCF | grep -v '^##' | cut -f 1,2,4,5,9- | ${BGZIP} -c > $TMPGENOTYPES
+    ${BCFTOOLS} view --drop-genotypes $INVCF --output-type z --output-file $TMPVCF \
+        && ${TABIX} -p vcf -f $TMPVCF \
+        && stage_out $TMPGENOTYPES $OUTGENOTYPES \
+        && stage_out $TMPVCF.tbi $OUTVCF.tbi \
+        && stage_out $TMPVCF $OUTVCF
+    set +o xtrace
+}
+
+function main {
+    log "Splitting ${INVCF} into its sites and genotypes"
+    split_genotypes ;
+}
+
+main ;
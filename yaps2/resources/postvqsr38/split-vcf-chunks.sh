@@ -0,0 +1,49 @@
+#!/bin/bash
+
+set -ueo pipefail
+
+source $(dirname ${BASH_SOURCE[0]})/../scratch.sh
+
+BGZIP=/gscmnt/gc2802/halllab/idas/software/local/bin/bgzip
+TABIX=/gscmnt/gc2802/halllab/idas/software/local/bin/tabix
+
+PYTHON=$1
+INVCF=$2
+OUTDIR=$3
+CHUNKS=$4
+
+function log {
+    local timestamp=$(date +"%Y-%m-%d %T")
+    echo "---> [ ${timestamp} ] $@" >&2
+}
+
+# writes ${OUTDIR}/chunk.1.vcf.gz ... ${OUTDIR}/chunk.${CHUNKS}.vcf.gz, the
+# last one staged last
+function split_vcf {
+    if [ -e ${OUTDIR}/chunk.${CHUNKS}.vcf.gz ]
+    then
+        exit 0
+    fi
+
+    mkdir -p ${OUTDIR}
+    local scratch=$(stage_scratch_dir ${OUTDIR}/scratch)
+    set -o xtrace
+    ${PYTHON} -m yaps2.annotation split --vcf ${INVCF} --chunks ${CHUNKS} --out-prefix ${scratch}/chunk
+    for ((i = 1; i <= ${CHUNKS}; i++)); do
+        local chunk=${OUTDIR}/chunk.${i}.vcf.gz
+        local tmpvcf=$(stage_tmp_path ${chunk})
+        ${BGZIP} -c ${scratch}/chunk.${i}.vcf > ${tmpvcf} \
+            && ${TABIX} -p vcf -f ${tmpvcf} \
+            && stage_out ${tmpvcf}.tbi ${chunk}.tbi \
+            && stage_out ${tmpvcf} ${chunk}
+        rm -f ${scratch}/chunk.${i}.vcf
+    done
+    set +o xtrace
+}
+
+function main {
+    log "Splitting ${INVCF} into ${CHUNKS} chunks"
+    split_vcf ;
+}
+
+main ;
@@ -0,0 +1,11 @@
+# Sourced by the annotation scripts.  The sites-only VCFs of the parallel
+# annotation DAG, the deferred genotypes and the selected FILTERs (see
+# yaps2/pipelines/postvqsr38.py) are annotated as they are, without
+# re-attaching any samples.  The pipeline says so with YAPS2_SITES_ONLY=1;
+# the input itself is not probed, so that a failing probe cannot pass for a
+# sites-only input.
+
+# succeeds when the pipeline marked the input as sites-only
+function sites_only {
+    [[ "${YAPS2_SITES_ONLY:-0}" == "1" ]]
+}
@@ -0,0 +1,34 @@
+# Sourced by the stage scripts.  When the yaps2 telemetry runner is started
+# with --scratch, $YAPS2_SCRATCH is a node-local directory for the stage's
+# temporaries and only the final outputs are copied to the workspace (see
+# yaps2/scratch.py).  Without it, the scripts behave as they always have.
+
+# the directory for a stage's temporaries: $YAPS2_SCRATCH, else the default
+function stage_scratch_dir {
+    local default=$1
+    local dir=${YAPS2_SCRATCH:-${default}}
+    mkdir -p ${dir}
+    echo ${dir}
+}
+
+# where to write the final output of a stage before it is moved into place
+function stage_tmp_path {
+    local final=$1
+    if [[ -n "${YAPS2_SCRATCH:-}" ]]; then
+        echo ${YAPS2_SCRATCH}/$(basename ${final}).tmp
+    else
+        echo ${final}.tmp
+    fi
+}
+
+# moves a file into place; across filesystems, it is copied next to its
+# destination first, so the destination never holds a partial file
+function stage_out {
+    local src=$1
+    local dest=$2
+    if [[ $(stat -c %d ${src}) == $(stat -c %d $(dirname ${dest})) ]]; then
+        mv ${src} ${dest}
+    else
+        cp ${src} ${dest}.staging && mv ${dest}.staging ${dest} && rm -f ${src}
+    fi
+}
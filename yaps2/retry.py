@@ -0,0 +1,174 @@
+from __future__ import print_function, division
+
+import os
+
+from yaps2.lsf import memory_mb, set_memory, task_lsf_params, set_task_lsf_params
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+# markers left in the LSF job report (written to the task's stdout) or in the
+# logs of the tools themselves when a job ran out of memory
+MEMORY_FAILURE_MARKERS = (
+    'TERM_MEMLIMIT',
+    'java.lang.OutOfMemoryError',
+    'std::bad_alloc',
+    'MemoryError',
+    'Cannot allocate memory',
+    'Out of memory',
+)
+
+# suffixes of the partially written outputs the resource scripts rename into
+# place once a step has finished
+PARTIAL_OUTPUT_SUFFIXES = ('.tmp', '.temp', '.tmp.tbi', '.temp.tbi', '.tmp.csi', '.temp.csi')
+
+def _tail(path, size=65536):
+    if not os.path.isfile(path):
+        return ''
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - size, 0))
+        return f.read().decode('utf-8', 'replace')
+
+def is_memory_failure(log_paths):
+    for path in log_paths:
+        text = _tail(path)
+        if any(marker in text for marker in MEMORY_FAILURE_MARKERS):
+            return True
+    return False
+
+def _paths(value):
+    values = value if isinstance(value, (list, tuple)) else [value]
+    return [ v for v in values if isinstance(v, string_types) ]
+
+def partial_outputs(output_map):
+    """Yields the temporary files next to a task's outputs, including the
+    'scratch' sub-directory the resource scripts use."""
+    seen = set()
+    for value in output_map.values():
+        for path in _paths(value):
+            outdir = os.path.dirname(os.path.abspath(path))
+            for d in (outdir, os.path.join(outdir, 'scratch')):
+                if d in seen or not os.path.isdir(d):
+                    continue
+                seen.add(d)
+                for name in sorted(os.listdir(d)):
+                    candidate = os.path.join(d, name)
+                    if os.path.isfile(candidate) and name.endswith(PARTIAL_OUTPUT_SUFFIXES):
+                        yield candidate
+
+def task_log_paths(task):
+    paths = [ task.output_stdout_path, task.output_stderr_path ]
+    for key, value in task.output_map.items():
+        if 'log' in key:
+            paths.extend(_paths(value))
+    return paths
+
+def clean_partial_outputs(output_map):
+    removed = []
+    for path in partial_outputs(output_map):
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+class OOMRetryPolicy(object):
+    """Resubmits tasks killed for exceeding their memory limit.
+
+    Each retry requests the original memory multiplied by the next factor in
+    ``escalation``, capped at ``max_memory_mb``.  Failures that are not memory
+    related are left to fail as before.
+    """
+
+    def __init__(self, escalation=(1.5, 2.0), max_memory_mb=250000):
+        self.escalation = tuple(escalation)
+        self.max_memory_mb = max_memory_mb
+        self.base_memory = {}
+        self.retries = {}
+
+    def install(self):
+        from cosmos.api import signal_task_status_change
+        signal_task_status_change.connect(self.task_status_changed, weak=False)
+
+    def next_memory_mb(self, key, base_memory_mb, current_memory_mb):
+        retries = self.retries.get(key, 0)
+        if retries >= len(self.escalation):
+            return None
+        mem_mb = min(int(base_memory_mb * self.escalation[retries]), self.max_memory_mb)
+        if mem_mb <= current_memory_mb:
+            return None
+        return mem_mb
+
+    def task_status_changed(self, task):
+        from cosmos.api import TaskStatus
+
+        if task.status != TaskStatus.failed or not task.must_succeed:
+            return
+        if not is_memory_failure(task_log_paths(task)):
+            return
+
+        key = (task.stage.name, task.uid)
+        lsf_params = task_lsf_params(task)
+        current_memory_mb = memory_mb(lsf_params)
+        base_memory_mb = self.base_memory.setdefault(key, current_memory_mb)
+
+        mem_mb = self.next_memory_mb(key, base_memory_mb, current_memory_mb)
+        if mem_mb is None:
+            task.log.warn('%s ran out of memory, and will not be retried with more memory' % task)
+            return
+        self.retries[key] = self.retries.get(key, 0) + 1
+
+        for path in clean_partial_outputs(task.output_map):
+            task.log.info('%s removed partial output %s' % (task, path))
+
+        lsf_params = set_memory(lsf_params, mem_mb)
+        set_task_lsf_params(task, lsf_params)
+        task.log.warn('%s ran out of memory, retrying with %sMB' % (task, mem_mb))
+
+        # cosmos resubmits any task that goes back to no_attempt
+        task.attempt += 1
+        task.status = TaskStatus.no_attempt
+
+class ChunkRetryPolicy(object):
+    """Resubmits the failed tasks of scattered stages (e.g. one chunk of a
+    chromosome) on their own, up to ``max_retries`` times each, so that a
+    transient failure does not fail the whole chromosome.
+
+    ``stages`` is a collection of the stage names to retry.  Tasks that ran
+    out of memory are left to the OOMRetryPolicy, which is installed next to
+    this one: the two receive the same status change in no given order, and
+    only one of them may resubmit the task.
+    """
+
+    def __init__(self, stages, max_retries=2):
+        self.stages = stages
+        self.max_retries = max_retries
+        self.retries = {}
+
+    def install(self):
+        from cosmos.api import signal_task_status_change
+        signal_task_status_change.connect(self.task_status_changed, weak=False)
+
+    def should_retry(self, key):
+        return key[0] in self.stages and self.retries.get(key, 0) < self.max_retries
+
+    def task_status_changed(self, task):
+        from cosmos.api import TaskStatus
+
+        if task.status != TaskStatus.failed or not task.must_succeed:
+            return
+
+        key = (task.stage.name, task.uid)
+        if not self.should_retry(key):
+            return
+        if is_memory_failure(task_log_paths(task)):
+            return
+        self.retries[key] = self.retries.get(key, 0) + 1
+
+        for path in clean_partial_outputs(task.output_map):
+            task.log.info('%s removed partial output %s' % (task, path))
+        task.log.warn('%s failed, retrying it (retry %s of %s)' % (task, self.retries[key], self.max_retries))
+
+        task.attempt += 1
+        task.status = TaskStatus.no_attempt
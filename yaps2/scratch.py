@@ -0,0 +1,62 @@
+from __future__ import print_function, division
+
+import os, re, sys, shutil, tempfile, datetime
+
+# the per-task scratch directory given to the stage scripts
+ENV_SCRATCH = 'YAPS2_SCRATCH'
+# where the scratch directories are made, overriding $TMPDIR
+ENV_SCRATCH_ROOT = 'YAPS2_SCRATCH_ROOT'
+
+def log(msg):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print('[-- scratch {} --] {}'.format(timestamp, msg), file=sys.stderr)
+
+def scratch_root(environ=None):
+    """$YAPS2_SCRATCH_ROOT, else $TMPDIR (a job specific local directory
+    under LSF), else the system temporary directory."""
+    environ = os.environ if environ is None else environ
+    for name in (ENV_SCRATCH_ROOT, 'TMPDIR'):
+        if environ.get(name):
+            return environ[name]
+    return tempfile.gettempdir()
+
+def safe_name(name):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', str(name))
+
+class TaskScratch(object):
+    """A node-local scratch directory for the temporaries of a task.
+
+    It is removed when the task finishes.  With a keep_dir, it is first
+    copied to keep_dir/<stage>/<uid> for debugging.
+    """
+
+    def __init__(self, stage, uid, keep_dir=None, root=None):
+        self.stage = stage
+        self.uid = uid
+        self.keep_dir = keep_dir
+        self.root = root or scratch_root()
+        self.path = None
+
+    def __enter__(self):
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        prefix = 'yaps2.{}.{}.'.format(safe_name(self.stage), safe_name(self.uid))
+        self.path = tempfile.mkdtemp(prefix=prefix, dir=self.root)
+        log('using {}'.format(self.path))
+        return self
+
+    def environment(self):
+        return { ENV_SCRATCH : self.path }
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.keep_dir is not None:
+            dest = os.path.join(self.keep_dir, safe_name(self.stage), safe_name(self.uid))
+            try:
+                if os.path.exists(dest):
+                    shutil.rmtree(dest)
+                shutil.copytree(self.path, dest, symlinks=True)
+                log('kept the intermediates in {}'.format(dest))
+            except (OSError, shutil.Error) as err:
+                log('could not keep the intermediates in {}: {}'.format(dest, err))
+        shutil.rmtree(self.path, ignore_errors=True)
+        return False
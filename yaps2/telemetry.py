@@ -0,0 +1,293 @@
+from __future__ import print_function, division
+
+import os, sys, time, socket, sqlite3, signal, subprocess, resource, datetime
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+import click
+
+from yaps2.scratch import TaskScratch
+from yaps2.refcache import checkout_bundles
+
+TABLE = 'task_telemetry'
+
+COLUMNS = (
+    ('workflow', 'TEXT'),
+    ('stage', 'TEXT'),
+    ('uid', 'TEXT'),
+    ('attempt', 'INTEGER'),
+    ('host', 'TEXT'),
+    ('lsf_job_id', 'TEXT'),
+    ('started_on', 'TEXT'),
+    ('finished_on', 'TEXT'),
+    ('exit_status', 'INTEGER'),
+    ('wall_time', 'REAL'),
+    ('user_time', 'REAL'),
+    ('system_time', 'REAL'),
+    ('cpu_time', 'REAL'),
+    ('max_rss_kb', 'INTEGER'),
+    ('read_bytes', 'INTEGER'),
+    ('write_bytes', 'INTEGER'),
+    ('input_bytes', 'INTEGER'),
+)
+
+def log(msg):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print('[-- telemetry {} --] {}'.format(timestamp, msg), file=sys.stderr)
+
+def connect(db, timeout=60):
+    conn = sqlite3.connect(db, timeout=timeout)
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS {} (id INTEGER PRIMARY KEY AUTOINCREMENT, {})'.format(
+            TABLE,
+            ', '.join(' '.join(c) for c in COLUMNS)
+        )
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS {0}_stage_uid ON {0} (stage, uid)'.format(TABLE)
+    )
+    return conn
+
+def record(db, row, retries=5):
+    names = [ c[0] for c in COLUMNS ]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        TABLE,
+        ', '.join(names),
+        ', '.join('?' * len(names))
+    )
+    values = [ row.get(n) for n in names ]
+
+    # many tasks may finish at once, and the cosmos process also holds the
+    # database, so back off and retry when sqlite reports a lock
+    for attempt in range(1, retries + 1):
+        try:
+            conn = connect(db)
+            with conn:
+                conn.execute(sql, values)
+            conn.close()
+            return True
+        except sqlite3.OperationalError as err:
+            log('attempt {} to record telemetry failed: {}'.format(attempt, err))
+            time.sleep(2 ** attempt)
+    return False
+
+def fetch(db, stage=None, uid=None, successful_only=True):
+    if not os.path.isfile(db):
+        return []
+
+    clauses, values = [], []
+    if stage is not None:
+        clauses.append('stage = ?')
+        values.append(stage)
+    if uid is not None:
+        clauses.append('uid = ?')
+        values.append(uid)
+    if successful_only:
+        clauses.append('exit_status = 0')
+
+    sql = 'SELECT {} FROM {}'.format(', '.join(c[0] for c in COLUMNS), TABLE)
+    if clauses:
+        sql = ' '.join([sql, 'WHERE', ' AND '.join(clauses)])
+
+    conn = connect(db)
+    try:
+        rows = conn.execute(sql, values).fetchall()
+    finally:
+        conn.close()
+    return [ dict(zip([c[0] for c in COLUMNS], r)) for r in rows ]
+
+def input_size(input_map):
+    total = 0
+    for value in input_map.values():
+        paths = value if isinstance(value, (list, tuple)) else [value]
+        for p in paths:
+            if isinstance(p, string_types) and os.path.isfile(p):
+                total += os.path.getsize(p)
+    return total
+
+class ProcessTreeSampler(object):
+    """Tracks the resource usage of a process and all of its descendants.
+
+    Processes can exit between samples, so the last observed counters for
+    every pid are kept and summed when the totals are requested.
+    """
+
+    def __init__(self, pid):
+        import psutil
+        self.psutil = psutil
+        self.root = psutil.Process(pid)
+        self.max_rss = 0
+        self.io = {}
+
+    def sample(self):
+        try:
+            procs = [self.root] + self.root.children(recursive=True)
+        except self.psutil.Error:
+            return
+
+        rss = 0
+        for p in procs:
+            try:
+                rss += p.memory_info().rss
+                counters = p.io_counters()
+                self.io[p.pid] = (counters.read_bytes, counters.write_bytes)
+            except (self.psutil.Error, AttributeError, NotImplementedError):
+                continue
+        self.max_rss = max(self.max_rss, rss)
+
+    def io_totals(self):
+        read_bytes = sum(v[0] for v in self.io.values())
+        write_bytes = sum(v[1] for v in self.io.values())
+        return (read_bytes, write_bytes)
+
+def run_command(cmd, interval=5, env=None):
+    start_time = time.time()
+    started_on = datetime.datetime.now()
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    if env:
+        env = dict(os.environ, **env)
+    proc = subprocess.Popen(['/bin/bash', '-e', '-o', 'pipefail', '-c', cmd], env=env)
+    sampler = ProcessTreeSampler(proc.pid)
+
+    # let LSF (or a user) terminate the wrapped command along with the runner
+    def forward(signum, frame):
+        proc.send_signal(signum)
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGUSR2):
+        signal.signal(signum, forward)
+
+    delay = min(1, interval)
+    while proc.poll() is None:
+        sampler.sample()
+        time.sleep(delay)
+        # sample often at first to catch short lived commands
+        delay = min(delay * 2, interval)
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    user_time = usage.ru_utime - usage_before.ru_utime
+    system_time = usage.ru_stime - usage_before.ru_stime
+    read_bytes, write_bytes = sampler.io_totals()
+    exit_status = proc.returncode if proc.returncode >= 0 else 128 - proc.returncode
+
+    return {
+        'host': socket.gethostname(),
+        'lsf_job_id': os.environ.get('LSB_JOBID'),
+        'started_on': started_on.strftime("%Y-%m-%d %H:%M:%S"),
+        'finished_on': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'exit_status': exit_status,
+        'wall_time': time.time() - start_time,
+        'user_time': user_time,
+        'system_time': system_time,
+        'cpu_time': user_time + system_time,
+        # ru_maxrss is the peak of the largest single descendant (in KB on
+        # linux), the sampler sees the peak of the whole tree at once
+        'max_rss_kb': int(max(sampler.max_rss // 1024, usage.ru_maxrss)),
+        'read_bytes': read_bytes,
+        'write_bytes': write_bytes,
+    }
+
+def wrap_command(cmd, db, workflow, stage, uid, attempt, input_bytes,
+                 scratch=False, keep_intermediates=None, bundles=(), refcache_registry=None):
+    runner = [
+        sys.executable, '-m', 'yaps2.telemetry',
+        '--db', db,
+        '--workflow', workflow,
+        '--stage', stage,
+        '--uid', uid,
+        '--attempt', str(attempt),
+        '--input-bytes', str(input_bytes),
+    ]
+    if scratch:
+        runner.append('--scratch')
+        if keep_intermediates is not None:
+            runner.extend(['--keep-intermediates', keep_intermediates])
+    for name in bundles:
+        runner.extend(['--ref-bundle', name])
+    if bundles and refcache_registry is not None:
+        runner.extend(['--refcache-registry', refcache_registry])
+    return '{} {}\n'.format(' '.join(quote(str(a)) for a in runner), quote(cmd))
+
+def telemetry_cmd_wrapper(db, scratch=False, keep_intermediates=None,
+                          stage_bundles=None, refcache_registry=None):
+    """Returns a cosmos ``cmd_wrapper`` that runs every task command under the
+    telemetry runner, recording its resource usage into ``db``.
+
+    With ``scratch``, every command gets a node-local scratch directory (see
+    yaps2.scratch), copied to ``keep_intermediates`` when it is given.
+    ``stage_bundles`` maps a stage name to the reference data bundles its
+    commands read from the node-local cache (see yaps2.refcache).
+    """
+    import decorator
+    from cosmos.api import default_cmd_fxn_wrapper
+
+    def cmd_wrapper(task, stage_name, input_map, output_map):
+        def real_decorator(fxn, *args, **kwargs):
+            r = fxn(*args, **kwargs)
+            if r is None:
+                return None
+            return wrap_command(
+                r,
+                db,
+                task.workflow.name,
+                stage_name,
+                task.uid,
+                task.attempt,
+                input_size(input_map),
+                scratch,
+                keep_intermediates,
+                stage_bundles(stage_name) if stage_bundles else (),
+                refcache_registry,
+            )
+
+        default_wrapper = default_cmd_fxn_wrapper(task, stage_name, input_map, output_map)
+        return lambda fxn: default_wrapper(decorator.decorator(real_decorator)(fxn))
+
+    return cmd_wrapper
+
+@click.command()
+@click.option('--db', required=True, type=click.Path(), help='the sqlite job database')
+@click.option('--workflow', default=None, type=click.STRING, help='the workflow name')
+@click.option('--stage', required=True, type=click.STRING, help='the stage name of the task')
+@click.option('--uid', required=True, type=click.STRING, help='the uid of the task')
+@click.option('--attempt', default=1, type=click.INT, help='the attempt number of the task')
+@click.option('--input-bytes', default=0, type=click.INT, help='total size of the task inputs')
+@click.option('--interval', default=5, type=click.INT, help='seconds between samples')
+@click.option('--scratch/--no-scratch', default=False, help='run the command with a node-local $YAPS2_SCRATCH directory')
+@click.option('--keep-intermediates', default=None, type=click.Path(), help='copy the scratch directory under here afterwards')
+@click.option('--ref-bundle', 'bundles', multiple=True, type=click.STRING, help='a reference data bundle to read from the node-local cache')
+@click.option('--refcache-registry', default=None, type=click.Path(), help='the directory listing the hosts of the cached bundles')
+@click.argument('cmd', type=click.STRING)
+def main(db, workflow, stage, uid, attempt, input_bytes, interval, scratch, keep_intermediates,
+         bundles, refcache_registry, cmd):
+    (checkouts, env) = checkout_bundles(bundles, refcache_registry)
+    try:
+        if scratch:
+            with TaskScratch(stage, uid, keep_intermediates) as task_scratch:
+                env.update(task_scratch.environment())
+                stats = run_command(cmd, interval, env)
+        else:
+            stats = run_command(cmd, interval, env)
+    finally:
+        for checkout in checkouts:
+            checkout.release()
+    stats.update({
+        'workflow': workflow,
+        'stage': stage,
+        'uid': uid,
+        'attempt': attempt,
+        'input_bytes': input_bytes,
+    })
+    if not record(db, stats):
+        log('could not record telemetry for {}:{}'.format(stage, uid))
+    sys.exit(stats['exit_status'])
+
+if __name__ == '__main__':
+    main()
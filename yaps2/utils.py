@@ -1,4 +1,4 @@
-import json, re, os, gzip
+import json, re, os, gzip, struct
 
 def to_json(var):
     return json.dumps(var)
@@ -25,6 +25,37 @@ def empty_gzipped_vcf(path):
                 return False
     return True
 
+# the pseudo-bin of a tabix index holding the mapped/unmapped record counts
+TABIX_PSEUDO_BIN = 37450
+
+def tabix_record_count(vcf):
+    """The number of records of a bgzipped VCF, from the metadata of its .tbi
+    (None when there is no index, or it has no such metadata)."""
+    index = vcf + '.tbi'
+    if not os.path.isfile(index):
+        return None
+    with gzip.open(index, 'rb') as f:
+        data = f.read()
+    if data[:4] != b'TBI\x01':
+        return None
+    (n_ref,) = struct.unpack_from('<i', data, 4)
+    (l_nm,) = struct.unpack_from('<i', data, 32)
+    offset = 36 + l_nm
+    total = None
+    for _ in range(n_ref):
+        (n_bin,) = struct.unpack_from('<i', data, offset)
+        offset += 4
+        for _ in range(n_bin):
+            (bin_number, n_chunk) = struct.unpack_from('<Ii', data, offset)
+            offset += 8
+            if bin_number == TABIX_PSEUDO_BIN and n_chunk == 2:
+                (n_mapped, n_unmapped) = struct.unpack_from('<QQ', data, offset + 16)
+                total = (total or 0) + n_mapped
+            offset += 16 * n_chunk
+        (n_intv,) = struct.unpack_from('<i', data, offset)
+        offset += 4 + 8 * n_intv
+    return total
+
 def get_chrom_number(region):
     fmt_chrom = ''
     if ':' in region: